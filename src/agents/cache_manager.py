@@ -1,46 +1,277 @@
 import os
+import re
 import json
+import glob
+import time
 import hashlib
+import threading
+from collections import OrderedDict
 from termcolor import colored
 
-# 設定 Cache 存檔路徑
-CACHE_DIR = "/app/data/cache/council_responses"
-os.makedirs(CACHE_DIR, exist_ok=True)
+from src.tools.sqlite_store import SQLiteLRUStore
+from src.tools.near_dup import NearDuplicateIndex
+
+# 設定 Cache 存檔路徑 (單一 SQLite 檔，WAL 模式)
+COUNCIL_CACHE_PATH = os.getenv("COUNCIL_CACHE_PATH", "/app/data/cache/council_responses.sqlite3")
+COUNCIL_CACHE_TTL_DAYS = float(os.getenv("COUNCIL_CACHE_TTL_DAYS", "30"))          # 0 = 永不過期
+COUNCIL_CACHE_MAX_ENTRIES = int(os.getenv("COUNCIL_CACHE_MAX_ENTRIES", "50000"))
+COUNCIL_CACHE_MAX_MB = int(os.getenv("COUNCIL_CACHE_MAX_MB", "256"))
+COUNCIL_CACHE_MEMORY_ENTRIES = int(os.getenv("COUNCIL_CACHE_MEMORY_ENTRIES", "512"))  # Process 內 LRU
+
+# 舊版：每個 (Expert, Mode, JD) 一個 JSON 檔；第一次使用時自動搬進 SQLite
+CACHE_DIR = os.getenv("COUNCIL_CACHE_LEGACY_DIR", "/app/data/cache/council_responses")
+MIGRATED_MARKER = ".migrated_to_sqlite"
+
+# Skill 層級的 GAP_EFFORT Memo (跨 JD 共用，同一個 SQLite 檔)
+SKILL_GAP_MEMO_ENABLED = os.getenv("SKILL_GAP_MEMO_ENABLED", "True").lower() == "true"
+SKILL_GAP_MEMO_MAX_ENTRIES = int(os.getenv("SKILL_GAP_MEMO_MAX_ENTRIES", "20000"))
+
+_TOPIC_NOISE_RE = re.compile(r"[^\w+#.]+")  # 保留 C++ / C# / Node.js 這類符號
+
+
+def council_fingerprint(**parts) -> str:
+    """
+    把會影響專家輸出的東西 (persona / template / schema / model / context) 壓成短指紋。
+    任何一項變了，Cache Key 就跟著變，只有受影響的 entry 會重算。
+    """
+    material = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha1(material.encode('utf-8')).hexdigest()[:12]
+
+
+def normalize_skill_topic(text) -> str:
+    """'PyTorch ', 'pytorch', 'PyTorch.' → 'pytorch' (Memo Key / 比對模型回傳的 topic 用)"""
+    return " ".join(_TOPIC_NOISE_RE.sub(" ", str(text or "").lower()).split()).strip(".")
+
 
 class CouncilCache:
-    def __init__(self):
-        self.cache_dir = CACHE_DIR
+    """
+    Key = ExpertID + Mode + Hash(JD) [+ Fingerprint]
+    (沒有 fingerprint 時與舊版檔名相同，例如 E2_SKILL_7a8b9c...)
+    兩層：Process 內 LRU (OrderedDict) → SQLite (TTL + 容量上限 LRU 淘汰)
+    另外維護一個 Near-Duplicate JD Index (MinHash LSH)，讓重新張貼的 JD 可以沿用舊結果。
+    """
+
+    def __init__(self, db_path=COUNCIL_CACHE_PATH, ttl_days=COUNCIL_CACHE_TTL_DAYS,
+                 max_entries=COUNCIL_CACHE_MAX_ENTRIES, max_mb=COUNCIL_CACHE_MAX_MB,
+                 memory_entries=COUNCIL_CACHE_MEMORY_ENTRIES, legacy_dir=CACHE_DIR):
+        self.ttl = ttl_days * 86400 if ttl_days else None
+        self.store = SQLiteLRUStore(db_path, table="council_responses", max_entries=max_entries,
+                                    max_bytes=max_mb * 1024 * 1024, ttl=self.ttl)
+        self.near_dup = NearDuplicateIndex(db_path, max_entries=max_entries)
+        self.memory_entries = memory_entries
+        self.legacy_dir = legacy_dir
+        self._memory = OrderedDict()  # key -> (data, created_at)
+        self._lock = threading.Lock()
+        self._migrate_lock = threading.Lock()
+        self._migrated = False
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "near_dup_hits": 0, "misses": 0, "saves": 0}
 
     def _get_hash(self, text):
         """產生內容的唯一指紋 (MD5)"""
         return hashlib.md5(text.encode('utf-8')).hexdigest()
 
-    def _get_cache_path(self, jd_text, expert_id, mode):
+    def _get_key(self, jd_text, expert_id, mode, fingerprint=None, jd_hash=None):
         """
-        Cache Key = Hash(JD) + ExpertID + Mode
-        檔名範例: E2_SKILL_7a8b9c...json
+        Cache Key = Hash(JD) + ExpertID + Mode (+ council_fingerprint)
+        範例: E2_SKILL_7a8b9c..._1f2e3d4c5b6a
+        jd_hash: 直接指定 JD 指紋 (Near-Duplicate 沿用另一份 JD 的結果時使用)
         """
-        jd_hash = self._get_hash(jd_text)
-        filename = f"{expert_id}_{mode}_{jd_hash}.json"
-        return os.path.join(self.cache_dir, filename)
+        key = f"{expert_id}_{mode}_{jd_hash or self._get_hash(jd_text)}"
+        return f"{key}_{fingerprint}" if fingerprint else key
+
+    # --- Legacy JSON Migration ---
+    def _migrate_legacy(self):
+        """把舊版的 JSON 檔一次搬進 SQLite (保留原檔，只留下標記避免重複搬)"""
+        if self._migrated:
+            return
+        with self._migrate_lock:
+            if not self._migrated:
+                self._import_legacy_files()
+                self._migrated = True
+
+    def _import_legacy_files(self):
+        if not self.legacy_dir or not os.path.isdir(self.legacy_dir):
+            return
+        if os.path.exists(os.path.join(self.legacy_dir, MIGRATED_MARKER)):
+            return
 
-    def get(self, jd_text, expert_id, mode):
-        """嘗試從記憶讀取"""
-        path = self._get_cache_path(jd_text, expert_id, mode)
-        if os.path.exists(path):
+        moved, batch = 0, []
+        # 用檔案修改時間當 created_at，TTL 才會從原本的時間起算
+        for path in glob.glob(os.path.join(self.legacy_dir, "*.json")):
             try:
                 with open(path, 'r', encoding='utf-8') as f:
                     data = json.load(f)
-                return data
-            except:
-                return None # 檔案壞掉就當沒看到
-        return None
+            except Exception:
+                continue  # 檔案壞掉就當沒看到
+            key = os.path.splitext(os.path.basename(path))[0]
+            batch.append((key, data, os.path.getmtime(path)))
+            if len(batch) >= 500:
+                self.store.set_many(batch)
+                moved, batch = moved + len(batch), []
+        self.store.set_many(batch)
+        moved += len(batch)
+
+        try:
+            with open(os.path.join(self.legacy_dir, MIGRATED_MARKER), 'w') as f:
+                f.write(f"{moved} entries migrated to {self.store.db_path}\n")
+        except OSError:
+            pass
+        if moved:
+            print(colored(f"  📦 CouncilCache: migrated {moved} legacy JSON entries → {self.store.db_path}", "cyan"))
+
+    # --- In-Process LRU ---
+    def _remember(self, key, data, created_at):
+        with self._lock:
+            self._memory[key] = (data, created_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+
+    def _recall(self, key):
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if self.ttl and entry[1] + self.ttl < time.time():
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return entry[0]
+
+    # --- Public API (與舊版相同) ---
+    def _lookup(self, key):
+        data = self._recall(key)
+        if data is not None:
+            return data, "memory_hits"
+        entry = self.store.get_entry(key)
+        if entry is None:
+            return None, None
+        self._remember(key, *entry)
+        return entry[0], "disk_hits"
+
+    def get(self, jd_text, expert_id, mode, fingerprint=None, near_dup_hash=None, on_near_dup=None):
+        """
+        嘗試從記憶讀取。
+        near_dup_hash：find_near_duplicate() 找到的相似 JD；這份 JD 自己沒有結果時改用它的
+        on_near_dup(expert_id, mode)：真的回傳了相似 JD 的結果時呼叫 (呼叫端用來記錄在 Dossier)
+        """
+        self._migrate_legacy()
+        data, layer = self._lookup(self._get_key(jd_text, expert_id, mode, fingerprint))
+        if data is None and near_dup_hash:
+            data, layer = self._lookup(self._get_key(jd_text, expert_id, mode, fingerprint, jd_hash=near_dup_hash))
+            layer = "near_dup_hits" if data is not None else None
+            if data is not None and on_near_dup:
+                on_near_dup(expert_id, mode)
+        self._count(layer or "misses")
+        return data
+
+    def find_near_duplicate(self, jd_text):
+        """找內容幾乎相同的另一份 JD (重新張貼)：回傳 {"jd_hash", "similarity"} 或 None"""
+        if not jd_text:
+            return None
+        return self.near_dup.query(jd_text, doc_id=self._get_hash(jd_text))
+
+    def save(self, jd_text, expert_id, mode, response_data, fingerprint=None):
+        """存入記憶 (帶 error 的 dict 不存，避免下次直接命中失敗結果)"""
+        if isinstance(response_data, dict) and response_data.get("error"):
+            return
+        self._migrate_legacy()
+        key = self._get_key(jd_text, expert_id, mode, fingerprint)
+        now = time.time()
+        self.store.set(key, response_data, created_at=now)
+        self._remember(key, response_data, now)
+        self.near_dup.add(jd_text, doc_id=self._get_hash(jd_text))
+        self._count("saves")
+
+    def report(self) -> dict:
+        """命中率統計 (含 SQLite 目前的筆數 / 大小)"""
+        hits = self.stats["memory_hits"] + self.stats["disk_hits"] + self.stats["near_dup_hits"]
+        lookups = hits + self.stats["misses"]
+        return {
+            **self.stats,
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            **self.store.stats(),
+        }
+
+
+class SkillGapMemo:
+    """
+    Skill 層級的 GAP_EFFORT 判斷：同一位專家 + 同一個技能 (正規化) + 同樣的 Hidden Bar + 同一份履歷/Profile
+    → 證據與 Effort 判斷不會因為 JD 不同而改變，跨 JD 共用。
+    Key = ExpertID + Topic + Hash(Hidden Bar + fingerprint)；fingerprint 帶 Prompt / Schema / Model / 履歷指紋。
+    """
+
+    def __init__(self, db_path=COUNCIL_CACHE_PATH, ttl_days=COUNCIL_CACHE_TTL_DAYS,
+                 max_entries=SKILL_GAP_MEMO_MAX_ENTRIES, enabled=SKILL_GAP_MEMO_ENABLED):
+        self.enabled = enabled
+        self.store = SQLiteLRUStore(db_path, table="skill_gap_memo", max_entries=max_entries,
+                                    ttl=ttl_days * 86400 if ttl_days else None)
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "saves": 0}
+
+    def _get_key(self, expert_id, skill, fingerprint):
+        bar = normalize_skill_topic(skill.get("analysis", {}).get("hidden_bar", ""))
+        return f"{expert_id}_{normalize_skill_topic(skill.get('topic'))}_{council_fingerprint(bar=bar, fingerprint=fingerprint)}"
+
+    def _count(self, stat, n=1):
+        with self._lock:
+            self.stats[stat] += n
+
+    def split(self, expert_id, skills, fingerprint):
+        """
+        回傳 (cached, unseen)：
+        cached = {skill index: GapAnalysisItem dict}，unseen = 還沒分析過、要送給模型的技能
+        """
+        if not self.enabled:
+            return {}, list(skills)
+        cached, unseen = {}, []
+        for i, skill in enumerate(skills):
+            item = self.store.get(self._get_key(expert_id, skill, fingerprint))
+            if item is not None:
+                cached[i] = dict(item, topic=skill.get("topic", item.get("topic")))  # topic 對回這份 JD 的寫法
+            else:
+                unseen.append(skill)
+        self._count("hits", len(cached))
+        self._count("misses", len(unseen))
+        return cached, unseen
+
+    def merge(self, expert_id, skills, cached, new_items, fingerprint):
+        """
+        把模型新分析的 items 依 topic 對回技能並存進 Memo，再與 cached 合併成原本的技能順序。
+        對不到技能的 item 不進 Memo，但仍保留在報告最後面。
+        """
+        by_topic = {}
+        for item in new_items:
+            by_topic.setdefault(normalize_skill_topic(item.get("topic")), item)
+
+        merged, used, to_save = [], set(), []
+        for i, skill in enumerate(skills):
+            topic = normalize_skill_topic(skill.get("topic"))
+            if i in cached:
+                merged.append(cached[i])
+                used.add(topic)
+                continue
+            item = by_topic.get(topic)
+            if item is None or topic in used:
+                continue
+            used.add(topic)
+            merged.append(item)
+            to_save.append((self._get_key(expert_id, skill, fingerprint), item))
+        merged.extend(item for item in new_items if normalize_skill_topic(item.get("topic")) not in used)
+
+        if self.enabled and to_save:
+            self.store.set_many(to_save)
+            self._count("saves", len(to_save))
+        return merged
 
-    def save(self, jd_text, expert_id, mode, response_data):
-        """存入記憶"""
-        path = self._get_cache_path(jd_text, expert_id, mode)
-        with open(path, 'w', encoding='utf-8') as f:
-            json.dump(response_data, f, ensure_ascii=False, indent=2)
+    def report(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return {**self.stats, "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else 0.0}
 
 # 實例化一個全域物件方便匯入
-council_memory = CouncilCache()
\ No newline at end of file
+council_memory = CouncilCache()
+skill_gap_memo = SkillGapMemo()
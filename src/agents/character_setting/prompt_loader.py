@@ -1,6 +1,8 @@
 import json
 import os
 import sys
+import hashlib
+import functools
 from jinja2 import Environment, FileSystemLoader
 
 # ------------------------------------------------------------------
@@ -13,6 +15,37 @@ sys.path.append(project_root)
 
 from schemas_definitions import SKILL_SCHEMA, GAP_EFFORT_SCHEMA, ADVISOR_SCHEMA, EDITOR_SCHEMA
 
+PERSONAS_PATH = os.path.join(current_dir, "personas.json")
+
+# Mode → (注入的變數名稱, Schema 字串)
+MODE_SCHEMAS = {
+    "SKILL": ("skill_schema", SKILL_SCHEMA),
+    "GAP_EFFORT": ("gap_effort_schema", GAP_EFFORT_SCHEMA),
+    "ADVISOR": ("advisor_schema", ADVISOR_SCHEMA),
+}
+
+
+# ------------------------------------------------------------------
+# Shared Persona Registry：personas.json 每個 Process 只讀一次 (PromptFactory / TriageAgent 共用)
+# ------------------------------------------------------------------
+def load_personas(config_path: str = PERSONAS_PATH) -> dict:
+    """回傳共用的 dict，呼叫端請不要修改內容"""
+    return _read_personas(os.path.abspath(config_path))
+
+
+@functools.lru_cache(maxsize=None)
+def _read_personas(config_path: str) -> dict:
+    if not os.path.exists(config_path):
+        raise FileNotFoundError(f"Config file not found: {config_path}")
+    with open(config_path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+@functools.lru_cache(maxsize=None)
+def _get_environment(template_dir: str) -> Environment:
+    """同一個模板目錄共用一個 Environment (auto_reload=False：模板只編譯一次，不再每次 stat 檔案)"""
+    return Environment(loader=FileSystemLoader(template_dir), auto_reload=False, cache_size=-1)
+
 # # Import Schemas (我們剛才定案的憲法)
 # try:
     
@@ -29,51 +62,99 @@ class PromptFactory:
         self.template_dir = os.path.join(self.root, "character_setting")
         self.config_path = os.path.join(self.root, "character_setting", "personas.json")
 
-        # 1. 初始化 Jinja2 環境
+        # 1. 初始化 Jinja2 環境 (同目錄的 Factory 共用，模板只編譯一次)
         if not os.path.exists(self.template_dir):
             raise FileNotFoundError(f"Templates dir not found: {self.template_dir}")
-        self.env = Environment(loader=FileSystemLoader(self.template_dir))
+        self.env = _get_environment(os.path.abspath(self.template_dir))
         
-        # 2. 載入專家設定 (Personas)
-        if not os.path.exists(self.config_path):
-            raise FileNotFoundError(f"Config file not found: {self.config_path}")
-            
-        with open(self.config_path, "r", encoding="utf-8") as f:
-            self.personas = json.load(f)
+        # 2. 載入專家設定 (Personas；Process 內共用同一份)
+        self.personas = load_personas(self.config_path)
+
+        self._fingerprints = {}
+        self._pinned_vars = {}  # (expert, mode) / (experts, mode) -> mode + Schema (Panel 再加 experts)
+
+    # ------------------------------------------------------------------
+    # Rendering：模板只編譯一次 (共用 Environment)，mode / Schema 變數每個 (專家, Mode) 只組一次。
+    # 沒有切出「靜態前綴」：每次呼叫仍然整份模板重新渲染，省下的只有編譯與組變數
+    # ------------------------------------------------------------------
+    def _render(self, template_name: str, context_data: dict, persona: dict = None, pinned: dict = None) -> str:
+        """合併順序與原本相同：Persona < Context < mode / Schema (Context 可以蓋 Persona，蓋不掉呼叫端指定的 mode)"""
+        return self.env.get_template(template_name).render({**(persona or {}), **context_data, **(pinned or {})})
+
+    def expert_static_vars(self, expert_id: str, mode: str) -> tuple:
+        """(專家, Mode) 不會變的渲染變數：(Persona 設定, {mode, 對應的 Schema})；後者 memoized"""
+        expert_config = self.personas.get(expert_id)
+        if not expert_config:
+            raise ValueError(f"Expert ID '{expert_id}' not found in member_personas.json")
+        key = (expert_id, mode)
+        if key not in self._pinned_vars:
+            if mode not in MODE_SCHEMAS:
+                raise ValueError(f"Invalid mode: {mode}")
+            schema_var, schema = MODE_SCHEMAS[mode]
+            self._pinned_vars[key] = {"mode": mode, schema_var: schema}
+        return expert_config, self._pinned_vars[key]
+
+    def fingerprint(self, expert_id: str, mode: str, template_name: str = "member_prompt.md.j2") -> str:
+        """
+        這個 (專家, Mode) 的 Prompt 版本指紋：Persona 設定 + 模板原始碼 + 注入的 Schema。
+        改了 personas.json / member_prompt.md.j2 / schemas_definitions 才會變 (給 Council Cache Key 用)。
+        """
+        cache_key = (expert_id, mode, template_name)
+        if cache_key not in self._fingerprints:
+            source, _, _ = self.env.loader.get_source(self.env, template_name)
+            mode_schema = MODE_SCHEMAS.get(mode, (None, None))[1]
+            material = json.dumps(
+                [self.personas.get(expert_id), source, mode_schema],
+                sort_keys=True, ensure_ascii=False, default=str,
+            )
+            self._fingerprints[cache_key] = hashlib.sha1(material.encode("utf-8")).hexdigest()[:12]
+        return self._fingerprints[cache_key]
 
     def create_expert_prompt(self, expert_id: str, mode: str, context_data: dict) -> str:
         """
         產生 Council Member (E1~E8) 的 Prompt
         mode: "SKILL" | "GAP_EFFORT" | "ADVISOR"
         """
-        # A. 取得該專家的 Config
-        expert_config = self.personas.get(expert_id)
-        if not expert_config:
-            raise ValueError(f"Expert ID '{expert_id}' not found in member_personas.json")
+        # A+B+C. Persona 設定 (role_name, philosophy...) + mode + 對應的 Schema
+        persona, pinned = self.expert_static_vars(expert_id, mode)
 
-        # B. 準備渲染變數 (合併 Config + Context + Mode)
-        render_vars = {
-            **expert_config,  # 展開 role_name, philosophy, few_shot_examples...
-            **context_data,   # 展開 job_title, raw_jd_text, user_profile...
-            "mode": mode
-        }
+        # D. 渲染模板 (編譯好的模板；Persona → Context (job_title, raw_jd_text...) → mode / Schema)
+        try:
+            return self._render("member_prompt.md.j2", context_data, persona=persona, pinned=pinned)
+        except Exception as e:
+            raise RuntimeError(f"Failed to render expert template: {e}")
 
-        # C. 根據 Mode 注入對應的 Schema (The Constitution)
-        if mode == "SKILL":
-            render_vars["skill_schema"] = SKILL_SCHEMA
-        elif mode == "GAP_EFFORT":
-            render_vars["gap_effort_schema"] = GAP_EFFORT_SCHEMA
-        elif mode == "ADVISOR":
-            render_vars["advisor_schema"] = ADVISOR_SCHEMA
-        else:
-            raise ValueError(f"Invalid mode: {mode}")
+    def panel_fingerprint(self, expert_ids: list, mode: str = "SKILL") -> dict:
+        """Panel Mode 下每位專家的 Prompt 指紋 (模板換成 panel_prompt.md.j2，與單人模式的 Cache 分開)"""
+        return {eid: self.fingerprint(eid, mode, template_name="panel_prompt.md.j2") for eid in expert_ids}
+
+    def create_panel_prompt(self, expert_ids: list, mode: str, context_data: dict) -> str:
+        """
+        產生 Panel Mode 的 Prompt：多位專家的 Persona + JD 只放一次，一次呼叫拿回所有人的結果
+        (每個 @@@ 區塊帶 EXPERT: Ex，之後再拆回各專家)。目前只支援 mode = "SKILL"
+        """
+        if mode != "SKILL":
+            raise ValueError(f"Panel mode only supports SKILL, got: {mode}")
+
+        key = (tuple(expert_ids), mode)
+        if key not in self._pinned_vars:
+            experts = []
+            for expert_id in expert_ids:
+                expert_config = self.personas.get(expert_id)
+                if not expert_config:
+                    raise ValueError(f"Expert ID '{expert_id}' not found in member_personas.json")
+                experts.append({"expert_id": expert_id, **expert_config})
+            self._pinned_vars[key] = {
+                "experts": experts,
+                "expert_ids": list(expert_ids),
+                "mode": mode,
+                "skill_schema": SKILL_SCHEMA,
+            }
 
-        # D. 渲染模板
         try:
-            template = self.env.get_template("member_prompt.md.j2")
-            return template.render(render_vars)
+            return self._render("panel_prompt.md.j2", context_data, pinned=self._pinned_vars[key])
         except Exception as e:
-            raise RuntimeError(f"Failed to render expert template: {e}")
+            raise RuntimeError(f"Failed to render panel template: {e}")
 
     def create_editor_prompt(self, council_opinions: list, context_data: dict) -> str:
         """
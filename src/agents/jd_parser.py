@@ -4,6 +4,9 @@ import os
 # 確保引用路徑正確
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 from src.utils import safe_generate_json
+from src.tools.token_budget import token_budget_planner
+
+JD_TOKEN_LIMIT = int(os.getenv("JD_TOKEN_LIMIT", "4000"))
 
 class JDParserAgent:
     def __init__(self, model):
@@ -15,6 +18,9 @@ class JDParserAgent:
         負責從雜亂的 JD 文字中，提取出結構化的情報。
         """
         
+        # 依 token 數截斷 (原本是 jd_text[:15000] 字元)
+        jd_text = token_budget_planner.truncate_to_tokens(jd_text, JD_TOKEN_LIMIT)
+
         # 定義我們要提取的資料結構
         prompt = f"""
         You are an elite Headhunter and Resume Strategist.
@@ -23,7 +29,7 @@ class JDParserAgent:
         Source File: {filename}
         
         ### JD CONTENT (Truncated):
-        {jd_text[:15000]} 
+        {jd_text} 
         
         ### EXTRACTION TASKS
         1. **Basic Info**: Extract Role, Company, Location.
@@ -1,8 +1,8 @@
 import sys
 import os
-import json
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 from src.utils import safe_generate_json
+from src.agents.character_setting.prompt_loader import load_personas
 
 class TriageAgent:
     def __init__(self, model):
@@ -10,10 +10,8 @@ class TriageAgent:
         self.personas = self._load_personas()
 
     def _load_personas(self):
-        # 取得 council_pool.json 的路徑
-        path = os.path.join(os.path.dirname(__file__), 'character_setting/personas.json')
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        # 與 PromptFactory 共用同一份 Persona Registry (每個 Process 只讀一次 personas.json)
+        return load_personas()
 
     def evaluate(self, dossier: dict, user_profile: str, extra_prompt={}) -> dict:
         # 抓取完整的 JD 內容，避免遺漏底部資訊
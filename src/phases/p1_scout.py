@@ -14,6 +14,8 @@ sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../'
 
 from src.agents.jd_parser import JDParserAgent
 from src.utils import extract_text_from_pdf
+from src.tools.metrics import gateway_metrics
+from src.tools.checkpoint import atomic_write_json
 
 try:
     from src.tools.tool import ToolRegistry
@@ -40,6 +42,11 @@ if not os.path.exists(DIR_INCOMING):
 TEST_LIMIT = None 
 
 def run_scout():
+    with gateway_metrics.labels(phase="P1"):
+        _run_scout()
+    gateway_metrics.dump_phase("P1")
+
+def _run_scout():
     # 顯示目前模式
     mode_msg = f"(Testing Mode: First {TEST_LIMIT} files)" if TEST_LIMIT else "(Full Batch Mode)"
     cprint(f"\n🕵️  [Phase 1] SCOUT AGENT STARTED {mode_msg}", "cyan", attrs=['bold', 'reverse'])
@@ -115,8 +122,7 @@ def run_scout():
         output_filename = f"{os.path.splitext(filename)[0]}_dossier.json"
         output_path = os.path.join(DIR_PROCESSED, output_filename)
         
-        with open(output_path, "w", encoding="utf-8") as f:
-            json.dump(dossier, f, indent=2, ensure_ascii=False)
+        atomic_write_json(output_path, dossier)  # temp 檔 + os.replace，不會留下寫一半的 Dossier
             
         # 成功訊息 (使用 tqdm.write 防止洗版)
         role = parsed_data.get('role', 'Unknown')
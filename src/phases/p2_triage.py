@@ -11,6 +11,8 @@ from tqdm import tqdm
 # === 路徑設定與引用 ===
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
 from src.agents.triage import TriageAgent
+from src.tools.metrics import gateway_metrics
+from src.tools.checkpoint import atomic_write_json
 # from src.agents.profile_generator import ProfileGeneratorAgent 
 
 # === CONFIG ===
@@ -69,6 +71,11 @@ def get_or_create_profile(model):
             sys.exit(0)
 
 def run_triage():
+    with gateway_metrics.labels(phase="P2"):
+        _run_triage()
+    gateway_metrics.dump_phase("P2")
+
+def _run_triage():
     cprint("\n🚑 [Phase 2] FULL RECONNAISSANCE TRIAGE", "cyan", attrs=['bold', 'reverse'])
     
     if not API_KEY:
@@ -140,8 +147,7 @@ def run_triage():
 
             # === 存檔與移動 ===
             target_path = os.path.join(target_dir, filename)
-            with open(target_path, 'w', encoding='utf-8') as f:
-                json.dump(dossier, f, indent=2, ensure_ascii=False)
+            atomic_write_json(target_path, dossier)  # temp 檔 + os.replace，不會留下寫一半的 Dossier
 
         except Exception as e:
             tqdm.write(colored(f"⚠️ Agent Error on {filename}: {e}", "red"))
@@ -2,6 +2,10 @@ import os
 import glob
 import json
 import sys
+import re
+import hashlib
+import heapq
+import argparse
 from termcolor import colored, cprint
 from tqdm import tqdm
 from dotenv import load_dotenv
@@ -13,11 +17,16 @@ sys.path.append(os.path.abspath("."))
 # === Imports ===
 try:
     from src.agents.character_setting.prompt_loader import PromptFactory
-    from src.tools.model_gateway import SmartModelGateway   # [NEW] 統一入口
-    from src.tools.db_connector import db_connector         # [NEW] 資料庫連線
+    from src.tools.model_gateway import SmartModelGateway, GATEWAY_MAX_CONCURRENCY   # [NEW] 統一入口
+    from src.tools.db_connector import db_connector, RESUME_EVIDENCE_TOP_K   # [NEW] 資料庫連線
     from src.tools.tool import validate_council_skill, validate_gap_effort
-    from src.agents.cache_manager import council_memory 
-    from src.tools.schemas import GapAnalysisReport, SkillExtractionReport, AdvisorReport
+    from src.agents.cache_manager import council_memory, council_fingerprint, skill_gap_memo
+    from src.tools.schemas import GapAnalysisReport, SkillExtractionReport, PanelSkillExtractionReport, AdvisorReport, schema_fingerprint
+    from src.tools.metrics import gateway_metrics
+    from src.tools.token_budget import token_budget_planner
+    from src.tools.task_scheduler import PriorityTaskScheduler
+    from src.tools.checkpoint import DossierJournal
+    from src.tools.run_manifest import RunManifest
 except ImportError as e:
     cprint(f"❌ Error: Import failed. {e}", "red")
     sys.exit(1)
@@ -29,6 +38,12 @@ API_KEY = os.getenv("GOOGLE_API_KEY")
 # 資料夾路徑
 DIR_PENDING = "/app/data/processed/pending_council" 
 FORCE_REFRESH = False 
+# 排程器：全域並行上限 (0 = GATEWAY_MAX_CONCURRENCY × Gemma Key 數) / 同時處理幾份 Dossier
+P3_WORKERS = int(os.getenv("P3_WORKERS", "0"))
+P3_MAX_ACTIVE_DOSSIERS = int(os.getenv("P3_MAX_ACTIVE_DOSSIERS", "8"))
+# Panel Mode：Step 1 多位專家共用一次呼叫 (JD 只送一次)；每個 Panel 最多幾位專家 (避免輸出太長)
+P3_PANEL_MODE = os.getenv("P3_PANEL_MODE", "False").lower() == "true"
+P3_PANEL_SIZE = int(os.getenv("P3_PANEL_SIZE", "4"))
 
 # 專家 ID 對照表
 ROLE_NAME_TO_ID = {
@@ -66,12 +81,70 @@ def get_target_experts(dossier):
 
     return sorted(list(set(target_ids))) if target_ids else ["E1", "E2"]
 
+def _stream_progress(eid=None):
+    """GATEWAY_STREAM=True 時，每個驗證通過的 item 一到就顯示 (不用等整份輸出)；Panel Mode 依 item 的 expert 上色"""
+    def on_item(item, index):
+        who = item.get('expert') or eid or '?'
+        tqdm.write(colored(f"      · {who} #{index + 1}: {item.get('topic', '?')}", get_expert_color(who), attrs=['dark']))
+    return on_item
+
+def _evidence_queries(skills):
+    """
+    技能 → 履歷檢索 query (topic + hidden bar，讓語意搜尋對到真正相關的經驗)
+    同一個 topic 但 hidden bar 不同的技能各查一次 (label 加編號)；query 完全相同的只查一次
+    """
+    queries = {}
+    for s in skills:
+        topic = s.get("topic", "")
+        query = f"{topic}: {s.get('analysis', {}).get('hidden_bar', '')}"[:300]
+        if query in queries.values():
+            continue
+        label, n = topic, 1
+        while label in queries:
+            n += 1
+            label = f"{topic} (#{n})"
+        queries[label] = query
+    return queries
+
+# ==========================================
+# 🔑 Council 指紋 (Council Cache Key 與 Run Manifest 共用同一組材料)
+# ==========================================
+def _skill_fingerprint(eid, gateway, factory):
+    """Step 1 單人模式：Persona / 模板 / Schema / Model"""
+    return council_fingerprint(
+        prompt=factory.fingerprint(eid, "SKILL"),
+        schema=schema_fingerprint(SkillExtractionReport),
+        model=gateway.model_fingerprint(),
+    )
+
+def _panel_fingerprints(expert_ids, gateway, factory):
+    """Step 1 Panel Mode：每位專家一個 (模板換成 panel_prompt.md.j2，與單人模式分開)"""
+    return {
+        eid: council_fingerprint(
+            prompt=prompt_fp,
+            schema=schema_fingerprint(PanelSkillExtractionReport),
+            model=gateway.model_fingerprint(),
+        )
+        for eid, prompt_fp in factory.panel_fingerprint(expert_ids).items()
+    }
+
+def _gap_fingerprint_parts(eid, gateway, factory, db_context):
+    """Step 2：Persona / 模板 / Schema / Model / 履歷+Profile (與 JD 無關，Skill Memo 也用這組)"""
+    return dict(
+        prompt=factory.fingerprint(eid, "GAP_EFFORT"),
+        schema=schema_fingerprint(GapAnalysisReport),
+        model=gateway.model_fingerprint(),
+        context=db_context.get("fingerprint"),
+    )
+
 # ==========================================
-# 🟡 Sub-Function: Step 1 (Skill Extraction)
+# 🟡 Sub-Function: Step 1 (Skill Extraction) — 單一專家
 # ==========================================
-def _step1_skill_extraction(dossier, target_experts, gateway, factory):
+def _step1_skill_extraction(eid, dossier, gateway, factory, near_dup_hash=None, on_near_dup=None):
     """
-    只負責執行 Skill Extraction 的邏輯，不負責讀寫檔
+    只負責單一專家的 Skill Extraction，不碰 Dossier 也不讀寫檔 (可以在 Worker Thread 裡跑)
+    near_dup_hash / on_near_dup：相似 JD 的 Cache fallback (見 CouncilCache.get)
+    回傳結果 dict；失敗時丟出例外
     """
     company = dossier.get('basic_info', {}).get('company', 'Unknown')
     raw_jd = dossier.get('raw_content', '')
@@ -84,103 +157,174 @@ def _step1_skill_extraction(dossier, target_experts, gateway, factory):
         "raw_jd_text": raw_jd,
     }
 
-    tqdm.write(colored(f"  🟡 [Step 1] Extracting Skills...", "yellow"))
-    
-    if 'expert_council' not in dossier: dossier['expert_council'] = {}
-    current_results = dossier['expert_council'].get('skill_analysis', {})
+    try:
+        # Cache Check (Key 帶 Persona / 模板 / Schema / Model 指紋，改了哪個就只重算哪些)
+        fingerprint = _skill_fingerprint(eid, gateway, factory)
+        cached = council_memory.get(raw_jd, eid, "SKILL", fingerprint=fingerprint,
+                                    near_dup_hash=near_dup_hash, on_near_dup=on_near_dup)
+        if cached and not FORCE_REFRESH:
+            tqdm.write(colored(f"    🧠 {eid}: Cache Hit", get_expert_color(eid)))
+            return cached
+
+        # Gateway Call (先把 JD 縮到 Gemma 的 token 預算內，避免被迫切到 Flash)
+        prompt = token_budget_planner.fit(
+            lambda ctx: factory.create_expert_prompt(eid, "SKILL", ctx),
+            context_data,
+            budget=gateway.prompt_budget()
+        )
+        with gateway_metrics.labels(expert=eid, mode="SKILL"):
+            result = gateway.generate(prompt, validate_council_skill, schema=SkillExtractionReport, on_item=_stream_progress(eid))
+        if result.get("error"):
+            # 重試全部失敗：不能存進 Cache，也不能被排程器記成 DONE
+            raise RuntimeError(f"{result['error']}: {result.get('failure_reason')}")
+        
+        # Save Logic
+        council_memory.save(raw_jd, eid, "SKILL", result, fingerprint=fingerprint)
+        
+        count = len(result.get("required_skills", []))
+        tqdm.write(colored(f"    👤 {eid}: Found {count} skills", get_expert_color(eid)))
+        return result
 
-    for eid in target_experts:
-        try:
-            # Cache Check
-            cached = council_memory.get(raw_jd, eid, "SKILL")
-            if cached and not FORCE_REFRESH:
-                current_results[eid] = cached
-                tqdm.write(colored(f"    🧠 {eid}: Cache Hit", get_expert_color(eid)))
-                continue
+    except Exception as e:
+        tqdm.write(colored(f"    ❌ {eid} Skill Error: {e}", "red"))
+        raise  # 由排程器記到 Run Manifest (FAILED)
 
-            # Gateway Call
-            prompt = factory.create_expert_prompt(eid, "SKILL", context_data)
-            result = gateway.generate(prompt, validate_council_skill, schema=SkillExtractionReport)
-            
-            # Save Logic
-            council_memory.save(raw_jd, eid, "SKILL", result)
-            current_results[eid] = result
-            
-            count = len(result.get("required_skills", []))
-            tqdm.write(colored(f"    👤 {eid}: Found {count} skills", get_expert_color(eid)))
+# ==========================================
+# 🟡 Sub-Function: Step 1 Panel Mode (多位專家、一次呼叫)
+# ==========================================
+_EXPERT_ID_RE = re.compile(r"E\d+")
+
+def _manifest_mode(step):
+    """Panel 在 Run Manifest 裡仍記成各專家自己的 SKILL 單位"""
+    return "SKILL" if step == "SKILL_PANEL" else step
+
+def _split_panel_report(report, expert_ids):
+    """PanelSkillExtractionReport → {eid: SkillExtractionReport dict} (拿掉 expert 欄位；不在這組的專家忽略)"""
+    split = {}
+    for item in report.get("required_skills", []):
+        match = _EXPERT_ID_RE.search(str(item.get("expert", "")).upper())
+        if match and match.group(0) in expert_ids:
+            skill = {k: v for k, v in item.items() if k != "expert"}
+            split.setdefault(match.group(0), {"required_skills": []})["required_skills"].append(skill)
+    return split
+
+def _step1_panel_extraction(expert_ids, dossier, gateway, factory, near_dup_hash=None, on_near_dup=None):
+    """
+    Panel Mode：一組專家的 Persona + JD 放進同一個 Prompt，一次呼叫 (JD 只送一次)，
+    結果依 EXPERT 拆回各專家，並各自寫進 Council Cache。
+    回傳 {eid: 結果 dict}；呼叫失敗或模型漏掉的專家不在結果裡 (排程器會改用單人模式補跑)
+    """
+    raw_jd = dossier.get('raw_content', '')
+    context_data = {
+        "job_title": dossier.get('basic_info', {}).get('role', ''),
+        "company_name": dossier.get('basic_info', {}).get('company', 'Unknown'),
+        "raw_jd_text": raw_jd,
+    }
 
-        except Exception as e:
-            tqdm.write(colored(f"    ❌ {eid} Skill Error: {e}", "red"))
+    # Cache Check (每位專家各自一筆；Key 用 Panel 模板的指紋，與單人模式分開)
+    fingerprints = _panel_fingerprints(expert_ids, gateway, factory)
+    results, misses = {}, []
+    for eid in expert_ids:
+        cached = council_memory.get(raw_jd, eid, "SKILL", fingerprint=fingerprints[eid],
+                                    near_dup_hash=near_dup_hash, on_near_dup=on_near_dup)
+        if cached and not FORCE_REFRESH:
+            results[eid] = cached
+            tqdm.write(colored(f"    🧠 {eid}: Cache Hit", get_expert_color(eid)))
+        else:
+            misses.append(eid)
+    if not misses:
+        return results
 
-    dossier['expert_council']['skill_analysis'] = current_results
-    return dossier
+    try:
+        prompt = token_budget_planner.fit(
+            lambda ctx: factory.create_panel_prompt(misses, "SKILL", ctx),
+            context_data,
+            budget=gateway.prompt_budget()
+        )
+        with gateway_metrics.labels(expert="PANEL", mode="SKILL"):
+            report = gateway.generate(prompt, validate_council_skill, schema=PanelSkillExtractionReport, on_item=_stream_progress())
+        if report.get("error"):
+            raise RuntimeError(f"{report['error']}: {report.get('failure_reason')}")
+    except Exception as e:
+        tqdm.write(colored(f"    ❌ Panel {', '.join(misses)} Skill Error: {e}", "red"))
+        return results
+
+    # 拆回各專家並存 Cache
+    for eid, result in _split_panel_report(report, misses).items():
+        council_memory.save(raw_jd, eid, "SKILL", result, fingerprint=fingerprints[eid])
+        results[eid] = result
+        tqdm.write(colored(f"    👥 {eid}: Found {len(result['required_skills'])} skills (panel)", get_expert_color(eid)))
+
+    missing = [eid for eid in misses if eid not in results]
+    if missing:
+        tqdm.write(colored(f"    ⚠️ Panel returned nothing for {', '.join(missing)} → solo fallback", "yellow"))
+    return results
 
 # ==========================================
-# 🔵 Sub-Function: Step 2 (Gap & Effort Analysis)
+# 🔵 Sub-Function: Step 2 (Gap & Effort Analysis) — 單一專家
 # ==========================================
-def _step2_gap_analysis(dossier, gateway, factory, db_context):
+NON_SKILL_EXPERTS = ["E3", "E4", "E6"] # we dont need these experts for gap 
+
+def _step2_gap_analysis(eid, p1_memory, dossier, gateway, factory, db_context, near_dup_hash=None, on_near_dup=None):
     """
     執行 Phase 3.5：同時進行「證據檢索 (Retriever)」與「落差分析 (Gap Analysis)」
     [與之前不同處]：加入了 Gatekeeper 過濾邏輯，擋下 MISSING 的技能以節省 Flash 額度。
+    p1_memory 是這位專家自己的 Step 1 結果；回傳結果 dict，不需要做時回傳 None，失敗時丟出例外
     """
     raw_jd = dossier.get('raw_content', '')
     company = dossier.get('basic_info', {}).get('company', 'Unknown')
-    
-    skill_map = dossier.get('expert_council', {}).get('skill_analysis', {})
-    
-    if 'gap_analysis' not in dossier['expert_council']:
-        dossier['expert_council']['gap_analysis'] = {}
-    current_gaps = dossier['expert_council']['gap_analysis']
-
-    tqdm.write(colored(f"  🔵 [Step 2] Gap & Effort Analysis (Filtered by Gatekeeper)...", "cyan"))
-    
-    active_experts = list(skill_map.keys())
 
-    NON_SKILL_EXPERTS = ["E3", "E4", "E6"] # we dont need these experts for gap 
+    # === 1. 排除非技能專家 ===
+    if eid in NON_SKILL_EXPERTS:
+        tqdm.write(colored(f"    🚫 {eid}: Skipped (Contextual Expert, not Skill Gap focused).", "light_grey"))
+        return None
 
-    for eid in active_experts:
-        # === 1. 排除非技能專家 ===
-        if eid in NON_SKILL_EXPERTS:
-            tqdm.write(colored(f"    🚫 {eid}: Skipped (Contextual Expert, not Skill Gap focused).", "light_grey"))
-            continue
-
-        try:
-            p1_memory = skill_map[eid]
-            if not p1_memory or "required_skills" not in p1_memory: continue
-
-            # --- A. Cache Check ---
-            cached = council_memory.get(raw_jd, eid, "GAP_EFFORT")
-            if cached and not FORCE_REFRESH:
-                current_gaps[eid] = cached
-                tqdm.write(colored(f"    🧠 {eid}: Gap Cache Hit", get_expert_color(eid)))
-                continue
-
-            # === 🛑 [NEW] Gatekeeper Filter (守門員過濾) ===
-            # 目的：剔除 Step 1 已經標記為 'MISSING' 的技能，不要浪費 Flash 額度去查
-            raw_skills = p1_memory.get("required_skills", [])
-            skills_to_analyze = []
-            skipped_count = 0
-
-            for skill in raw_skills:
-                # 檢查 Step 1 的標記 (MATCH / POTENTIAL / MISSING)
-                # 如果是 MISSING，直接跳過；如果是 MATCH 或 POTENTIAL (或沒標記)，則保留
-                if skill.get("quick_check") == "MISSING":
-                    skipped_count += 1
-                    continue
-                skills_to_analyze.append(skill)
-            
-            # 優化：如果過濾後發現沒東西需要查 (例如全部都缺)，就直接跳過 API Call
-            if not skills_to_analyze:
-                tqdm.write(colored(f"    ⏩ {eid}: All {skipped_count} skills are MISSING. Skipping Flash call.", "blue"))
-                # 這裡我們可以選擇塞一個空的結果，或者甚麼都不做
-                # current_gaps[eid] = {"gap_analysis": [], "note": "All filtered by Gatekeeper"} 
+    try:
+        if not p1_memory or "required_skills" not in p1_memory: return None
+
+        # === 🛑 [NEW] Gatekeeper Filter (守門員過濾) ===
+        # 目的：剔除 Step 1 已經標記為 'MISSING' 的技能，不要浪費 Flash 額度去查
+        raw_skills = p1_memory.get("required_skills", [])
+        skills_to_analyze = []
+        skipped_count = 0
+
+        for skill in raw_skills:
+            # 檢查 Step 1 的標記 (MATCH / POTENTIAL / MISSING)
+            # 如果是 MISSING，直接跳過；如果是 MATCH 或 POTENTIAL (或沒標記)，則保留
+            if skill.get("quick_check") == "MISSING":
+                skipped_count += 1
                 continue
-
-            if skipped_count > 0:
-                tqdm.write(colored(f"    🛡️ {eid}: Filtered {skipped_count} missing skills. Analyzing {len(skills_to_analyze)} items...", "blue"))
-
+            skills_to_analyze.append(skill)
+        
+        # 優化：如果過濾後發現沒東西需要查 (例如全部都缺)，就直接跳過 API Call
+        if not skills_to_analyze:
+            tqdm.write(colored(f"    ⏩ {eid}: All {skipped_count} skills are MISSING. Skipping Flash call.", "blue"))
+            return None
+
+        # --- A. Cache Check ---
+        # Key 帶指紋：Persona / 模板 / Schema / Model / 履歷+Profile (Skill Memo 用，與 JD 無關)
+        fingerprint_parts = _gap_fingerprint_parts(eid, gateway, factory, db_context)
+        memo_fingerprint = council_fingerprint(**fingerprint_parts)
+        # 整份報告的 Key 再加上這次要分析的技能清單
+        fingerprint = council_fingerprint(**fingerprint_parts, skills=skills_to_analyze)
+        cached = council_memory.get(raw_jd, eid, "GAP_EFFORT", fingerprint=fingerprint,
+                                    near_dup_hash=near_dup_hash, on_near_dup=on_near_dup)
+        if cached and not FORCE_REFRESH:
+            tqdm.write(colored(f"    🧠 {eid}: Gap Cache Hit", get_expert_color(eid)))
+            return cached
+
+        if skipped_count > 0:
+            tqdm.write(colored(f"    🛡️ {eid}: Filtered {skipped_count} missing skills. Analyzing {len(skills_to_analyze)} items...", "blue"))
+
+        # --- A2. Skill Memo (跨 JD)：這位專家分析過的技能直接沿用，只把沒看過的送給模型 ---
+        memo_cached, unseen_skills = ({}, skills_to_analyze) if FORCE_REFRESH else skill_gap_memo.split(eid, skills_to_analyze, memo_fingerprint)
+        if memo_cached:
+            tqdm.write(colored(f"    🧩 {eid}: Skill memo hit {len(memo_cached)}/{len(skills_to_analyze)}", get_expert_color(eid)))
+
+        new_items = []
+        if unseen_skills:
             # 建立過濾後的 Memory 物件
-            p1_memory_filtered = {"required_skills": skills_to_analyze}
+            p1_memory_filtered = {"required_skills": unseen_skills}
 
             # --- B. Context Injection ---
             # 只餵入：1. JD 提取的技能, 2. 精華 Cheat Sheet, 3. 履歷 (Resume)
@@ -188,45 +332,367 @@ def _step2_gap_analysis(dossier, gateway, factory, db_context):
                 "job_title": dossier.get('basic_info', {}).get('role', ''),
                 "company_name": company,
                 "previous_phase_memory": p1_memory_filtered, # Phase 1 的技能清單
-                
+            
                 # [核心修改] 使用蒸餾過的資訊代替原始大數據
                 "user_profile_short": db_context.get('user_profile_short', 'No short summary available.'), 
-                "resume_db_text": db_context.get('resume', 'No resume available.')
+                # 只放每個技能 top-k 的履歷 Bullet (一次 batched query)；索引不可用時退回整份履歷
+                "resume_db_text": db_connector.get_resume_evidence_context(_evidence_queries(unseen_skills))
+                                  or db_context.get('resume', 'No resume available.')
             }
 
             # 註：如果你的 Prompt Factory 預期的 Key 還是 personal_db_text，
             # 也可以維持 Key 名稱不變，但傳入的 Value 改成 Cheat Sheet。
 
             # --- C. AI Execution (Gateway) ---
-            prompt = factory.create_expert_prompt(eid, "GAP_EFFORT", context_data)
-            
+            # 超過預算時：先丟相關度最低的履歷版本，再依 token 截斷
+            prompt = token_budget_planner.fit(
+                lambda ctx: factory.create_expert_prompt(eid, "GAP_EFFORT", ctx),
+                context_data,
+                budget=gateway.prompt_budget(),
+                relevance_terms=[s.get("topic", "") for s in unseen_skills]
+            )
+        
             # [MODIFIED] 傳入 Pydantic Schema
             # 告訴 Gateway: "我要這個格式，其他的都不要"
-            result = gateway.generate(
-                prompt, 
-                validate_gap_effort, 
-                schema=GapAnalysisReport
-            )
+            with gateway_metrics.labels(expert=eid, mode="GAP_EFFORT"):
+                result = gateway.generate(
+                    prompt, 
+                    validate_gap_effort, 
+                    schema=GapAnalysisReport,
+                    on_item=_stream_progress(eid)
+                )
+            if result.get("error"):
+                # 重試全部失敗：不能把「只剩 Memo 命中」的殘缺報告寫進 Memo / Cache，交給排程器記成 FAILED
+                raise RuntimeError(f"{result['error']}: {result.get('failure_reason')}")
+            new_items = result.get("gap_analysis", [])
+
+        # 合併：Memo 命中的 + 模型新分析的 (依原本技能順序)，新分析的寫回 Memo
+        result = {"gap_analysis": skill_gap_memo.merge(eid, skills_to_analyze, memo_cached, new_items, memo_fingerprint)}
+
+        # --- D. Save ---
+        council_memory.save(raw_jd, eid, "GAP_EFFORT", result, fingerprint=fingerprint)
+
+        # 統計顯示
+        gaps = result.get("gap_analysis", [])
+        found_count = sum(1 for g in gaps if "FOUND" in g.get("evidence_in_personal_db", {}).get("status", ""))
+        tqdm.write(colored(f"    👤 {eid}: Analyzed {len(gaps)} items. Evidence found: {found_count}", get_expert_color(eid)))
+        return result
+
+    except Exception as e:
+        tqdm.write(colored(f"    ❌ {eid} Gap Analysis Failed: {e}", "red"))
+        raise  # 由排程器記到 Run Manifest (FAILED)
+
+# ==========================================
+# ⚡ Scheduler (多份 Dossier × 多位專家，共用一個 Worker Pool)
+# ==========================================
+# 工作單位 = (Dossier, Expert, Step)，全部進同一個 Priority Queue：
+# - 同時最多 P3_WORKERS 個單位在跑 (預設 = GATEWAY_MAX_CONCURRENCY × Gemma Key 數，額度越多跑越快)
+# - 同時最多 P3_MAX_ACTIVE_DOSSIERS 份 Dossier 在處理中 (其餘留在磁碟，不佔記憶體)
+# - 排序：先進場的 Dossier 先收尾 → 同 Dossier 內 GAP 優先於 SKILL → 專家 relevance 高的先
+# - Dossier 依 Triage 分數 (最高的專家 relevance) 由高到低進場
+STEP_RANK = {"GAP_EFFORT": 0, "SKILL": 1, "SKILL_PANEL": 1}
+
+def get_dossier_priority(dossier):
+    """Triage 給的最高專家 relevance (越高越早處理)"""
+    referral = dossier.get('triage_result', {}).get('referral_analysis', {})
+    if not isinstance(referral, dict): return 0
+    scores = [d.get('relevance', 0) for eid, d in referral.items() if eid.startswith("E") and isinstance(d, dict)]
+    return max([s for s in scores if isinstance(s, (int, float))], default=0)
+
+class _DossierJob:
+    """Coordinator 端的單一 Dossier 狀態 (只有 Coordinator 執行緒會讀寫)"""
+
+    def __init__(self, filepath, dossier, rank, journal, units):
+        self.filepath = filepath
+        self.id = os.path.basename(filepath)
+        self.dossier = dossier
+        self.journal = journal
+        self.units = units  # Run Manifest 裡這份 Dossier 上次的單位狀態
+        self.jd_hash = hashlib.md5(dossier.get('raw_content', '').encode('utf-8')).hexdigest()
+        self.rank = rank
+        self.pending = 0
+        self.failed = 0
+        self.completed = set()         # 這次跑完的 "eid/mode" (不管有沒有命中 Cache)
+        self.near_dup = None           # find_near_duplicate() 的結果 (只在 Cache 查詢時用)
+        self.near_dup_served = set()   # 真的沿用了相似 JD 結果的 "eid/mode" (Worker 執行緒會寫；set.add 是原子操作)
+        council = dossier.setdefault('expert_council', {})
+        self.skill_map = council.setdefault('skill_analysis', {})
+        self.gap_map = council.setdefault('gap_analysis', {})
+
+    def relevance(self, eid):
+        data = self.dossier.get('triage_result', {}).get('referral_analysis', {}).get(eid, {})
+        score = data.get('relevance', 0) if isinstance(data, dict) else 0
+        return score if isinstance(score, (int, float)) else 0
+
+    def near_dup_kwargs(self):
+        """Step 函式的 near-dup 參數 (沒有相似 JD 時為空)"""
+        if not self.near_dup:
+            return {}
+        return {"near_dup_hash": self.near_dup['jd_hash'],
+                "on_near_dup": lambda eid, mode: self.near_dup_served.add(f"{eid}/{mode}")}
+
+    def record(self, section, eid, result):
+        """[Checkpoint] 結果寫進 Dossier，同時 append 到 journal (只寫這一筆，不重寫整份檔案)"""
+        self.dossier['expert_council'][section][eid] = result
+        self.journal.append(["expert_council", section, eid], result)
+
+    def save(self):
+        """[Final Save] 原子寫回 Dossier (temp 檔 + os.replace)，清掉 journal"""
+        self.journal.compact(self.dossier)
+
+class Phase3Scheduler:
+    def __init__(self, gateway, factory, db_context, workers=None, max_active=P3_MAX_ACTIVE_DOSSIERS,
+                 manifest=None, retry_failed=False):
+        # 預設並行數跟著額度走：每把 Gemma Key 各 GATEWAY_MAX_CONCURRENCY 個
+        workers = workers or P3_WORKERS or GATEWAY_MAX_CONCURRENCY * max(1, len(gateway.gemma_pool.members))
+        self.gateway = gateway
+        self.factory = factory
+        self.db_context = db_context
+        self.max_active = max(1, max_active)
+        self.tasks = PriorityTaskScheduler(workers, name="p3")
+        self.manifest = manifest or RunManifest()
+        self.retry_failed = retry_failed
+        self.backlog = []   # 尚未進場的檔案 (已依優先度排序)
+        self.active = 0
+        self.next_rank = 0
+        self.pbar = None
+        self._preloaded = {}          # _rank_files 讀過、會最先進場的 Dossier (filepath → dossier)
+        self._unit_fingerprints = {}  # (eid, mode) → Council 指紋 (不含 JD)
+        self.fingerprint = None       # 這次執行的整體 Council 指紋 (整份 Dossier 跳過時比對)
+
+    # --- Council 指紋 (Run Manifest 跳過判斷用) ---
+    def _unit_fingerprint(self, eid, mode):
+        """跟 Council Cache Key 同一組材料；Step 1 同時看單人與 Panel 模板 (兩種都可能跑到)"""
+        key = (eid, mode)
+        if key not in self._unit_fingerprints:
+            if mode == "SKILL":
+                panel = _panel_fingerprints([eid], self.gateway, self.factory)[eid] if P3_PANEL_MODE else None
+                parts = dict(solo=_skill_fingerprint(eid, self.gateway, self.factory), panel=panel)
+            else:
+                parts = _gap_fingerprint_parts(eid, self.gateway, self.factory, self.db_context)
+            self._unit_fingerprints[key] = council_fingerprint(**parts)
+        return self._unit_fingerprints[key]
+
+    def _unit_hash(self, job, eid, mode):
+        """Manifest 的 input_hash：JD + 這個單位的 Council 指紋"""
+        return council_fingerprint(jd=job.jd_hash, council=self._unit_fingerprint(eid, mode))
+
+    def _unit_done(self, job, eid, mode):
+        """上次 DONE，而且 JD / Persona / 模板 / Schema / Model / Context 都沒變 (FORCE_REFRESH 一律重跑)"""
+        return not FORCE_REFRESH and self.manifest.is_done(job.units, eid, mode, self._unit_hash(job, eid, mode))
+
+    def _run_fingerprint(self):
+        """所有專家 × 兩個 Step 的 Council 指紋 (記在整份 Dossier 的完成紀錄裡)"""
+        experts = sorted(e for e in self.factory.personas if _EXPERT_ID_RE.fullmatch(e))
+        return council_fingerprint(**{
+            f"{eid}/{mode}": self._unit_fingerprint(eid, mode) for eid in experts for mode in ("SKILL", "GAP_EFFORT")
+        })
+
+    def _rank_files(self, files):
+        """
+        依 Triage 分數排序 (先 replay journal，跟 _admit 看到的是同一份內容)。
+        排在最前面、一開始就會進場的 max_active 份留在記憶體給 _admit 直接用，其餘只留分數
+        """
+        ranked, head = [], []  # head：目前前 max_active 名的 (priority, -order, filepath, dossier)，堆頂是最差的
+        for filepath in files:
+            try:
+                dossier = DossierJournal(filepath).load()
+            except Exception as e:
+                tqdm.write(colored(f"⚠️ Skipping unreadable dossier {os.path.basename(filepath)}: {e}", "red"))
+                continue
+            priority = get_dossier_priority(dossier)
+            ranked.append((-priority, len(ranked), filepath))
+            entry = (priority, -len(ranked), filepath, dossier)
+            if len(head) < self.max_active:
+                heapq.heappush(head, entry)
+            else:
+                heapq.heappushpop(head, entry)
+        self._preloaded = {filepath: dossier for _, _, filepath, dossier in head}
+        return [filepath for _, _, filepath in sorted(ranked)]
+
+    # --- Admission ---
+    def _admit(self):
+        """Queue 快空時補 Dossier 進場 (不超過 max_active 份)"""
+        while self.backlog and self.active < self.max_active:
+            filepath = self.backlog.pop(0)
+            journal = DossierJournal(filepath)
+            try:
+                # 上次中途當掉的話，journal 裡的結果會自動補回 (排序時已經印過 Recovered 訊息)
+                dossier = self._preloaded.pop(filepath, None) or journal.load(verbose=False)
+            except Exception as e:
+                tqdm.write(colored(f"⚠️ Load failed {os.path.basename(filepath)}: {e}", "red"))
+                self.pbar.update(1)
+                continue
 
-            # --- D. Save & Store ---
-            council_memory.save(raw_jd, eid, "GAP_EFFORT", result)
-            current_gaps[eid] = result
+            job = _DossierJob(filepath, dossier, self.next_rank, journal, self.manifest.units(os.path.basename(filepath)))
+            self.manifest.clear_dossier_done(job.id)  # 處理中途當掉時，下次不能被當成已完成
+            self.next_rank += 1
+            self.active += 1
+
+            company = dossier.get('basic_info', {}).get('company', 'Unknown')
+            tqdm.write(colored(f"\n🎯 Target: {company}", "white", attrs=['bold']))
+
+            # 重新張貼的 JD (只改日期 / 地點) → 自己沒有 Cache 時沿用相似 JD 的 Council 結果
+            # (真的沿用了才在 _finish 記錄到 Dossier；FORCE_REFRESH 一律重算，不用找)
+            job.near_dup = None if FORCE_REFRESH else council_memory.find_near_duplicate(dossier.get('raw_content', ''))
+            if job.near_dup:
+                tqdm.write(colored(f"  🧬 Near-duplicate JD (similarity {job.near_dup['similarity']:.0%}) → cached council results can be reused", "blue"))
+
+            # 決定專家 (Routing)
+            target_experts = get_target_experts(dossier)
+            tqdm.write(colored(f"  route -> {', '.join(target_experts)}", "dark_grey"))
+
+            # target 專家從 Step 1 開始；Dossier 裡已有 Skill 結果的其他專家只補跑 Step 2
+            # Manifest 記錄為 DONE (且 JD / Council 指紋沒變) 的單位直接跳過
+            skill_needed = []
+            for eid in target_experts:
+                if self._unit_done(job, eid, "SKILL") and eid in job.skill_map:
+                    self._submit_gap(job, eid, job.skill_map[eid])
+                else:
+                    skill_needed.append(eid)
+            self._submit_skills(job, skill_needed)
+            for eid in [e for e in job.skill_map if e not in target_experts]:
+                self._submit_gap(job, eid, job.skill_map[eid])
+            if job.pending == 0:
+                self._finish(job)
+
+    def _submit_gap(self, job, eid, p1_memory):
+        if not self._unit_done(job, eid, "GAP_EFFORT"):
+            self._submit(job, eid, "GAP_EFFORT", p1_memory)
+
+    def _submit_skills(self, job, eids):
+        """Step 1：Panel Mode 時每 P3_PANEL_SIZE 位專家一組共用一次呼叫，否則每位專家各自一個單位"""
+        if not P3_PANEL_MODE or len(eids) < 2:
+            for eid in eids:
+                self._submit(job, eid, "SKILL")
+            return
+        for i in range(0, len(eids), max(2, P3_PANEL_SIZE)):
+            group = eids[i:i + max(2, P3_PANEL_SIZE)]
+            if len(group) == 1:
+                self._submit(job, group[0], "SKILL")
+            else:
+                self._submit(job, tuple(group), "SKILL_PANEL")
+
+    def _submit(self, job, eid, step, p1_memory=None):
+        """eid：單一專家；SKILL_PANEL 時為一組專家 (tuple)"""
+        eids = list(eid) if step == "SKILL_PANEL" else [eid]
+        priority = (job.rank, STEP_RANK[step], -max(job.relevance(e) for e in eids))
+        if step == "SKILL_PANEL":
+            args = (_step1_panel_extraction, eids, job.dossier, self.gateway, self.factory)
+        elif step == "SKILL":
+            args = (_step1_skill_extraction, eid, job.dossier, self.gateway, self.factory)
+        else:
+            args = (_step2_gap_analysis, eid, p1_memory, job.dossier, self.gateway, self.factory, self.db_context)
+        for e in eids:
+            mode = _manifest_mode(step)
+            self.manifest.mark(job.id, e, mode, RunManifest.PENDING, input_hash=self._unit_hash(job, e, mode))
+        self.tasks.submit(priority, self._run_unit, job.id, eids, step, *args, tag=(job, eid, step), **job.near_dup_kwargs())
+        job.pending += 1
+
+    def _run_unit(self, dossier_id, eids, step, func, *args, **kwargs):
+        """Worker Thread：真正開始跑時才標 RUNNING (attempts + 1)"""
+        for eid in eids:
+            self.manifest.mark(dossier_id, eid, _manifest_mode(step), RunManifest.RUNNING)
+        return func(*args, **kwargs)
+
+    # --- Completion (Coordinator 執行緒) ---
+    def _on_done(self, tag, result, error):
+        job, eid, step = tag
+        job.pending -= 1
+        if error is None and isinstance(result, dict) and result.get("error"):
+            # Gateway 重試用盡時回傳 error dict 而不是丟例外 → 一樣當成失敗 (不寫進 Dossier)
+            error, result = RuntimeError(f"{result['error']}: {result.get('failure_reason')}"), None
+        if step == "SKILL_PANEL":
+            self._on_panel_done(job, eid, result or {}, error)
+        elif error is not None:
+            # 專家之間互不影響：一個單位炸掉，其他人照常 (錯誤已由 Step 印出，這裡只記到 Manifest)
+            job.failed += 1
+            self.manifest.mark(job.id, eid, step, RunManifest.FAILED, error=f"{type(error).__name__}: {error}")
+        else:
+            self.manifest.mark(job.id, eid, step, RunManifest.DONE)
+            job.completed.add(f"{eid}/{step}")
+
+        if step == "SKILL":
+            if result is not None:
+                job.record('skill_analysis', eid, result)
+            # 自己的 Step 1 一好就接 Step 2 (失敗時沿用 Dossier 裡舊的 Skill 結果)
+            p1_memory = result or job.skill_map.get(eid)
+            if p1_memory is not None:
+                self._submit(job, eid, "GAP_EFFORT", p1_memory)
+        elif step == "GAP_EFFORT" and result is not None:
+            job.record('gap_analysis', eid, result)
+
+        if job.pending == 0:
+            self._finish(job)
+
+    def _on_panel_done(self, job, eids, results, error):
+        """Panel 結果拆回各專家；Panel 失敗或漏掉的專家改用單人模式補跑"""
+        if error is not None:
+            tqdm.write(colored(f"    ❌ Panel {', '.join(eids)} Failed: {error} → falling back to solo prompts", "red"))
+        for eid in eids:
+            result = results.get(eid)
+            if result is None:
+                self._submit(job, eid, "SKILL")
+                continue
+            self.manifest.mark(job.id, eid, "SKILL", RunManifest.DONE)
+            job.completed.add(f"{eid}/SKILL")
+            job.record('skill_analysis', eid, result)
+            self._submit(job, eid, "GAP_EFFORT", result)
 
-            # 統計顯示
-            gaps = result.get("gap_analysis", [])
-            found_count = sum(1 for g in gaps if "FOUND" in g.get("evidence_in_personal_db", {}).get("status", ""))
-            tqdm.write(colored(f"    👤 {eid}: Analyzed {len(gaps)} items. Evidence found: {found_count}", get_expert_color(eid)))
+    def _finish(self, job):
+        # === [Checkpoint] 預留位置給未來的 Strategy Data ===
+        # dossier = _step3_strategy_summary(...)
 
-        except Exception as e:
-            tqdm.write(colored(f"    ❌ {eid} Gap Analysis Failed: {e}", "red"))
+        # Near-dup 紀錄：只列真的沿用了相似 JD 結果的單位 (這次重算過的舊紀錄拿掉，沒跑到的保留)
+        council = job.dossier['expert_council']
+        previous = council.pop('near_duplicate', None) or {}
+        served = (set(previous.get('served', [])) - job.completed) | job.near_dup_served
+        if served:
+            source = job.near_dup if job.near_dup_served else previous
+            council['near_duplicate'] = {**source, "served": sorted(served)}
 
-    dossier['expert_council']['gap_analysis'] = current_gaps
-    return dossier
+        # [Final Save] 最終存檔
+        job.save()
+        if job.failed == 0:
+            self.manifest.mark_dossier_done(job.id, job.filepath, self.fingerprint)  # 下次檔案與指紋都沒變就整份跳過
+        self.active -= 1
+        self.pbar.update(1)
+        self.pbar.set_postfix(company=job.dossier.get('basic_info', {}).get('company', 'Unknown')[:10])
+
+    def _select_files(self, files):
+        """依 Run Manifest 篩檔：一般模式跳過已完成 (檔案與 Council 指紋沒變) 的 Dossier；--retry-failed 只留有失敗單位的"""
+        if self.retry_failed:
+            failed = self.manifest.failed_dossiers()
+            selected = [f for f in files if os.path.basename(f) in failed]
+            tqdm.write(colored(f"🔁 Retry mode: {len(selected)} dossiers with failed units", "yellow"))
+            return selected
+        if FORCE_REFRESH:
+            return files
+        selected = [f for f in files if not self.manifest.dossier_done(os.path.basename(f), f, self.fingerprint)]
+        if len(selected) < len(files):
+            tqdm.write(colored(f"⏭️  Manifest: skipping {len(files) - len(selected)} completed dossiers", "dark_grey"))
+        return selected
+
+    def run(self, files):
+        self.fingerprint = self._run_fingerprint()
+        files = self._select_files(files)
+        self.backlog = self._rank_files(files)
+        tqdm.write(colored(f"⚡ Scheduler: {len(self.backlog)} dossiers, {self.tasks.max_workers} workers, {self.max_active} active dossiers max", "yellow"))
+        self.pbar = tqdm(total=len(self.backlog), desc="Processing Dossiers", unit="job")
+        try:
+            return self.tasks.run(self._on_done, refill=self._admit)
+        finally:
+            self.pbar.close()
 
 # ==========================================
 # 🚀 Main Controller (Orchestrator)
 # ==========================================
-def run_phase3_dynamic_execution():
+def run_phase3_dynamic_execution(retry_failed=False):
+    with gateway_metrics.labels(phase="P3"):
+        _run_phase3_dynamic_execution(retry_failed)
+    gateway_metrics.dump_phase("P3")
+
+def _run_phase3_dynamic_execution(retry_failed=False):
     cprint("\n🏛️  [Phase 3] EXPERT COUNCIL: Dynamic Diagnosis Pipeline", "magenta", attrs=['bold', 'reverse'])
     
     # 1. 初始化共通工具 (只做一次)
@@ -251,45 +717,34 @@ def run_phase3_dynamic_execution():
         "resume": db_connector.get_resume_bullets_context(),
         'user_profile_short': db_connector.get_user_profile()
     }
+    # 履歷 / Profile 的指紋 (Step 2 Cache Key 用；DB 更新後只有 Gap 分析會重算)
+    db_context["fingerprint"] = council_fingerprint(resume=db_context["resume"], profile=db_context["user_profile_short"])
     cprint(f"📚 DB Loaded: Personal ({len(db_context['personal'])} chars), Resume ({len(db_context['resume'])} chars)", "green")
+    # Step 2 改用 Bullet 層級檢索 (整份履歷只留作指紋 / fallback)
+    if db_connector.build_resume_bullet_index() is not None:
+        cprint(f"🔎 Resume evidence: top-{RESUME_EVIDENCE_TOP_K} bullets per skill", "green")
 
-    # 3. 遍歷檔案
+    # 3. 排程所有檔案 (多份 Dossier 同時進行，共用 Worker Pool)
     files = glob.glob(os.path.join(DIR_PENDING, "*.json"))
-    pbar = tqdm(files, desc="Processing Dossiers", unit="job")
-    
-    for filepath in pbar:
-        # Load Dossier
-        with open(filepath, 'r', encoding='utf-8') as f:
-            dossier = json.load(f)
-
-        company = dossier.get('basic_info', {}).get('company', 'Unknown')
-        pbar.set_postfix(company=company[:10])
-        tqdm.write(colored(f"\n🎯 Target: {company}", "white", attrs=['bold']))
-
-        # 決定專家 (Routing)
-        target_experts = get_target_experts(dossier)
-        tqdm.write(colored(f"  route -> {', '.join(target_experts)}", "dark_grey"))
-        print(f"Called experts {target_experts}")
-        # input()
-
-        # === 執行 Step 1: Skill Extraction ===
-        dossier = _step1_skill_extraction(dossier, target_experts, gateway, factory)
-        
-        # [Checkpoint Save] 中途存檔 (安全網)
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(dossier, f, indent=2, ensure_ascii=False)
-
-        # === 執行 Step 2: Gap Analysis ===
-        dossier = _step2_gap_analysis(dossier, gateway, factory, db_context)
-
-        # === [Checkpoint] 預留位置給未來的 Strategy Data ===
-        # dossier = _step3_strategy_summary(...) 
-        
-        # [Final Save] 最終存檔
-        with open(filepath, 'w', encoding='utf-8') as f:
-            json.dump(dossier, f, indent=2, ensure_ascii=False)
-
+    manifest = RunManifest()
+    task_stats = Phase3Scheduler(gateway, factory, db_context, manifest=manifest, retry_failed=retry_failed).run(files)
+    cprint(f"⚡ Tasks: {task_stats['completed']} completed, {task_stats['failed']} failed", "dark_grey")
+
+    # Run Manifest 總覽 (失敗的單位可用 --retry-failed 只重跑它們)
+    units = manifest.summary()
+    cprint(f"📋 Manifest: {', '.join(f'{state} {count}' for state, count in sorted(units.items())) or 'empty'}", "dark_grey")
+    if units.get(RunManifest.FAILED):
+        manifest.print_failures()
+        cprint("   → Re-run only the failures: python src/phases/p3_council.py --retry-failed", "yellow")
+
+    stats = council_memory.report()
+    cprint(f"🧠 Council Cache: hit rate {stats['hit_rate']:.0%} (memory {stats['memory_hits']}, disk {stats['disk_hits']}, near-dup {stats['near_dup_hits']}, miss {stats['misses']}) | {stats['entries']} entries, {stats['bytes'] / 1024 / 1024:.1f} MB", "dark_grey")
+    memo = skill_gap_memo.report()
+    cprint(f"🧩 Skill Memo: hit rate {memo['hit_rate']:.0%} ({memo['hits']} skills reused, {memo['misses']} sent to model, {memo['saves']} saved)", "dark_grey")
     cprint("\n🎉 Diagnosis Complete.", "green")
 
 if __name__ == "__main__":
-    run_phase3_dynamic_execution()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Phase 3: Expert Council")
+    parser.add_argument("--retry-failed", action="store_true", help="只重跑 Run Manifest 裡 FAILED / 中斷的單位")
+    args = parser.parse_args()
+    run_phase3_dynamic_execution(retry_failed=args.retry_failed)
\ No newline at end of file
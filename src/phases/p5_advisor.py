@@ -10,6 +10,7 @@ from src.tools.model_gateway import SmartModelGateway
 from src.tools.db_connector import db_connector 
 from src.tools.data_manager import JobDataManager
 from src.agents.character_setting.prompt_loader import PromptFactory
+from src.tools.metrics import gateway_metrics
 
 load_dotenv()
 
@@ -173,14 +174,15 @@ class WarRoomEditor:
                 })
         return opinions
 
-    def _process_single_job(self, job):
+    def _prepare_job(self, job):
+        """讀 P3 資料並組好 Prompt；P3 缺資料或報告已存在時回傳 None (不呼叫 LLM)"""
         jid = job['id'] 
         
         # 1. 先讀取資料 (為了拿到 Company Name 來組檔名)
         p3_data = self.data_manager.load_job_data(jid)
         if not p3_data:
             cprint(f"⚠️ P3 data missing for ID: {jid}, skipping.", "red")
-            return
+            return None
 
         company = p3_data['basic_info']['company']
         role = p3_data['basic_info']['role']
@@ -195,7 +197,7 @@ class WarRoomEditor:
         if os.path.exists(output_path):
             # 如果存在，印個灰色的字跳過，不呼叫 LLM
             cprint(f"  ⏭️  Skipping {company} (File exists: {fname})", "dark_grey")
-            return 
+            return None
         
         # ==========================================
         # 只有檔案不存在時，才會執行以下昂貴的操作
@@ -215,23 +217,37 @@ class WarRoomEditor:
                 "resume_text": self.resume_content
             }
         )
-        
-        # 6. 呼叫 Gateway (燒錢的地方)
-        cprint(f"  ✍️  Drafting plan for {company}...", "yellow")
-        response = self.gateway.generate(prompt, use_gemma=True)
-        
+        return {"prompt": prompt, "company": company, "role": role, "fname": fname, "output_path": output_path}
+
+    def _save_plan(self, job_plan, response):
+        """解析 Gateway 回應並存成 Markdown 報告；Gateway 失敗時不存 (下次還會重跑)"""
+        if isinstance(response, dict) and response.get('error'):
+            cprint(f"  ❌ {job_plan['company']}: {response['error']} ({response.get('failure_reason')})", "red")
+            return
+
         # 7. 解析與存檔
-        items = response.get('editor_plan', [])
+        items = response.get('editor_plan', []) if isinstance(response, dict) else []
         # Fallback 邏輯...
         if not items and isinstance(response, dict): items = response.get('strategic_advice', [])
         if not items and isinstance(response, list): items = response
         
-        report = self._render_editor_report(company, role, items)
+        report = self._render_editor_report(job_plan['company'], job_plan['role'], items)
         
-        with open(output_path, 'w', encoding='utf-8') as f:
+        with open(job_plan['output_path'], 'w', encoding='utf-8') as f:
             f.write(report)
             
-        cprint(f"  ✅ Saved: {fname}", "green")
+        cprint(f"  ✅ Saved: {job_plan['fname']}", "green")
+
+    def _process_jobs(self, jobs):
+        """同一個 Cluster 的 Job 一起送出：generate_many 平行呼叫 (受 Rate Limiter 限制)，結果依序對回各 Job"""
+        job_plans = [p for p in (self._prepare_job(job) for job in jobs) if p is not None]
+        if not job_plans:
+            return
+        # 6. 呼叫 Gateway (燒錢的地方)
+        cprint(f"  ✍️  Drafting {len(job_plans)} plans: {', '.join(p['company'] for p in job_plans)}...", "yellow")
+        responses = self.gateway.generate_many([p['prompt'] for p in job_plans], use_gemma=True)
+        for job_plan, response in zip(job_plans, responses):
+            self._save_plan(job_plan, response)
         
     def run_editor_session(self, selection):
         """
@@ -271,9 +287,7 @@ class WarRoomEditor:
             
             # --- 以下是你原本的處理邏輯 (找工作 -> 找 P3 -> 生成 Prompt) ---
             target_jobs = cluster['jobs'] # 每個 Cluster 取前 3 高分
-            
-            for job in target_jobs:
-                self._process_single_job(job)
+            self._process_jobs(target_jobs)
                 
 
     def execute(self):
@@ -290,9 +304,12 @@ class WarRoomEditor:
                 break
             
             try:
-                self.run_editor_session(sel)
+                with gateway_metrics.labels(phase="P5"):
+                    self.run_editor_session(sel)
             except ValueError:
                 print("Invalid input.")
 
+        gateway_metrics.dump_phase("P5")
+
 if __name__ == "__main__":
     WarRoomEditor().execute()
\ No newline at end of file
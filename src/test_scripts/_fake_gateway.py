@@ -0,0 +1,110 @@
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# 測試用的 Log / Metrics / Cache 一律寫到暫存目錄 (要在 import Gateway 之前設定)
+_TMP_DIR = tempfile.mkdtemp(prefix="gateway_test_")
+os.environ.setdefault("GATEWAY_LOG_PATH", os.path.join(_TMP_DIR, "debug_gemma.log"))
+os.environ.setdefault("METRICS_DIR", os.path.join(_TMP_DIR, "metrics"))
+os.environ.setdefault("LLM_CACHE_PATH", os.path.join(_TMP_DIR, "llm_responses.sqlite3"))
+
+from src.tools import model_gateway
+from src.tools.model_gateway import SmartModelGateway
+from src.tools.response_cache import ResponseCache
+
+# ==========================================
+# 🧪 離線測試用的假 Model / Gateway (不打 API)
+# ==========================================
+# FakeModel 依序吐出 replies：字串 = 回應文字；Exception = 這一次呼叫丟出該例外
+# replies 也可以是 callable(request) → 回應 (平行呼叫時依 Prompt 決定回應)
+
+
+class _FakeStreamIterator:
+    """模擬 genai 底層的 gRPC 串流 (有 cancel())"""
+
+    def __init__(self):
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class FakeStream:
+    def __init__(self, text: str, chunk_chars: int = 40):
+        self.text = text
+        self.usage_metadata = None
+        self.chunks_sent = 0
+        self._chunk_chars = chunk_chars
+        self._iterator = _FakeStreamIterator()
+
+    @property
+    def total_chunks(self) -> int:
+        return -(-len(self.text) // self._chunk_chars)
+
+    def __iter__(self):
+        for i in range(0, len(self.text), self._chunk_chars):
+            if self._iterator.cancelled:
+                return
+            self.chunks_sent += 1
+            yield SimpleNamespace(text=self.text[i:i + self._chunk_chars])
+
+
+class FakeModel:
+    def __init__(self, model_name: str, replies=None):
+        self.model_name = model_name
+        self.replies = replies if callable(replies) else list(replies or [])
+        self.calls = 0
+        self.streams = []
+
+    def generate_content(self, request, generation_config=None, stream=False, **kwargs):
+        self.calls += 1
+        if callable(self.replies):
+            reply = self.replies(str(request))
+        elif not self.replies:
+            raise RuntimeError(f"FakeModel {self.model_name}: no scripted reply left")
+        else:
+            reply = self.replies.pop(0)
+        if isinstance(reply, Exception):
+            raise reply
+        if stream:
+            self.streams.append(FakeStream(reply))
+            return self.streams[-1]
+        return SimpleNamespace(text=reply, usage_metadata=None)
+
+    def count_tokens(self, contents, **kwargs):
+        return SimpleNamespace(total_tokens=len(str(contents)) // 4 + 1)
+
+
+def make_gateway(models: list, cache_dir: str = None) -> SmartModelGateway:
+    """
+    建立一個 Gemma Pool 由 models (FakeModel，依序 = 主要 / 備援) 組成的 Gateway。
+    cache_dir 有給時 Response Cache 換成該目錄下的新 DB (否則停用 Cache)。
+    """
+    previous = os.environ.get("MODEL_NAME")
+    os.environ["MODEL_NAME"] = ",".join(m.model_name for m in models)
+    try:
+        gateway = SmartModelGateway({"api_key": "offline-test-key"})
+    finally:
+        if previous is None:
+            os.environ.pop("MODEL_NAME", None)
+        else:
+            os.environ["MODEL_NAME"] = previous
+
+    by_name = {m.model_name: m for m in models}
+    for member in gateway.gemma_pool.members:
+        member.model = by_name[member.model_name]
+    gateway.gemma_model = models[0]
+    gateway.flash_model = FakeModel("fake-counter")
+
+    model_gateway.response_cache = ResponseCache(
+        db_path=os.path.join(cache_dir or _TMP_DIR, "responses.sqlite3"), enabled=cache_dir is not None
+    )
+    return gateway
+
+
+def tag_block(topic: str) -> str:
+    return f"@@@\nTOPIC: {topic}\nPRIORITY: MUST_HAVE\nHIDDEN_BAR: bar\nQUOTE: quote\n@@@\n"
@@ -0,0 +1,165 @@
+import os
+import re
+import sys
+import time
+import argparse
+from termcolor import colored, cprint
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+sys.path.append(os.path.abspath("."))
+
+try:
+    from src.tools.model_gateway import parse_gemma_tags
+    from src.tools.llm_backend import CassetteStore, LLM_CASSETTE_PATH
+except ImportError as e:
+    cprint(f"❌ Import Error: {e}", "red"); sys.exit(1)
+
+# ==========================================
+# 📏 Micro-Benchmark: parse_gemma_tags (V5 single pass) vs V4 (regex per field)
+# ==========================================
+# 用法：
+#   python src/test_scripts/bench_tag_parser.py                       # 讀 LLM_CASSETTE_PATH 的錄音
+#   python src/test_scripts/bench_tag_parser.py --cassette x.jsonl --rounds 500
+# 沒有錄音時改用合成樣本 (依 member_prompt / editor_prompt 的 Output Protocol)。
+
+
+def legacy_parse_gemma_tags(raw_text: str) -> dict:
+    """V4 原版 (每個欄位各跑一次 regex)，只留在這裡當 Benchmark 基準"""
+    if not raw_text or not isinstance(raw_text, str):
+        return None
+    blocks = re.findall(r'@@@(.*?)@@@', raw_text, re.DOTALL)
+    if not blocks:
+        return None
+    results = []
+    detected_type = "SKILL"
+    for block in blocks:
+        def extract(key_pattern):
+            pattern = fr'(?:{key_pattern}):\s*(.*?)(?=\n[A-Z_]+:|$)'
+            match = re.search(pattern, block, re.IGNORECASE | re.DOTALL)
+            if match and match.group(1) is not None:
+                return match.group(1).strip()
+            return ""
+
+        if "EFFORT" in block or "STRATEGY" in block or "EVIDENCE" in block:
+            detected_type = "GAP"
+            results.append({
+                "topic": extract("TOPIC|SKILL"),
+                "evidence_in_personal_db": {
+                    "status": extract("EVIDENCE_STATUS|STATUS") or "NOT_FOUND",
+                    "evidence_snippet": extract("EVIDENCE|PROOF") or "No evidence found."
+                },
+                "resume_reusability": {
+                    "status": extract("REUSABILITY_STATUS|REUSABILITY") or "NO_MATCH",
+                    "closest_existing_bullet": extract("BULLET|CLOSEST_BULLET")
+                },
+                "effort_assessment": {
+                    "level": extract("EFFORT_LEVEL|EFFORT") or "HIGH",
+                    "strategy": extract("STRATEGY|PLAN") or "Review required.",
+                    "estimated_action": extract("ACTION|ESTIMATED_ACTION") or "Update resume."
+                }
+            })
+        elif "RATIONALE" in block or "ACTIONABLE_STEP" in block:
+            detected_type = "ADVISOR"
+            results.append({
+                "topic": extract("TOPIC|FOCUS_AREA"),
+                "rationale": extract("RATIONALE|REASONING"),
+                "actionable_step": extract("ACTIONABLE_STEP|ACTION|INSTRUCTION"),
+                "priority": extract("PRIORITY") or "MEDIUM"
+            })
+        elif "SOURCE" in block and "CONTENT" in block:
+            detected_type = "EDITOR"
+            raw_id = extract("ID|NUM|NO")
+            results.append({
+                "ID": raw_id if raw_id else str(len(results) + 1),
+                "TOPIC": extract("TOPIC|FOCUS"),
+                "SOURCE": extract("SOURCE|TYPE"),
+                "CONTENT": extract("CONTENT|SENTENCE|BULLET"),
+                "NOTE": extract("NOTE|REASON")
+            })
+        else:
+            detected_type = "SKILL"
+            results.append({
+                "topic": extract("TOPIC"),
+                "priority": extract("PRIORITY") or "MUST_HAVE",
+                "analysis": {
+                    "hidden_bar": extract("HIDDEN_BAR|HBAR|IMPLICIT_REQUIREMENT") or "None detected.",
+                    "quote_from_jd": extract("QUOTE|SOURCE") or "Contextual."
+                }
+            })
+    if detected_type == "GAP":
+        return {"gap_analysis": results}
+    elif detected_type == "ADVISOR":
+        return {"strategic_advice": results}
+    elif detected_type == "EDITOR":
+        return {"editor_plan": results}
+    return {"required_skills": results}
+
+
+def synthetic_samples(items_per_sample=(5, 15, 30)):
+    skill = (
+        "@@@\nTOPIC: Distributed Systems {i}\nPRIORITY: MUST_HAVE\n\n"
+        "HIDDEN_BAR: Can reason about consistency vs. availability trade-offs under partition.\n\n"
+        "QUOTE: \"Experience building large-scale distributed services\"\n@@@\n\n"
+    )
+    gap = (
+        "@@@\nTOPIC: Kubernetes {i}\nEFFORT: MEDIUM\nSTRATEGY: Reframe Docker Swarm work as orchestration experience.\n"
+        "EVIDENCE_STATUS: FOUND_WEAK\nEVIDENCE_SNIPPET: Deployed containerized microservices with Docker Swarm.\n"
+        "REUSABILITY: NO_MATCH\n@@@\n\n"
+    )
+    editor = (
+        "@@@\nID: {i}\nTOPIC: Kafka\nSOURCE: TWEAK\n"
+        "CONTENT: \"Architected a high-throughput event streaming pipeline using **Kafka** and Go.\"\n"
+        "NOTE: Merged Expert E2's demand for Kafka with existing Go experience.\n@@@\n\n"
+    )
+    samples = []
+    for n in items_per_sample:
+        for template in (skill, gap, editor):
+            samples.append("".join(template.format(i=i) for i in range(n)))
+    return samples
+
+
+def load_samples(cassette_path):
+    if cassette_path and os.path.exists(cassette_path):
+        texts = [e.get("text") for e in CassetteStore(cassette_path).entries()]
+        texts = [t for t in texts if isinstance(t, str) and "@@@" in t]
+        if texts:
+            return texts, f"cassette ({cassette_path})"
+    return synthetic_samples(), "synthetic"
+
+
+def bench(func, samples, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for text in samples:
+            func(text)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark parse_gemma_tags")
+    parser.add_argument("--cassette", default=LLM_CASSETTE_PATH)
+    parser.add_argument("--rounds", type=int, default=200)
+    args = parser.parse_args()
+
+    samples, source = load_samples(args.cassette)
+    total_chars = sum(len(t) for t in samples)
+    cprint(f"📦 Samples: {len(samples)} from {source} ({total_chars:,} chars) × {args.rounds} rounds", "cyan")
+
+    # 差異檢查 (V5 有刻意修正：EVIDENCE_SNIPPET alias、依欄位名稱判斷類型)
+    diffs = [t for t in samples if parse_gemma_tags(t) != legacy_parse_gemma_tags(t)]
+    if diffs:
+        cprint(f"⚠️ Output differs from V4 on {len(diffs)}/{len(samples)} samples (expected for EVIDENCE_SNIPPET blocks)", "yellow")
+
+    bench(parse_gemma_tags, samples, 5)  # warm-up
+    legacy = bench(legacy_parse_gemma_tags, samples, args.rounds)
+    current = bench(parse_gemma_tags, samples, args.rounds)
+
+    calls = len(samples) * args.rounds
+    print(colored(f"  V4 (regex per field): {legacy:.3f}s  ({legacy / calls * 1e6:.1f} µs/call)", "white"))
+    print(colored(f"  V5 (single pass)    : {current:.3f}s  ({current / calls * 1e6:.1f} µs/call)", "green"))
+    print(colored(f"  Speedup: {legacy / current:.2f}x", "green", attrs=['bold']))
+
+
+if __name__ == "__main__":
+    main()
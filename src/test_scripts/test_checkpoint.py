@@ -0,0 +1,81 @@
+import os
+import sys
+import json
+import tempfile
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.tools.checkpoint import DossierJournal, atomic_write_json, JOURNAL_SUFFIX
+
+DOSSIER = {"basic_info": {"company": "ACME"}, "raw_content": "JD text"}
+
+
+def _write_dossier(tmp):
+    path = os.path.join(tmp, "job.json")
+    atomic_write_json(path, DOSSIER)
+    return path
+
+
+def test_atomic_write_leaves_no_temp_files():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = _write_dossier(tmp)
+        atomic_write_json(path, {**DOSSIER, "v": 2})
+        assert os.listdir(tmp) == ["job.json"]
+        with open(path, encoding="utf-8") as f:
+            assert json.load(f)["v"] == 2
+
+
+def test_atomic_write_failure_keeps_old_file():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = _write_dossier(tmp)
+        try:
+            atomic_write_json(path, {"bad": object()})
+        except TypeError:
+            pass
+        assert os.listdir(tmp) == ["job.json"]
+        with open(path, encoding="utf-8") as f:
+            assert json.load(f) == DOSSIER
+
+
+def test_atomic_write_keeps_file_mode():
+    """mkstemp 建的 temp 檔是 0600：換檔後要沿用原檔權限，新檔照 umask"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = _write_dossier(tmp)
+        umask = os.umask(0)
+        os.umask(umask)
+        assert os.stat(path).st_mode & 0o777 == 0o666 & ~umask
+
+        os.chmod(path, 0o640)
+        atomic_write_json(path, {**DOSSIER, "v": 2})
+        assert os.stat(path).st_mode & 0o777 == 0o640
+
+
+def test_crash_recovery_replays_journal():
+    """append 之後還沒 compact 就當掉 → 下次 load() 會把結果補回來；最後一行寫一半的忽略"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = _write_dossier(tmp)
+        journal = DossierJournal(path)
+        journal.append(["expert_council", "skill_analysis", "E2"], {"required_skills": [{"topic": "Rust"}]})
+        journal.append(["expert_council", "gap_analysis", "E2"], {"gap_analysis": []})
+        with open(path + JOURNAL_SUFFIX, "a", encoding="utf-8") as f:
+            f.write('{"path": ["expert_council", "gap_analysis", "E5"], "val')
+
+        dossier = DossierJournal(path).load()
+        council = dossier["expert_council"]
+        assert council["skill_analysis"]["E2"]["required_skills"][0]["topic"] == "Rust"
+        assert "E5" not in council["gap_analysis"]
+
+
+def test_compact_writes_dossier_and_drops_journal():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = _write_dossier(tmp)
+        journal = DossierJournal(path)
+        dossier = journal.load()
+        dossier.setdefault("expert_council", {})["skill_analysis"] = {"E1": {"required_skills": []}}
+        journal.append(["expert_council", "skill_analysis", "E1"], {"required_skills": []})
+        journal.compact(dossier)
+
+        assert not os.path.exists(path + JOURNAL_SUFFIX)
+        with open(path, encoding="utf-8") as f:
+            assert json.load(f)["expert_council"]["skill_analysis"]["E1"] == {"required_skills": []}
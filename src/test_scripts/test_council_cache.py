@@ -0,0 +1,72 @@
+import os
+import sys
+import json
+import time
+import tempfile
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.agents.cache_manager import CouncilCache, council_fingerprint, MIGRATED_MARKER
+
+JD = "Senior Rust Engineer. Must know lifetimes, async and CUDA."
+RESULT = {"required_skills": [{"topic": "Rust"}]}
+
+
+def _cache(tmp, **kwargs):
+    return CouncilCache(db_path=os.path.join(tmp, "council.sqlite3"), legacy_dir=os.path.join(tmp, "legacy"), **kwargs)
+
+
+def test_save_and_get_across_instances():
+    with tempfile.TemporaryDirectory() as tmp:
+        _cache(tmp).save(JD, "E2", "SKILL", RESULT)
+        cache = _cache(tmp)  # 新的 Process：Memory LRU 是空的，要從 SQLite 讀
+        assert cache.get(JD, "E2", "SKILL") == RESULT
+        assert cache.get(JD, "E2", "SKILL") == RESULT
+        assert cache.stats["disk_hits"] == 1 and cache.stats["memory_hits"] == 1
+        assert cache.get(JD, "E1", "SKILL") is None
+
+
+def test_fingerprint_invalidates():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = _cache(tmp)
+        old_fp = council_fingerprint(prompt="p1", model="gemma")
+        cache.save(JD, "E2", "SKILL", RESULT, fingerprint=old_fp)
+        assert cache.get(JD, "E2", "SKILL", fingerprint=old_fp) == RESULT
+        assert cache.get(JD, "E2", "SKILL", fingerprint=council_fingerprint(prompt="p2", model="gemma")) is None
+
+
+def test_legacy_json_migration():
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = os.path.join(tmp, "legacy")
+        os.makedirs(legacy)
+        key = _cache(tmp)._get_key(JD, "E2", "SKILL")
+        with open(os.path.join(legacy, f"{key}.json"), "w") as f:
+            json.dump(RESULT, f)
+        with open(os.path.join(legacy, "broken.json"), "w") as f:
+            f.write("{not json")
+
+        cache = _cache(tmp)
+        assert cache.get(JD, "E2", "SKILL") == RESULT
+        assert os.path.exists(os.path.join(legacy, MIGRATED_MARKER))
+        assert os.path.exists(os.path.join(legacy, f"{key}.json"))  # 原檔保留
+
+
+def test_legacy_ttl_uses_file_mtime():
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy = os.path.join(tmp, "legacy")
+        os.makedirs(legacy)
+        path = os.path.join(legacy, f"{_cache(tmp)._get_key(JD, 'E2', 'SKILL')}.json")
+        with open(path, "w") as f:
+            json.dump(RESULT, f)
+        old = time.time() - 40 * 86400
+        os.utime(path, (old, old))
+        assert _cache(tmp, ttl_days=30).get(JD, "E2", "SKILL") is None
+
+
+def test_memory_lru_bound():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = _cache(tmp, memory_entries=2)
+        for i in range(5):
+            cache.save(f"{JD} #{i}", "E2", "SKILL", RESULT)
+        assert len(cache._memory) == 2
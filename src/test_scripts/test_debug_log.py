@@ -0,0 +1,51 @@
+import os
+import sys
+import json
+import tempfile
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# 預設 Log 路徑導到暫存目錄 (要在 import debug_log 之前設定，之後 import Gateway 的測試才不會寫進 data/)
+os.environ.setdefault("GATEWAY_LOG_PATH", os.path.join(tempfile.mkdtemp(prefix="debug_log_test_"), "debug_gemma.log"))
+
+from src.tools.debug_log import GatewayDebugLog
+
+
+def _lines(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_records_flushed_on_close_and_written_after():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "debug.log")
+        log = GatewayDebugLog(path=path, compress=False)
+        log.record(status="ok", attempt=1)
+        log.record(status="error", attempt=2, error="boom")
+        log.close()
+        assert [entry["attempt"] for entry in _lines(path)] == [1, 2]
+
+        # Writer Thread 已經停了 → 之後的紀錄同步寫進檔案，不能消失
+        log.record(status="invalid", attempt=3)
+        log.close()
+        assert [entry["attempt"] for entry in _lines(path)] == [1, 2, 3]
+
+
+def test_sampling_keeps_failures():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "debug.log")
+        log = GatewayDebugLog(path=path, compress=False, sample_rate=0.0)
+        log.record(status="ok", attempt=1)
+        log.record(status="error", attempt=2)
+        log.close()
+        assert [entry["status"] for entry in _lines(path)] == ["error"]
+
+
+def test_raw_response_truncated():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "debug.log")
+        log = GatewayDebugLog(path=path, compress=False, raw_chars=5)
+        log.record(status="ok", raw_response="abcdefghij")
+        log.close()
+        assert _lines(path)[0]["raw_response"] == "abcde...[TRUNCATED]"
@@ -0,0 +1,26 @@
+import os
+import sys
+import pytest
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# p3_council 缺套件時會直接 sys.exit(1)，先確認環境裡有
+for _module in ("chromadb", "arxiv", "duckduckgo_search"):
+    pytest.importorskip(_module)
+
+from src.phases import p3_council
+
+
+def _skill(topic, bar):
+    return {"topic": topic, "analysis": {"hidden_bar": bar}}
+
+
+def test_same_topic_different_bar_kept():
+    queries = p3_council._evidence_queries([_skill("Rust", "Ship async services"), _skill("Rust", "Write unsafe FFI")])
+    assert queries == {"Rust": "Rust: Ship async services", "Rust (#2)": "Rust: Write unsafe FFI"}
+
+
+def test_identical_queries_collapse():
+    queries = p3_council._evidence_queries([_skill("Rust", "Ship"), _skill("Go", "Ship"), _skill("Rust", "Ship")])
+    assert queries == {"Rust": "Rust: Ship", "Go": "Go: Ship"}
@@ -0,0 +1,38 @@
+import os
+import re
+import sys
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.test_scripts._fake_gateway import FakeModel, make_gateway, tag_block
+
+GARBAGE = "nothing parseable here"
+
+
+def _reply(request):
+    """job-N → 帶 topic T-N 的 Tag 區塊；job-bad (以及之後的修復 Prompt) 一律回垃圾"""
+    match = re.search(r"job-(\d+)", request)
+    if "job-bad" in request or GARBAGE in request or not match:
+        return GARBAGE
+    return tag_block(f"T-{match.group(1)}")
+
+
+def test_results_follow_input_order_with_per_item_errors():
+    model = FakeModel("gm-model", _reply)
+    gateway = make_gateway([model])
+    prompts = ["job-0", "job-1", "job-bad", "job-3", "job-4"]
+
+    results = gateway.generate_many(prompts, max_workers=3)
+
+    assert len(results) == len(prompts)
+    assert results[2].get("error")
+    topics = [r["required_skills"][0]["topic"] for i, r in enumerate(results) if i != 2]
+    assert topics == ["T-0", "T-1", "T-3", "T-4"]
+
+
+def test_item_forms_and_empty_batch():
+    gateway = make_gateway([FakeModel("gm-forms", _reply)])
+    assert gateway.generate_many([]) == []
+    results = gateway.generate_many(["job-7", ("job-8", None), {"prompt": "job-9", "use_gemma": True}])
+    assert [r["required_skills"][0]["topic"] for r in results] == ["T-7", "T-8", "T-9"]
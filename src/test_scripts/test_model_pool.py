@@ -0,0 +1,45 @@
+import os
+import sys
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+import pytest
+import google.generativeai as genai
+from src.tools import model_pool
+from src.tools.model_pool import ModelPool
+
+
+def test_each_key_gets_its_own_client():
+    pool = ModelPool(["mp-key-a", "mp-key-b"], ["mp-gemma"], rpm=30, tpm=15000)
+    clients = [member.model._client for member in pool.members]
+    assert all(client is not None for client in clients)
+    assert clients[0] is not clients[1]
+    assert len({member.key_id for member in pool.members}) == 2
+    # 沒有 Key 時沿用 SDK 的預設 client (第一次呼叫才建立)
+    assert ModelPool([], ["mp-gemma"], rpm=30, tpm=15000).members[0].model._client is None
+
+
+def test_binding_fails_loudly_when_sdk_changes():
+    class _NoClientModel:
+        def __init__(self, model_name):
+            self.model_name = model_name
+
+    original = model_pool.genai.GenerativeModel
+    model_pool.genai.GenerativeModel = _NoClientModel
+    try:
+        with pytest.raises(RuntimeError, match=genai.__version__):
+            model_pool._model_for_key("mp-gemma", "mp-key")
+    finally:
+        model_pool.genai.GenerativeModel = original
+
+
+def test_rotation_skips_throttled_member():
+    pool = ModelPool(["mp-key-c", "mp-key-d"], ["mp-gemma"], rpm=30, tpm=15000)
+    first = pool.acquire()
+    pool.release(first)
+    pool.mark_unavailable(first, 60)
+    second = pool.acquire()
+    assert second is not first
+    pool.release(second)
+
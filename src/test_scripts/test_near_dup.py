@@ -0,0 +1,67 @@
+import os
+import sys
+import tempfile
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.tools.near_dup import MinHasher, NearDuplicateIndex, shingles
+from src.agents.cache_manager import CouncilCache
+
+_TECH = ["rust", "kubernetes", "grpc", "postgres", "kafka", "terraform", "cuda", "tracing", "python", "redis"]
+_VERBS = ["design", "operate", "debug", "scale", "profile", "review", "migrate", "secure"]
+BASE_JD = "Posted 2026-09-01 in Munich. " + " ".join(
+    f"You will {_VERBS[i % len(_VERBS)]} {_TECH[i % len(_TECH)]} and {_TECH[(i * 3 + 1) % len(_TECH)]} services for team {chr(97 + i % 26)}."
+    for i in range(60)
+)
+REPOST = BASE_JD.replace("Posted 2026-09-01 in Munich.", "Posted 2026-10-01 in Berlin.")
+OTHER_JD = " ".join(f"Bake sourdough loaf {chr(97 + i % 26)}, greet guest {chr(98 + i % 24)} and order flour." for i in range(60))
+
+
+def test_signature_is_stable_and_digits_normalized():
+    hasher = MinHasher(num_perm=64)
+    assert hasher.signature(BASE_JD) == MinHasher(num_perm=64).signature(BASE_JD)
+    assert shingles("Posted 2026-10-01 in Berlin now") == shingles("Posted 2025-01-31 in Berlin now")
+
+
+def test_repost_found_unrelated_ignored():
+    with tempfile.TemporaryDirectory() as tmp:
+        index = NearDuplicateIndex(os.path.join(tmp, "nd.sqlite3"), threshold=0.8)
+        index.add(BASE_JD)
+        match = index.query(REPOST)
+        assert match and match["jd_hash"] == NearDuplicateIndex.doc_id(BASE_JD)
+        assert match["similarity"] >= 0.8
+        assert index.query(OTHER_JD) is None
+        assert index.query(BASE_JD) is None  # 自己不算
+
+
+def test_index_persists():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "nd.sqlite3")
+        NearDuplicateIndex(path, threshold=0.8).add(BASE_JD)
+        assert NearDuplicateIndex(path, threshold=0.8).query(REPOST) is not None
+
+
+def test_council_cache_reuses_repost_results():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = CouncilCache(db_path=os.path.join(tmp, "council.sqlite3"), legacy_dir=None)
+        cache.save(BASE_JD, "E2", "SKILL", {"required_skills": []}, fingerprint="fp")
+        near = cache.find_near_duplicate(REPOST)
+        assert near is not None
+        assert cache.get(REPOST, "E2", "SKILL", fingerprint="fp") is None
+        assert cache.get(REPOST, "E2", "SKILL", fingerprint="fp", near_dup_hash=near["jd_hash"]) == {"required_skills": []}
+        assert cache.stats["near_dup_hits"] == 1
+
+
+def test_on_near_dup_only_when_near_dup_entry_served():
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = CouncilCache(db_path=os.path.join(tmp, "council.sqlite3"), legacy_dir=None)
+        cache.save(BASE_JD, "E2", "SKILL", {"required_skills": []}, fingerprint="fp")
+        cache.save(REPOST, "E5", "SKILL", {"required_skills": [{"topic": "own"}]}, fingerprint="fp")
+        near_hash = cache.find_near_duplicate(REPOST)["jd_hash"]
+        served = []
+        cache.get(REPOST, "E5", "SKILL", fingerprint="fp", near_dup_hash=near_hash, on_near_dup=lambda *unit: served.append(unit))
+        cache.get(REPOST, "E1", "SKILL", fingerprint="fp", near_dup_hash=near_hash, on_near_dup=lambda *unit: served.append(unit))
+        assert served == []  # 自己有結果 / 兩邊都沒有 → 不算沿用
+        cache.get(REPOST, "E2", "SKILL", fingerprint="fp", near_dup_hash=near_hash, on_near_dup=lambda *unit: served.append(unit))
+        assert served == [("E2", "SKILL")]
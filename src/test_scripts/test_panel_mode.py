@@ -0,0 +1,100 @@
+import os
+import sys
+import tempfile
+from types import SimpleNamespace
+import pytest
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# p3_council 缺套件時會直接 sys.exit(1)，先確認環境裡有
+for _module in ("chromadb", "arxiv", "duckduckgo_search"):
+    pytest.importorskip(_module)
+
+from src.phases import p3_council
+from src.agents.cache_manager import CouncilCache
+from src.agents.character_setting.prompt_loader import PromptFactory
+from src.tools.model_gateway import parse_gemma_tags
+from src.tools.schemas import PanelSkillExtractionReport
+
+JD = "Senior Rust Engineer. Async, tokio, gRPC. PhD preferred."
+DOSSIER = {"basic_info": {"company": "ACME", "role": "Rust Engineer"}, "raw_content": JD, "expert_council": {}}
+
+
+def _block(expert, topic):
+    return f"@@@\nEXPERT: {expert}\nTOPIC: {topic}\nPRIORITY: MUST_HAVE\nHIDDEN_BAR: bar\nQUOTE: quote\n@@@\n"
+
+
+def _factory():
+    return PromptFactory(root_dir=os.path.abspath(os.path.join(os.path.dirname(__file__), "../agents")))
+
+
+class _PanelGateway:
+    """把固定的 @@@ 文字丟進 parse_gemma_tags (跟真的 Gateway 一樣走 Tag 解析)；reply=None 時回傳 error dict"""
+
+    def __init__(self, reply):
+        self.reply = reply
+        self.prompts = []
+
+    def model_fingerprint(self):
+        return "gemma-test"
+
+    def prompt_budget(self, use_gemma=True):
+        return 100000
+
+    def generate(self, prompt, validator, schema=None, on_item=None):
+        self.prompts.append(prompt)
+        if self.reply is None:
+            return {"error": "Max retries reached", "failure_reason": "429 quota", "debug_dump": ""}
+        return PanelSkillExtractionReport.model_validate(parse_gemma_tags(self.reply)).model_dump()
+
+
+def test_tags_keep_expert_field():
+    report = parse_gemma_tags(_block("[e2]", "Rust") + _block("E5", "Publications"))
+    assert [item["expert"] for item in report["required_skills"]] == ["E2", "E5"]
+    PanelSkillExtractionReport.model_validate(report)
+
+
+def test_split_by_expert():
+    report = {"required_skills": [
+        {"topic": "Rust", "expert": "E2"},
+        {"topic": "Papers", "expert": "Expert E5"},
+        {"topic": "Tokio", "expert": "E2"},
+        {"topic": "Visa", "expert": "E4"},   # 不在這組 → 忽略
+        {"topic": "???", "expert": ""},
+    ]}
+    split = p3_council._split_panel_report(report, ["E2", "E5"])
+    assert split == {
+        "E2": {"required_skills": [{"topic": "Rust"}, {"topic": "Tokio"}]},
+        "E5": {"required_skills": [{"topic": "Papers"}]},
+    }
+
+
+def test_panel_prompt_lists_every_persona_once_per_jd():
+    factory = _factory()
+    prompt = factory.create_panel_prompt(["E2", "E5"], "SKILL", {"raw_jd_text": JD, "job_title": "Rust Engineer", "company_name": "ACME"})
+    assert prompt.count(JD) == 1
+    for eid in ("E2", "E5"):
+        assert factory.personas[eid]["role_name"] in prompt
+    assert factory.panel_fingerprint(["E2"])["E2"] != factory.fingerprint("E2", "SKILL")  # 與單人模式的 Cache 分開
+
+
+def test_missing_expert_left_for_solo_fallback():
+    with tempfile.TemporaryDirectory() as tmp:
+        p3_council.council_memory = CouncilCache(db_path=os.path.join(tmp, "council.sqlite3"), legacy_dir=None)
+        gateway = _PanelGateway(_block("E2", "Rust") + _block("E2", "Tokio"))
+        results = p3_council._step1_panel_extraction(["E2", "E5"], DOSSIER, gateway, _factory())
+        assert list(results) == ["E2"] and len(results["E2"]["required_skills"]) == 2
+        assert "expert" not in results["E2"]["required_skills"][0]
+
+        # 第二次：E2 直接命中 Cache，只有 E5 還沒有結果
+        results = p3_council._step1_panel_extraction(["E2", "E5"], DOSSIER, gateway, _factory())
+        assert list(results) == ["E2"] and len(gateway.prompts) == 2
+
+
+def test_gateway_error_dict_saves_nothing():
+    with tempfile.TemporaryDirectory() as tmp:
+        p3_council.council_memory = CouncilCache(db_path=os.path.join(tmp, "council.sqlite3"), legacy_dir=None)
+        results = p3_council._step1_panel_extraction(["E2", "E5"], DOSSIER, _PanelGateway(None), _factory())
+        assert results == {}
+        assert p3_council.council_memory.stats["saves"] == 0
@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import tempfile
+from types import SimpleNamespace
+import pytest
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+# p3_council 缺套件時會直接 sys.exit(1)，先確認環境裡有
+for _module in ("chromadb", "arxiv", "duckduckgo_search"):
+    pytest.importorskip(_module)
+
+from src.phases import p3_council
+from src.agents.cache_manager import CouncilCache, SkillGapMemo
+from src.agents.character_setting.prompt_loader import PromptFactory
+from src.tools.run_manifest import RunManifest
+from src.tools.schemas import SkillExtractionReport
+
+SKILL_RESULT = {"required_skills": [{"topic": "Rust", "quick_check": "MATCH", "analysis": {"hidden_bar": "Ship async services"}}]}
+GAP_RESULT = {"gap_analysis": [{"topic": "Rust", "evidence_in_personal_db": {"status": "FOUND"}}]}
+DB_CONTEXT = {"resume": "Rust services at ACME", "user_profile_short": "Backend engineer", "fingerprint": "ctx-v1"}
+
+
+class _StubGateway:
+    """依 Schema 回固定結果；fail_modes 裡的 Step 模擬重試用盡 (回傳 error dict，不丟例外)"""
+
+    def __init__(self, model="gemma-test", fail_modes=()):
+        self.model = model
+        self.fail_modes = set(fail_modes)
+        self.calls = []
+        self.gemma_pool = SimpleNamespace(members=[object()])
+
+    def model_fingerprint(self):
+        return self.model
+
+    def prompt_budget(self, use_gemma=True):
+        return 100000
+
+    def generate(self, prompt, validator, schema=None, on_item=None):
+        mode = "SKILL" if schema is SkillExtractionReport else "GAP_EFFORT"
+        self.calls.append(mode)
+        if mode in self.fail_modes:
+            return {"error": "Max retries reached", "failure_reason": "429 quota", "debug_dump": ""}
+        return SKILL_RESULT if mode == "SKILL" else GAP_RESULT
+
+
+def _setup(tmp):
+    """Council Cache / Skill Memo / 履歷檢索都換成暫存目錄裡的，寫一份只找 E2 的 Dossier"""
+    p3_council.council_memory = CouncilCache(db_path=os.path.join(tmp, "council.sqlite3"), legacy_dir=None)
+    p3_council.skill_gap_memo = SkillGapMemo(db_path=os.path.join(tmp, "memo.sqlite3"))
+    p3_council.db_connector = SimpleNamespace(get_resume_evidence_context=lambda queries: None)
+    path = os.path.join(tmp, "job.json")
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump({
+            "basic_info": {"company": "ACME", "role": "Rust Engineer"},
+            "raw_content": "Senior Rust Engineer. Async, tokio, gRPC.",
+            "triage_result": {"referral_analysis": {"E2": {"relevance": 9, "note": "must"}}},
+        }, f)
+    return path, RunManifest(os.path.join(tmp, "manifest.sqlite3"))
+
+
+def _run(gateway, manifest, path):
+    factory = PromptFactory(root_dir=os.path.abspath(os.path.join(os.path.dirname(__file__), "../agents")))
+    p3_council.Phase3Scheduler(gateway, factory, DB_CONTEXT, workers=1, manifest=manifest).run([path])
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_gateway_error_dict_is_failed_not_done():
+    with tempfile.TemporaryDirectory() as tmp:
+        path, manifest = _setup(tmp)
+        dossier = _run(_StubGateway(fail_modes={"SKILL"}), manifest, path)
+
+        assert "E2" not in dossier["expert_council"]["skill_analysis"]
+        assert manifest.units("job.json")[("E2", "SKILL")]["state"] == RunManifest.FAILED
+        assert manifest.failed_dossiers() == {"job.json"}
+        assert p3_council.council_memory.stats["saves"] == 0
+
+        gateway = _StubGateway()  # --retry-failed 會再跑一次，而且不會被 Cache 裡的錯誤結果擋住
+        dossier = _run(gateway, manifest, path)
+        assert gateway.calls == ["SKILL", "GAP_EFFORT"]
+        assert dossier["expert_council"]["gap_analysis"]["E2"] == GAP_RESULT
+
+
+def test_gap_error_dict_keeps_dossier_pending():
+    with tempfile.TemporaryDirectory() as tmp:
+        path, manifest = _setup(tmp)
+        dossier = _run(_StubGateway(fail_modes={"GAP_EFFORT"}), manifest, path)
+
+        assert dossier["expert_council"]["skill_analysis"]["E2"] == SKILL_RESULT
+        assert "E2" not in dossier["expert_council"]["gap_analysis"]
+        assert manifest.units("job.json")[("E2", "GAP_EFFORT")]["state"] == RunManifest.FAILED
+        assert manifest.failed_dossiers() == {"job.json"}
+
+        gateway = _StubGateway()
+        _run(gateway, manifest, path)
+        assert gateway.calls == ["GAP_EFFORT"]  # Step 1 已 DONE，只補 Step 2
+
+
+def test_completed_dossier_skipped_until_fingerprint_changes():
+    with tempfile.TemporaryDirectory() as tmp:
+        path, manifest = _setup(tmp)
+        _run(_StubGateway(), manifest, path)
+
+        gateway = _StubGateway()
+        _run(gateway, manifest, path)
+        assert gateway.calls == []  # 檔案與指紋都沒變 → 整份跳過
+
+        gateway = _StubGateway(model="gemma-next")
+        _run(gateway, manifest, path)
+        assert gateway.calls == ["SKILL", "GAP_EFFORT"]  # 換 Model → Manifest 與 Cache 都失效
+
+
+def test_force_refresh_bypasses_manifest():
+    with tempfile.TemporaryDirectory() as tmp:
+        path, manifest = _setup(tmp)
+        _run(_StubGateway(), manifest, path)
+        p3_council.FORCE_REFRESH = True
+        try:
+            gateway = _StubGateway()
+            _run(gateway, manifest, path)
+        finally:
+            p3_council.FORCE_REFRESH = False
+        assert gateway.calls == ["SKILL", "GAP_EFFORT"]
@@ -0,0 +1,68 @@
+import os
+import sys
+import shutil
+import tempfile
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.agents.character_setting.prompt_loader import PromptFactory, load_personas, MODE_SCHEMAS
+
+AGENTS_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "../agents"))
+CONTEXT = {
+    "job_title": "Rust Engineer", "company_name": "ACME", "raw_jd_text": "Senior Rust Engineer. Async, tokio.",
+    "previous_phase_memory": {"required_skills": [{"topic": "Rust"}]}, "resume_db_text": "Rust at ACME",
+}
+
+
+def test_matches_full_render():
+    factory = PromptFactory(root_dir=AGENTS_DIR)
+    for mode in ("SKILL", "GAP_EFFORT"):
+        schema_var, schema = MODE_SCHEMAS[mode]
+        expected = factory.env.get_template("member_prompt.md.j2").render(
+            {**factory.personas["E2"], **CONTEXT, "mode": mode, schema_var: schema}
+        )
+        assert factory.create_expert_prompt("E2", mode, CONTEXT) == expected
+        assert factory.create_expert_prompt("E2", mode, CONTEXT) == expected  # 第二次走 memoized mode / Schema
+
+
+def test_explicit_mode_wins_over_context():
+    factory = PromptFactory(root_dir=AGENTS_DIR)
+    prompt = factory.create_expert_prompt("E2", "SKILL", {**CONTEXT, "mode": "GAP_EFFORT", "skill_schema": "bogus"})
+    assert prompt == factory.create_expert_prompt("E2", "SKILL", CONTEXT)
+    assert "# Phase: SKILL" in prompt and "# Phase: GAP_EFFORT" not in prompt
+
+
+def test_context_overrides_persona():
+    """與原本的合併順序相同：Context 可以蓋 Persona 設定 (例如 role_name)"""
+    factory = PromptFactory(root_dir=AGENTS_DIR)
+    original = factory.personas["E2"]["role_name"]
+    prompt = factory.create_expert_prompt("E2", "SKILL", {**CONTEXT, "role_name": "Guest Reviewer"})
+    assert "Guest Reviewer" in prompt and original not in prompt
+    assert factory.personas["E2"]["role_name"] == original  # 共用的 Persona 沒被改到
+
+
+def test_condition_only_variables_follow_context():
+    """只出現在 {% if %} 裡的 Context 變數，每次呼叫都要照當次的值渲染"""
+    with tempfile.TemporaryDirectory() as tmp:
+        shutil.copytree(os.path.join(AGENTS_DIR, "character_setting"), os.path.join(tmp, "character_setting"))
+        with open(os.path.join(tmp, "character_setting", "probe.md.j2"), "w", encoding="utf-8") as f:
+            f.write("{{ role_name }}:{% if urgent %} URGENT{% endif %} {{ raw_jd_text }}")
+        factory = PromptFactory(root_dir=tmp)
+        persona, pinned = factory.expert_static_vars("E2", "SKILL")
+        assert factory._render("probe.md.j2", {"urgent": True, "raw_jd_text": "a"}, persona, pinned).endswith(": URGENT a")
+        assert factory._render("probe.md.j2", {"urgent": False, "raw_jd_text": "b"}, persona, pinned).endswith(": b")
+
+
+def test_environment_and_personas_shared():
+    a, b = PromptFactory(root_dir=AGENTS_DIR), PromptFactory(root_dir=AGENTS_DIR)
+    assert a.env is b.env
+    assert a.env.get_template("member_prompt.md.j2") is b.env.get_template("member_prompt.md.j2")
+    assert a.personas is b.personas is load_personas()
+
+
+def test_fingerprint_stable_and_mode_specific():
+    a, b = PromptFactory(root_dir=AGENTS_DIR), PromptFactory(root_dir=AGENTS_DIR)
+    assert a.fingerprint("E2", "SKILL") == b.fingerprint("E2", "SKILL")
+    assert a.fingerprint("E2", "SKILL") != a.fingerprint("E2", "GAP_EFFORT")
+    assert a.fingerprint("E2", "SKILL") != a.fingerprint("E5", "SKILL")
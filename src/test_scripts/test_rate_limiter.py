@@ -0,0 +1,46 @@
+import os
+import sys
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.tools.rate_limiter import TokenBucket, ModelRateLimiter, get_rate_limiter, is_quota_error
+
+
+def test_bucket_reserve_and_refill():
+    bucket = TokenBucket(capacity=10, refill_rate=1.0)
+    assert bucket.reserve(10, now=bucket.updated_at) == 0.0
+    # 餘額 0 → 再借 5 要等 5 秒
+    assert bucket.reserve(5, now=bucket.updated_at) == 5.0
+    # 10 秒後補回 10，扣掉欠款 5 還剩 5
+    later = bucket.updated_at + 10
+    assert bucket.reserve(5, now=later) == 0.0
+
+
+def test_bucket_caps_oversized_request():
+    """單次需求超過容量時只扣到容量 (不然永遠等不到)"""
+    bucket = TokenBucket(capacity=10, refill_rate=1.0)
+    assert bucket.reserve(1000, now=bucket.updated_at) == 0.0
+    assert bucket.tokens == 0.0
+
+
+def test_limiter_fifo_reservations():
+    limiter = ModelRateLimiter("test-fifo", rpm=60, tpm=1000)
+    now = limiter._requests.updated_at
+    waits = [max(limiter._requests.reserve(1, now), limiter._tokens.reserve(400, now)) for _ in range(4)]
+    # 1000 TPM = 16.7 tokens/s：前兩個免等，之後依序排隊
+    assert waits[0] == 0.0 and waits[1] == 0.0
+    assert 0 < waits[2] < waits[3]
+
+
+def test_throttle_and_headroom():
+    limiter = ModelRateLimiter("test-throttle", rpm=60, tpm=1000)
+    assert limiter.headroom() > 0.99
+    limiter.throttle(quota_exceeded=True)
+    assert limiter.headroom() < 0.01
+
+
+def test_registry_and_quota_detection():
+    assert get_rate_limiter("test-shared", rpm=5, tpm=50) is get_rate_limiter("test-shared")
+    assert is_quota_error(Exception("429 Resource has been exhausted (e.g. check quota)."))
+    assert not is_quota_error(Exception("503 Service Unavailable"))
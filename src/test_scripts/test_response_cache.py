@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+import tempfile
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.test_scripts._fake_gateway import FakeModel, make_gateway, tag_block
+from src.tools import model_gateway
+from src.tools.sqlite_store import SQLiteLRUStore
+from src.tools.response_cache import ResponseCache
+
+
+def test_store_lru_eviction():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteLRUStore(os.path.join(tmp, "lru.sqlite3"), max_entries=3)
+        for i in range(3):
+            store.set(f"k{i}", {"v": i})
+        store.get("k0")  # k0 變成最近使用
+        for i in range(3, 25):
+            store.set(f"k{i}", {"v": i})
+        store.evict()
+        assert store.stats()["entries"] == 3
+        assert store.get("k1") is None
+
+
+def test_store_ttl():
+    with tempfile.TemporaryDirectory() as tmp:
+        store = SQLiteLRUStore(os.path.join(tmp, "ttl.sqlite3"), ttl=60)
+        store.set("old", {"v": 1}, created_at=time.time() - 120)
+        store.set("new", {"v": 2})
+        assert store.get("old") is None
+        assert store.get("new") == {"v": 2}
+
+
+def test_store_degrades_when_unwritable():
+    with tempfile.TemporaryDirectory() as tmp:
+        blocker = os.path.join(tmp, "not_a_dir")
+        open(blocker, "w").close()
+        store = SQLiteLRUStore(os.path.join(blocker, "cache.sqlite3"))
+        store.set("k", {"v": 1})  # 不能丟例外
+        assert store.get("k") is None
+        assert store.stats() == {"entries": 0, "bytes": 0}
+
+
+def test_cache_keyed_on_serving_model():
+    """主要 Model 429 → 備援 Model 產生的結果要記在備援 Model 名下，不能冒充主要 Model"""
+    with tempfile.TemporaryDirectory() as tmp:
+        primary = FakeModel("rc-primary", [Exception("429 Resource has been exhausted (quota)")])
+        fallback = FakeModel("rc-fallback", [tag_block("Rust")])
+        gateway = make_gateway([primary, fallback], cache_dir=tmp)
+
+        result = gateway.generate("prompt-A", None, stream=False)
+        assert result["required_skills"][0]["topic"] == "Rust"
+
+        cache = model_gateway.response_cache
+        config = model_gateway.genai.types.GenerationConfig(temperature=0.2)
+        assert cache.get(cache.make_key("rc-primary", "prompt-A", None, config)) is None
+        assert cache.get(cache.make_key("rc-fallback", "prompt-A", None, config)) == result
+
+        # 重跑：Cache 命中，不再呼叫任何 Model
+        assert gateway.generate("prompt-A", None, stream=False) == result
+        assert primary.calls == 1 and fallback.calls == 1
+
+
+def test_error_results_are_not_cached():
+    with tempfile.TemporaryDirectory() as tmp:
+        model = FakeModel("rc-broken", ["no tags here"] * 4)
+        gateway = make_gateway([model], cache_dir=tmp)
+        result = gateway.generate("prompt-B", lambda data: (False, "always invalid"), stream=False)
+        assert result.get("error")
+        assert model_gateway.response_cache.store.stats()["entries"] == 0
+
+
+def test_model_identity_includes_generation_config():
+    genai = model_gateway.genai
+    cold = genai.GenerativeModel("rc-direct", generation_config={"temperature": 0.1})
+    warm = genai.GenerativeModel("rc-direct", generation_config={"temperature": 0.9})
+    assert ResponseCache.model_identity(cold) == ("models/rc-direct", {"temperature": 0.1})
+    keys = {ResponseCache.make_key(name, "p", "safe_generate_json", config)
+            for name, config in map(ResponseCache.model_identity, (cold, warm))}
+    assert len(keys) == 2
+    # 沒有 model_name / GenerationConfig 的物件 (例如只有 generate_content 的 Gateway) → 不用 Cache
+    assert ResponseCache.model_identity(FakeModel("rc-unknown")) == (None, None)
+    assert ResponseCache.model_identity(object()) == (None, None)
@@ -0,0 +1,89 @@
+import os
+import sys
+import time
+import random
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.test_scripts._fake_gateway import FakeModel, make_gateway, tag_block
+from src.tools.retry_policy import RetryPolicy, CircuitBreaker, CircuitOpenError, get_circuit_breaker, parse_retry_hint
+
+QUOTA_ERROR = Exception("429 Resource has been exhausted (e.g. check quota).")
+
+
+def _open(breaker):
+    for _ in range(breaker.failure_threshold):
+        breaker.record_failure()
+    assert breaker.is_open()
+
+
+def test_backoff_honours_hint_and_ceiling():
+    policy = RetryPolicy(base_delay=2, max_delay=10, rng=random.Random(0))
+    assert all(0 <= policy.backoff(5) <= 10 for _ in range(50))
+    assert policy.backoff(0, Exception("Please retry in 12s")) >= 12
+    assert parse_retry_hint(Exception("retry_delay { seconds: 31 }")) == 31
+
+
+def test_breaker_open_half_open_close():
+    breaker = CircuitBreaker("t-cycle", failure_threshold=2, reset_timeout=0.05)
+    _open(breaker)
+    try:
+        breaker.before_call()
+    except CircuitOpenError:
+        pass
+    else:
+        raise AssertionError("expected CircuitOpenError")
+    time.sleep(0.06)
+    breaker.before_call()           # 冷卻結束：放一個探測請求
+    assert breaker.is_open()        # 探測進行中，其他人仍被擋
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_quota_error_leaves_breaker_alone():
+    """429 不能把 HALF_OPEN 的 Breaker 關掉，也不能清掉失敗計數；只把探測名額還回去"""
+    breaker = CircuitBreaker("t-quota", failure_threshold=2, reset_timeout=0.05)
+    _open(breaker)
+    time.sleep(0.06)
+    breaker.before_call()           # 探測請求 → 收到 429
+    breaker.release()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call()           # 探測名額可以再借
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+def test_gateway_429_does_not_reset_failures():
+    model = FakeModel("rp-quota", [Exception("503 Service Unavailable"), QUOTA_ERROR])
+    gateway = make_gateway([model])
+    breaker = get_circuit_breaker("rp-quota")
+    gateway._generate_with_retry_logic(gateway.gemma_pool, "p", lambda d: (True, ""), max_retries=0)
+    gateway._generate_with_retry_logic(gateway.gemma_pool, "p", lambda d: (True, ""), max_retries=0)
+    assert breaker.failures == 1
+
+
+def test_gateway_skips_open_model():
+    """主要 Model 的 Circuit OPEN → 改用 Pool 裡健康的 Model，不是整個放棄"""
+    primary = FakeModel("rp-open-primary", [tag_block("never")])
+    fallback = FakeModel("rp-open-fallback", [tag_block("Rust")])
+    gateway = make_gateway([primary, fallback])
+    _open(get_circuit_breaker("rp-open-primary"))
+
+    result, served_by = gateway._generate_with_retry_logic(gateway.gemma_pool, "p", lambda d: (True, ""), max_retries=1)
+    assert served_by == "rp-open-fallback"
+    assert result["required_skills"][0]["topic"] == "Rust"
+    assert primary.calls == 0
+
+
+def test_gateway_fails_fast_when_all_open():
+    a, b = FakeModel("rp-all-a", [tag_block("x")]), FakeModel("rp-all-b", [tag_block("y")])
+    gateway = make_gateway([a, b])
+    _open(get_circuit_breaker("rp-all-a"))
+    _open(get_circuit_breaker("rp-all-b"))
+
+    started = time.perf_counter()
+    result, served_by = gateway._generate_with_retry_logic(gateway.gemma_pool, "p", lambda d: (True, ""), max_retries=3)
+    assert served_by is None and result.get("error")
+    assert a.calls == 0 and b.calls == 0
+    assert time.perf_counter() - started < 1
@@ -0,0 +1,83 @@
+import os
+import sys
+import sqlite3
+import tempfile
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.tools.run_manifest import RunManifest
+
+
+def _dossier(tmp, name="job.json"):
+    path = os.path.join(tmp, name)
+    with open(path, "w") as f:
+        f.write("{}")
+    return path
+
+
+def test_unit_lifecycle_and_input_hash():
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest = RunManifest(os.path.join(tmp, "m.sqlite3"))
+        manifest.mark("job.json", "E2", "SKILL", RunManifest.PENDING, input_hash="h1")
+        manifest.mark("job.json", "E2", "SKILL", RunManifest.RUNNING)
+        manifest.mark("job.json", "E2", "SKILL", RunManifest.DONE)
+        units = manifest.units("job.json")
+        assert units[("E2", "SKILL")]["attempts"] == 1
+        assert manifest.is_done(units, "E2", "SKILL", "h1")
+        assert not manifest.is_done(units, "E2", "SKILL", "h2")  # JD / Council 指紋變了 → 重跑
+        assert not manifest.is_done(units, "E2", "GAP_EFFORT", "h1")
+
+
+def test_failed_and_interrupted_units_are_retried():
+    with tempfile.TemporaryDirectory() as tmp:
+        manifest = RunManifest(os.path.join(tmp, "m.sqlite3"))
+        manifest.mark("a.json", "E1", "SKILL", RunManifest.FAILED, error="RuntimeError: Max retries reached")
+        manifest.mark("b.json", "E1", "SKILL", RunManifest.RUNNING)
+        manifest.mark("c.json", "E1", "SKILL", RunManifest.DONE)
+        assert manifest.failed_dossiers() == {"a.json", "b.json"}
+        assert manifest.summary() == {RunManifest.FAILED: 1, RunManifest.RUNNING: 1, RunManifest.DONE: 1}
+
+
+def test_dossier_done_checks_mtime_and_fingerprint():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = _dossier(tmp)
+        manifest = RunManifest(os.path.join(tmp, "m.sqlite3"))
+        manifest.mark_dossier_done("job.json", path, "fp1")
+        assert manifest.dossier_done("job.json", path, "fp1")
+        assert not manifest.dossier_done("job.json", path, "fp2")  # 改了 Prompt / 換 Model
+
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1_000_000))
+        assert not manifest.dossier_done("job.json", path, "fp1")  # 檔案被改過
+
+        manifest.mark_dossier_done("job.json", path, "fp1")
+        manifest.clear_dossier_done("job.json")
+        assert not manifest.dossier_done("job.json", path, "fp1")
+
+
+def test_old_manifest_without_fingerprint_column():
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path, path = os.path.join(tmp, "m.sqlite3"), _dossier(tmp)
+        conn = sqlite3.connect(db_path)
+        conn.execute("CREATE TABLE dossiers (dossier_id TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, updated_at REAL NOT NULL)")
+        conn.execute("INSERT INTO dossiers VALUES (?, ?, 0)", ("job.json", os.stat(path).st_mtime_ns))
+        conn.commit()
+        conn.close()
+
+        manifest = RunManifest(db_path)
+        assert not manifest.dossier_done("job.json", path, "fp1")  # 舊紀錄沒有指紋 → 重跑一次
+        manifest.mark_dossier_done("job.json", path, "fp1")
+        assert manifest.dossier_done("job.json", path, "fp1")
+
+
+def test_unusable_path_degrades_to_noop():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = _dossier(tmp)
+        manifest = RunManifest(os.path.join(path, "m.sqlite3"))  # 父路徑是檔案 → 開不起來
+        manifest.mark("job.json", "E2", "SKILL", RunManifest.DONE, input_hash="h1")
+        manifest.mark_dossier_done("job.json", path, "fp1")
+        assert manifest.units("job.json") == {}
+        assert not manifest.dossier_done("job.json", path, "fp1")
+        assert manifest.failed_dossiers() == set() and manifest.summary() == {}
+        manifest.print_failures()
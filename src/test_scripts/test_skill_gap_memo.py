@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.agents.cache_manager import SkillGapMemo, normalize_skill_topic
+
+
+def _skill(topic, bar="Ship production code"):
+    return {"topic": topic, "analysis": {"hidden_bar": bar}}
+
+
+def _gap(topic):
+    return {"topic": topic, "effort_assessment": {"level": "LOW"}}
+
+
+def _memo(tmp):
+    return SkillGapMemo(db_path=os.path.join(tmp, "memo.sqlite3"))
+
+
+def test_normalize_topic():
+    assert normalize_skill_topic(" PyTorch. ") == "pytorch"
+    assert normalize_skill_topic("C++") == "c++"
+
+
+def test_split_merge_roundtrip():
+    with tempfile.TemporaryDirectory() as tmp:
+        memo = _memo(tmp)
+        skills = [_skill("Rust"), _skill("CUDA")]
+        cached, unseen = memo.split("E2", skills, "fp")
+        assert cached == {} and unseen == skills
+
+        merged = memo.merge("E2", skills, cached, [_gap("cuda"), _gap("rust"), _gap("Extra")], "fp")
+        assert [g["topic"] for g in merged] == ["rust", "cuda", "Extra"]  # 依技能順序，對不到的放最後
+
+        # 另一份 JD：同樣的技能直接命中，topic 換成這份 JD 的寫法
+        cached, unseen = memo.split("E2", [_skill("rust"), _skill("Go")], "fp")
+        assert list(cached) == [0] and cached[0]["topic"] == "rust"
+        assert [s["topic"] for s in unseen] == ["Go"]
+
+
+def test_fingerprint_expert_and_bar_isolate_entries():
+    with tempfile.TemporaryDirectory() as tmp:
+        memo = _memo(tmp)
+        memo.merge("E2", [_skill("Rust")], {}, [_gap("Rust")], "fp")
+        assert memo.split("E2", [_skill("Rust")], "other-fp")[0] == {}
+        assert memo.split("E5", [_skill("Rust")], "fp")[0] == {}
+        assert memo.split("E2", [_skill("Rust", bar="Publish at top venues")], "fp")[0] == {}
+
+
+def test_nothing_saved_without_new_items():
+    """模型失敗時呼叫端不會 merge；就算 merge 空結果也不能寫入任何東西"""
+    with tempfile.TemporaryDirectory() as tmp:
+        memo = _memo(tmp)
+        assert memo.merge("E2", [_skill("Rust")], {}, [], "fp") == []
+        assert memo.stats["saves"] == 0 and memo.store.stats()["entries"] == 0
@@ -0,0 +1,62 @@
+import os
+import sys
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.test_scripts._fake_gateway import FakeModel, make_gateway, tag_block
+from src.tools.stream_parser import StreamingParser, StreamAbort, item_schema_for
+from src.tools.schemas import SkillExtractionReport, SkillItem
+
+
+def _feed(parser, text, size=7):
+    for i in range(0, len(text), size):
+        parser.feed(text[i:i + size])
+
+
+def test_tag_items_arrive_incrementally():
+    seen = []
+    parser = StreamingParser(item_schema_for(SkillExtractionReport), on_item=lambda item, idx: seen.append((idx, item["topic"])))
+    _feed(parser, "Sure.\n" + tag_block("Rust") + tag_block("CUDA"))
+    assert item_schema_for(SkillExtractionReport) is SkillItem
+    assert seen == [(0, "Rust"), (1, "CUDA")]
+
+
+def test_json_items_arrive_incrementally():
+    parser = StreamingParser(None)
+    _feed(parser, '{"required_skills": [{"topic": "a"}, {"topic": "b {x}"}]}')
+    assert [item["topic"] for item in parser.items] == ["a", "b {x}"]
+
+
+def test_abort_on_garbage_prefix():
+    parser = StreamingParser(None)
+    try:
+        _feed(parser, "I cannot help with that. " * 40)
+    except StreamAbort as e:
+        assert e.raw_text
+    else:
+        raise AssertionError("expected StreamAbort")
+
+
+def test_abort_on_consecutive_bad_items():
+    parser = StreamingParser(SkillItem)
+    bad = "@@@\nEFFORT_LEVEL: HIGH\n@@@\n"  # Gap 區塊，不符合 SkillItem
+    try:
+        _feed(parser, tag_block("Rust") + bad * 3)
+    except StreamAbort:
+        assert len(parser.items) == 1
+    else:
+        raise AssertionError("expected StreamAbort")
+
+
+def test_gateway_cancels_aborted_stream():
+    """StreamAbort 後要取消底層串流 (不再為剩下的輸出付費)，再用部分輸出進 Repair"""
+    model = FakeModel("stream-model", ["This is not the protocol at all. " * 100, tag_block("Rust")])
+    gateway = make_gateway([model])
+    result = gateway.generate("prompt", SkillExtractionReport, stream=True)
+
+    aborted, repaired = model.streams
+    assert aborted._iterator.cancelled
+    assert aborted.chunks_sent < aborted.total_chunks
+    assert not repaired._iterator.cancelled  # 正常讀完的串流不需要取消
+    assert result["required_skills"][0]["topic"] == "Rust"
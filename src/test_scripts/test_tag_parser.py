@@ -0,0 +1,29 @@
+import os
+import sys
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.tools.model_gateway import parse_gemma_tags
+
+
+def test_fields_only_split_at_line_start():
+    report = parse_gemma_tags(
+        "@@@\nTOPIC: Rust\nHIDDEN_BAR: Ship async code. Note: tokio only\n  QUOTE: must know Rust\n@@@"
+    )
+    skill = report["required_skills"][0]
+    assert skill["analysis"]["hidden_bar"] == "Ship async code. Note: tokio only"
+    assert skill["analysis"]["quote_from_jd"] == "must know Rust"  # 行首縮排仍算欄位
+
+
+def test_multiline_values_and_advisor_aliases():
+    report = parse_gemma_tags("@@@\nFOCUS_AREA: Systems\nRATIONALE: line one\nline two\nACTIONABLE_STEP: build it\n@@@")
+    advice = report["strategic_advice"][0]
+    assert advice["topic"] == "Systems"
+    assert advice["rationale"] == "line one\nline two"
+    assert advice["actionable_step"] == "build it" and advice["priority"] == "MEDIUM"
+
+
+def test_no_blocks_returns_falsy():
+    assert not parse_gemma_tags("plain text, no tags")
+    assert parse_gemma_tags(None) is None
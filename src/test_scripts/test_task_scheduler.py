@@ -0,0 +1,74 @@
+import os
+import sys
+import time
+import threading
+import contextvars
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.tools.task_scheduler import PriorityTaskScheduler
+
+
+def test_priority_order_with_single_worker():
+    order = []
+    scheduler = PriorityTaskScheduler(1)
+    for priority, name in [((1, 1), "late-skill"), ((0, 1), "early-skill"), ((0, 0), "early-gap"), ((1, 0), "late-gap")]:
+        scheduler.submit(priority, order.append, name, tag=name)
+    scheduler.run(lambda tag, result, error: None)
+    assert order == ["early-gap", "early-skill", "late-gap", "late-skill"]
+
+
+def test_concurrency_bound_and_failures():
+    lock, running, peak = threading.Lock(), [0], [0]
+
+    def work(i):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.01)
+        with lock:
+            running[0] -= 1
+        if i == 3:
+            raise ValueError("boom")
+        return i
+
+    results, errors = {}, {}
+    scheduler = PriorityTaskScheduler(3)
+    for i in range(10):
+        scheduler.submit(0, work, i, tag=i)
+    stats = scheduler.run(lambda tag, result, error: (errors if error else results).__setitem__(tag, error or result))
+    assert peak[0] <= 3
+    assert stats == {"submitted": 10, "completed": 9, "failed": 1}
+    assert isinstance(errors[3], ValueError) and len(results) == 9
+
+
+def test_on_done_can_chain_and_refill():
+    """on_done 裡 submit 後續任務 (Step 1 → Step 2)；refill 在 Queue 快空時補新工作"""
+    done, backlog = [], ["job-b", "job-c"]
+    scheduler = PriorityTaskScheduler(2)
+
+    def on_done(tag, result, error):
+        done.append(tag)
+        if tag.endswith(":skill"):
+            scheduler.submit(0, str.upper, tag, tag=tag.replace(":skill", ":gap"))
+
+    def refill():
+        if backlog:
+            job = backlog.pop(0)
+            scheduler.submit(1, str.upper, job, tag=f"{job}:skill")
+
+    scheduler.submit(1, str.upper, "job-a", tag="job-a:skill")
+    scheduler.run(on_done, refill=refill)
+    assert sorted(done) == sorted(f"job-{x}:{step}" for x in "abc" for step in ("skill", "gap"))
+
+
+def test_contextvars_follow_task():
+    label = contextvars.ContextVar("label", default="none")
+    seen = []
+    scheduler = PriorityTaskScheduler(2)
+    token = label.set("P3/E2")
+    scheduler.submit(0, lambda: label.get(), tag="t")
+    label.reset(token)
+    scheduler.run(lambda tag, result, error: seen.append(result))
+    assert seen == ["P3/E2"]
@@ -0,0 +1,56 @@
+import os
+import sys
+
+# === 路徑設定 ===
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../../')))
+
+from src.tools.token_estimator import TokenEstimator
+
+ENGLISH = "The quick brown fox jumps over the lazy dog. " * 40
+
+
+def test_calibration_converges():
+    estimator = TokenEstimator(chars_per_token=4.0)
+    for i in range(5):
+        text = ENGLISH + str(i)
+        estimator.calibrate(text, len(text) // 3)  # 真實比例約 3 chars/token
+    assert abs(estimator.chars_per_token - 3.0) < 0.1
+
+
+def test_outlier_sample_is_bounded():
+    """一筆小 prompt 配上超大的 usage_metadata 不能把比例帶飛 (否則 Limiter 會多等很久)"""
+    estimator = TokenEstimator(chars_per_token=4.0, ratio_bounds=(1.5, 8.0))
+    estimator.calibrate("hi there", 100000)
+    assert estimator.chars_per_token == 1.5
+
+    for i in range(5):
+        text = ENGLISH + str(i)
+        estimator.calibrate(text, len(text) // 4)
+    estimator.calibrate("ok", 50000)
+    # 中位數：少數怪異樣本不影響
+    assert abs(estimator.chars_per_token - 4.0) < 0.1
+    assert estimator.estimate("x" * 4000) < 1100
+
+
+def test_exact_count_is_remembered():
+    estimator = TokenEstimator()
+    estimator.calibrate(ENGLISH, 123)
+    assert estimator.estimate(ENGLISH) == 123
+
+
+def test_remote_counter_only_during_calibration():
+    calls = []
+
+    def remote(text):
+        calls.append(text)
+        return len(text) // 4
+
+    estimator = TokenEstimator(calibration_samples=2)
+    for i in range(5):
+        estimator.count(ENGLISH + str(i), limit=100000, remote_counter=remote)
+    assert len(calls) == 2
+
+    # 接近門檻時仍然精確計數
+    near = ENGLISH * 2
+    estimator.count(near, limit=estimator.estimate(near), remote_counter=remote)
+    assert len(calls) == 3
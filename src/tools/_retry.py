@@ -1,10 +1,13 @@
 import json
-import time
 import re
 import ast
 from termcolor import colored
 from tqdm import tqdm
 
+from src.tools.llm_backend import wrap_model
+from src.tools.retry_policy import default_retry_policy, get_circuit_breaker, CircuitOpenError
+from src.tools.rate_limiter import is_quota_error
+
 def extract_json_from_text(text):
     """
     🧹 強力清潔劑：抓出 JSON 字串
@@ -118,7 +121,10 @@ def normalize_structure(data):
 def generate_with_retry(model, prompt, validator_func, max_retries=2):
     """
     通用重試機制 (Gemma 穩定版)
+    API 錯誤走指數退避 + Jitter；Model 的 Circuit Breaker OPEN 時直接放棄。
     """
+    model = wrap_model(model)
+    breaker = get_circuit_breaker(getattr(model, "model_name", str(model)))
     current_prompt = prompt
     last_result = None
     
@@ -127,7 +133,9 @@ def generate_with_retry(model, prompt, validator_func, max_retries=2):
     for attempt in range(max_retries + 1):
         try:
             final_prompt = current_prompt + (system_reminder if attempt > 0 else "")
+            breaker.before_call()
             response = model.generate_content(final_prompt)
+            breaker.record_success()
             
             # 1. 萃取
             cleaned_text = extract_json_from_text(response.text)
@@ -159,16 +167,24 @@ def generate_with_retry(model, prompt, validator_func, max_retries=2):
             
             if attempt < max_retries:
                 current_prompt += f"\n\n[SYSTEM ERROR]: {error_msg}. Check your JSON structure keys."
-                time.sleep(20*max_retries)
 
         except json.JSONDecodeError:
             tqdm.write(colored(f"  ❌ JSON Parsing Error (Attempt {attempt+1})", "red"))
             if attempt < max_retries:
                 current_prompt += "\n\n[SYSTEM ERROR]: Invalid JSON. Use standard JSON format."
 
+        except CircuitOpenError as e:
+            tqdm.write(colored(f"  🔴 {e}. Failing fast.", "red"))
+            break
+
         except Exception as e:
             tqdm.write(colored(f"  ❌ System Error: {e}", "red"))
-            time.sleep(20)
+            if is_quota_error(e):
+                breaker.release()  # 429 只是額度用完，Model 沒掛 (Breaker 狀態不動)
+            else:
+                breaker.record_failure()
+            if attempt < max_retries:
+                default_retry_policy.sleep(attempt, e)
 
     tqdm.write(colored(f"  💀 Failed after {max_retries} retries.", "red", attrs=['bold']))
     return last_result or {"error": "Max retries reached"}
\ No newline at end of file
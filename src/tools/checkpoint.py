@@ -0,0 +1,128 @@
+import os
+import json
+import time
+import tempfile
+import threading
+from tqdm import tqdm
+from termcolor import colored
+
+# ==============================================================================
+# Dossier Checkpoint (Append-Only Journal + Atomic Compaction)
+# ==============================================================================
+# 以前每完成一步就把整份 Dossier (含 raw_content) 重寫一次，而且是直接覆寫原檔：
+# - 寫入量 = Dossier 大小 × 步驟數
+# - 寫到一半當掉 → Dossier JSON 壞掉
+# 現在：
+# - 每個結果 append 一行到 <dossier>.journal.jsonl (只寫結果本身)
+# - 全部完成後 compact：套用 journal → 寫 temp 檔 → fsync → os.replace (原子替換) → 刪 journal
+# - 載入時若還有 journal (上次中途當掉)，自動 replay，已完成的結果不會遺失
+
+CHECKPOINT_FSYNC = os.getenv("CHECKPOINT_FSYNC", "True").lower() == "true"
+DOSSIER_JSON_INDENT = int(os.getenv("DOSSIER_JSON_INDENT", "2"))  # 0 = 不縮排 (檔案更小)
+
+JOURNAL_SUFFIX = ".journal.jsonl"
+
+# umask 只能「設定並取回舊值」，在 import 時讀一次 (執行中再切換會影響其他執行緒建立的檔案)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def _file_mode(path: str) -> int:
+    """沿用原檔的權限；新檔案照一般 open() 的規則 (0o666 扣掉 umask)"""
+    try:
+        return os.stat(path).st_mode & 0o7777
+    except FileNotFoundError:
+        return 0o666 & ~_UMASK
+
+
+def atomic_write_json(path: str, data, indent: int = DOSSIER_JSON_INDENT):
+    """寫到同目錄的 temp 檔，fsync 後 os.replace：讀者只會看到舊版或新版，不會看到寫一半的檔案"""
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".tmp_", suffix=".json", dir=directory)
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            os.fchmod(f.fileno(), _file_mode(path))  # mkstemp 固定是 0600，不改的話換檔後其他人就讀不到
+            json.dump(data, f, indent=indent or None, ensure_ascii=False)
+            f.flush()
+            if CHECKPOINT_FSYNC:
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _apply(dossier: dict, path: list, value):
+    node = dossier
+    for key in path[:-1]:
+        child = node.get(key)
+        if not isinstance(child, dict):
+            child = node[key] = {}
+        node = child
+    node[path[-1]] = value
+
+
+class DossierJournal:
+    """
+    用法：
+        journal = DossierJournal(filepath)
+        dossier = journal.load()                                   # 含 crash recovery
+        journal.append(["expert_council", "skill_analysis", "E2"], result)
+        journal.compact(dossier)                                   # 原子寫回 Dossier
+    """
+
+    def __init__(self, dossier_path: str):
+        self.dossier_path = dossier_path
+        self.journal_path = dossier_path + JOURNAL_SUFFIX
+        self._lock = threading.Lock()
+
+    def entries(self):
+        if not os.path.exists(self.journal_path):
+            return []
+        entries = []
+        with open(self.journal_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    break  # 最後一行寫到一半 (當機)：之前的都有效
+                if isinstance(entry, dict) and entry.get("path"):
+                    entries.append(entry)
+        return entries
+
+    def replay(self, dossier: dict) -> int:
+        entries = self.entries()
+        for entry in entries:
+            _apply(dossier, entry["path"], entry.get("value"))
+        return len(entries)
+
+    def load(self, verbose: bool = True) -> dict:
+        with open(self.dossier_path, 'r', encoding='utf-8') as f:
+            dossier = json.load(f)
+        recovered = self.replay(dossier)
+        if recovered and verbose:
+            tqdm.write(colored(f"  ♻️ Recovered {recovered} journaled results for {os.path.basename(self.dossier_path)}", "blue"))
+        return dossier
+
+    def append(self, path: list, value):
+        """記錄一筆結果 (dossier[path[0]]...[path[-1]] = value)"""
+        line = json.dumps({"path": list(path), "value": value, "ts": time.time()}, ensure_ascii=False)
+        with self._lock:
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(line + "\n")
+                f.flush()
+                if CHECKPOINT_FSYNC:
+                    os.fsync(f.fileno())
+
+    def compact(self, dossier: dict):
+        """把目前的 Dossier (已含所有結果) 原子寫回，再清掉 journal"""
+        with self._lock:
+            atomic_write_json(self.dossier_path, dossier)
+            try:
+                os.remove(self.journal_path)
+            except FileNotFoundError:
+                pass
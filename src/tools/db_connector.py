@@ -1,5 +1,8 @@
 import os
+import re
 import json
+import hashlib
+import threading
 import chromadb
 from termcolor import cprint
 
@@ -7,6 +10,13 @@ from termcolor import cprint
 CHROMA_PATH = os.getenv("CHROMA_DB_PATH", "/app/data/chroma_db")
 USER_PROFILE_PATH = os.getenv("PATH_TO_USER_PROFILE", "/app/data/chroma_db")
 
+# Bullet 層級的履歷索引 (每條 Bullet / Summary / Skill 類別一個 chunk)，Step 2 依技能檢索
+RESUME_BULLET_COLLECTION = os.getenv("RESUME_BULLET_COLLECTION", "resume_bullets")
+RESUME_RETRIEVAL_ENABLED = os.getenv("RESUME_RETRIEVAL_ENABLED", "True").lower() == "true"
+RESUME_EVIDENCE_TOP_K = int(os.getenv("RESUME_EVIDENCE_TOP_K", "4"))
+
+_BULLET_SPLIT_RE = re.compile(r"\n+|\s[•·▪]\s+")
+
 
 class DBConnector:
     def __init__(self):
@@ -16,6 +26,9 @@ class DBConnector:
         else:
             self.client = chromadb.PersistentClient(path=CHROMA_PATH)
         self.data_dir = USER_PROFILE_PATH
+        self._bullet_collection = None
+        self._bullet_index_built = False  # 每個 Process 只建 / 同步一次
+        self._bullet_lock = threading.Lock()
 
     def get_personal_knowledge_context(self):
         """
@@ -156,5 +169,124 @@ class DBConnector:
         except Exception as e:
             return f"(Error reading Resume DB: {e})"
 
+    # ==========================================
+    # 🔎 Bullet-Level Resume Retrieval
+    # ==========================================
+    @staticmethod
+    def _split_bullets(value):
+        """key_responsibilities 可能是 list 或一整串文字 (換行 / • / - 分隔)"""
+        items = value if isinstance(value, list) else _BULLET_SPLIT_RE.split(str(value or ""))
+        bullets = [str(b).strip().lstrip("•·▪-* \t").rstrip(" ;") for b in items]
+        return [b for b in bullets if b]
+
+    def _resume_bullet_chunks(self):
+        """把每份 RESUME 的 analysis_json 拆成 (id, text, metadata) chunks"""
+        collection = self.client.get_collection("past_applications_jds")
+        results = collection.get(where={"doc_type": "RESUME"})
+        chunks = {}
+
+        def add(text, filename, section, role=""):
+            text = text.strip()
+            if not text: return
+            chunk_id = hashlib.md5(f"{filename}|{section}|{role}|{text}".encode("utf-8")).hexdigest()
+            chunks[chunk_id] = (text, {"filename": filename, "section": section, "role": role})
+
+        for meta in results['metadatas'] or []:
+            filename = meta.get('filename', 'Unknown')
+            try:
+                resume_data = json.loads(meta.get('analysis_json', '{}'))
+            except:
+                continue # 解析失敗就跳過
+
+            if resume_data.get('summary'):
+                add(str(resume_data['summary']), filename, "summary")
+
+            work_exp = resume_data.get('work_experience', [])
+            for job in work_exp if isinstance(work_exp, list) else []:
+                if not isinstance(job, dict): continue
+                role = f"{job.get('title', 'Role')} at {job.get('company', 'Company')}"
+                for bullet in self._split_bullets(job.get('key_responsibilities', '')):
+                    add(bullet, filename, "bullet", role)
+
+            skills = resume_data.get('technical_skills', {})
+            if isinstance(skills, dict):
+                for category, values in skills.items():
+                    values = ", ".join(map(str, values)) if isinstance(values, list) else str(values)
+                    add(f"{category}: {values}", filename, "skills")
+        return chunks
+
+    def build_resume_bullet_index(self):
+        """
+        建立 / 增量更新 Bullet 索引 (chunk id = 內容 hash：新的補進去、消失的刪掉)
+        回傳 collection；DB 沒連上或沒有履歷時回傳 None
+        """
+        if not self.client or not RESUME_RETRIEVAL_ENABLED: return None
+        with self._bullet_lock:
+            if self._bullet_index_built:
+                return self._bullet_collection
+            self._bullet_index_built = True
+            try:
+                chunks = self._resume_bullet_chunks()
+                collection = self.client.get_or_create_collection(name=RESUME_BULLET_COLLECTION)
+                existing = set(collection.get(include=[])['ids'])
+
+                stale = list(existing - set(chunks))
+                if stale:
+                    collection.delete(ids=stale)
+                new_ids = [cid for cid in chunks if cid not in existing]
+                for i in range(0, len(new_ids), 500):
+                    batch = new_ids[i:i + 500]
+                    collection.add(ids=batch, documents=[chunks[c][0] for c in batch], metadatas=[chunks[c][1] for c in batch])
+
+                if new_ids or stale:
+                    cprint(f"🔎 Resume bullet index: +{len(new_ids)} / -{len(stale)} chunks ({len(chunks)} total)", "cyan")
+                self._bullet_collection = collection if chunks else None
+            except Exception as e:
+                cprint(f"⚠️ Resume bullet index unavailable: {e}", "yellow")
+                self._bullet_collection = None
+            return self._bullet_collection
+
+    def query_resume_evidence(self, queries: dict, top_k: int = RESUME_EVIDENCE_TOP_K):
+        """
+        一次 collection.query 查完所有技能 (batched)。
+        queries: {label: query_text} → {label: [{"text", "filename", "section", "role", "distance"}, ...]}
+        索引不可用時回傳 None (呼叫端改用整份履歷)
+        """
+        if not queries: return {}
+        collection = self.build_resume_bullet_index()
+        if collection is None: return None
+        try:
+            labels = list(queries)
+            results = collection.query(query_texts=[queries[l] for l in labels], n_results=max(1, min(top_k, collection.count())))
+        except Exception as e:
+            cprint(f"⚠️ Resume evidence query failed: {e}", "yellow")
+            return None
+
+        evidence = {}
+        for i, label in enumerate(labels):
+            docs, metas = results['documents'][i], results['metadatas'][i]
+            distances = (results.get('distances') or [[None] * len(docs)] * len(labels))[i]
+            evidence[label] = [dict(text=doc, distance=dist, **(meta or {})) for doc, meta, dist in zip(docs, metas, distances)]
+        return evidence
+
+    def get_resume_evidence_context(self, queries: dict, top_k: int = RESUME_EVIDENCE_TOP_K):
+        """
+        🎯 只取每個技能 top-k 的履歷證據 (取代 get_resume_bullets_context 的整份履歷)
+        回傳給 LLM 讀的純文字；索引不可用時回傳 None
+        """
+        evidence = self.query_resume_evidence(queries, top_k)
+        if evidence is None: return None
+
+        context_text = ""
+        for label, hits in evidence.items():
+            context_text += f"=== EVIDENCE FOR: {label} ===\n"
+            if not hits:
+                context_text += "  (no matching resume bullets)\n"
+            for hit in hits:
+                where = f"{hit.get('filename', 'Unknown')}" + (f" | {hit['role']}" if hit.get('role') else "")
+                context_text += f"  - [{hit.get('section', 'bullet')}] {hit['text']} ({where})\n"
+            context_text += "\n"
+        return context_text
+
 # 實例化全域物件
 db_connector = DBConnector()
\ No newline at end of file
@@ -0,0 +1,119 @@
+import os
+import gzip
+import json
+import time
+import queue
+import random
+import shutil
+import atexit
+import logging
+import threading
+import logging.handlers
+
+# ==============================================================================
+# Async Rotating Debug Log (Gateway Attempts)
+# ==============================================================================
+# Request path 只負責把 record 丟進 Queue，由單一 Writer Thread 寫檔：
+# - 每行一筆 JSON (prompt hash, model, attempt, latency, tokens, raw response...)
+# - 依檔案大小 rotate，可選 gzip 壓縮舊檔
+# - 成功的 attempt 可依 sample rate 抽樣；失敗一律記錄
+
+GATEWAY_LOG_PATH = os.getenv("GATEWAY_LOG_PATH", "data/debug_gemma.log")
+GATEWAY_LOG_MAX_MB = float(os.getenv("GATEWAY_LOG_MAX_MB", "20"))
+GATEWAY_LOG_BACKUPS = int(os.getenv("GATEWAY_LOG_BACKUPS", "5"))
+GATEWAY_LOG_COMPRESS = os.getenv("GATEWAY_LOG_COMPRESS", "True").lower() == "true"
+GATEWAY_LOG_SAMPLE_RATE = float(os.getenv("GATEWAY_LOG_SAMPLE_RATE", "1.0"))
+GATEWAY_LOG_RAW_CHARS = int(os.getenv("GATEWAY_LOG_RAW_CHARS", "0"))  # 0 = 不截斷
+
+
+def _gzip_namer(name):
+    return name + ".gz"
+
+
+def _gzip_rotator(source, dest):
+    with open(source, "rb") as f_in, gzip.open(dest, "wb") as f_out:
+        shutil.copyfileobj(f_in, f_out)
+    os.remove(source)
+
+
+class _JsonLineFormatter(logging.Formatter):
+    def format(self, record):
+        return json.dumps(record.msg, ensure_ascii=False, default=str)
+
+
+class GatewayDebugLog:
+    def __init__(self, path=GATEWAY_LOG_PATH, max_mb=GATEWAY_LOG_MAX_MB, backups=GATEWAY_LOG_BACKUPS,
+                 compress=GATEWAY_LOG_COMPRESS, sample_rate=GATEWAY_LOG_SAMPLE_RATE, raw_chars=GATEWAY_LOG_RAW_CHARS):
+        self.path = path
+        self.max_bytes = int(max_mb * 1024 * 1024)
+        self.backups = backups
+        self.compress = compress
+        self.sample_rate = sample_rate
+        self.raw_chars = raw_chars
+
+        self._lock = threading.Lock()
+        self._logger = None
+        self._listener = None
+        self._queue_handler = None
+        self._file_handler = None
+
+    def _start(self):
+        """第一次 record 時才建立 Writer Thread"""
+        with self._lock:
+            if self._logger is not None:
+                return self._logger
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+            file_handler = logging.handlers.RotatingFileHandler(
+                self.path, maxBytes=self.max_bytes, backupCount=self.backups, encoding="utf-8"
+            )
+            if self.compress:
+                file_handler.namer = _gzip_namer
+                file_handler.rotator = _gzip_rotator
+
+            log_queue = queue.SimpleQueue()
+            self._listener = logging.handlers.QueueListener(log_queue, file_handler)
+            self._listener.start()
+
+            logger = logging.getLogger(f"gateway.debug.{id(self)}")
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            # QueueHandler.prepare() 會先 format，所以 JSON 化在這裡做，Writer 端只寫字串
+            queue_handler = logging.handlers.QueueHandler(log_queue)
+            queue_handler.setFormatter(_JsonLineFormatter())
+            logger.addHandler(queue_handler)
+            self._logger = logger
+            self._queue_handler, self._file_handler = queue_handler, file_handler
+            atexit.register(self.close)
+            return logger
+
+    def record(self, status: str = "ok", **fields):
+        """非阻塞：丟進 Queue 就回來。status != ok 的紀錄不受抽樣影響"""
+        if status == "ok" and self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        raw = fields.get("raw_response")
+        if self.raw_chars and isinstance(raw, str) and len(raw) > self.raw_chars:
+            fields["raw_response"] = raw[:self.raw_chars] + "...[TRUNCATED]"
+        entry = {"ts": time.strftime("%Y-%m-%dT%H:%M:%S"), "status": status, **fields}
+        try:
+            self._start().info(entry)
+        except Exception:
+            pass  # Debug log 不能影響主流程
+
+    def close(self):
+        """
+        把 Queue 裡剩下的紀錄寫完 (atexit 會自動呼叫)。
+        Writer Thread 停掉後改成同步寫檔：之後才進來的紀錄 (例如其他 atexit hook) 不會卡在沒人讀的 Queue 裡。
+        """
+        with self._lock:
+            if self._listener is None:
+                return
+            self._logger.removeHandler(self._queue_handler)
+            self._listener.stop()
+            self._listener = None
+            self._file_handler.setFormatter(_JsonLineFormatter())
+            self._logger.addHandler(self._file_handler)
+
+
+# 全域共用實例
+gateway_debug_log = GatewayDebugLog()
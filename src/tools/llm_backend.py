@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import random
+import threading
+from types import SimpleNamespace
+from termcolor import colored
+
+from src.tools.response_cache import ResponseCache
+from src.tools.token_estimator import token_estimator
+
+# ==============================================================================
+# Pluggable LLM Backend: live / record / replay (Cassette)
+# ==============================================================================
+# live   : 直接呼叫 genai (預設)
+# record : 呼叫 genai，並把 request/response 存進 Cassette (JSONL)
+# replay : 不連網，從 Cassette 回放，可加上合成延遲與錯誤率 → 離線 Benchmark P1~P5
+#
+# 注意：Replay 做 Benchmark 時記得設 LLM_CACHE_ENABLED=False，否則 Response Cache 會先攔截。
+
+LLM_BACKEND = os.getenv("LLM_BACKEND", "live").lower()
+LLM_CASSETTE_PATH = os.getenv("LLM_CASSETTE_PATH", "/app/data/cassettes/llm_cassette.jsonl")
+LLM_REPLAY_LATENCY = os.getenv("LLM_REPLAY_LATENCY", "0")        # 秒數，或範圍 "0.5-2.0"
+LLM_REPLAY_ERROR_RATE = float(os.getenv("LLM_REPLAY_ERROR_RATE", "0"))
+LLM_REPLAY_SEED = os.getenv("LLM_REPLAY_SEED")
+LLM_REPLAY_CHUNK_CHARS = int(os.getenv("LLM_REPLAY_CHUNK_CHARS", "200"))  # stream=True 回放時每個 chunk 的字數
+
+
+class CassetteMissError(KeyError):
+    """Replay 模式下找不到對應的錄音"""
+
+
+class SyntheticBackendError(RuntimeError):
+    """Replay 模式下依 error rate 注入的假錯誤"""
+
+
+class CassetteStore:
+    """
+    Append-only JSONL Cassette。每一行：
+    {"key", "model", "request", "text", "prompt_tokens", "output_tokens", "latency"}
+    同一個 key 錄到多次時 (例如重試)，Replay 會依序輪流回放。
+    """
+
+    def __init__(self, path: str = LLM_CASSETTE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._entries = None
+        self._cursor = {}
+
+    def _load(self):
+        if self._entries is not None:
+            return
+        self._entries = {}
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except Exception:
+                    continue
+                self._entries.setdefault(entry["key"], []).append(entry)
+
+    def append(self, entry: dict):
+        with self._lock:
+            self._load()
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self._entries.setdefault(entry["key"], []).append(entry)
+
+    def next(self, key: str) -> dict:
+        with self._lock:
+            self._load()
+            entries = self._entries.get(key)
+            if not entries:
+                return None
+            idx = self._cursor.get(key, 0)
+            self._cursor[key] = idx + 1
+            return entries[idx % len(entries)]
+
+    def entries(self):
+        """所有錄音 (給 Benchmark 用)"""
+        with self._lock:
+            self._load()
+            return [e for group in self._entries.values() for e in group]
+
+
+def _parse_latency(spec: str):
+    try:
+        if "-" in spec:
+            low, high = (float(x) for x in spec.split("-", 1))
+            return low, high
+        value = float(spec)
+        return value, value
+    except ValueError:
+        return 0.0, 0.0
+
+
+def _usage(prompt_tokens, output_tokens):
+    return SimpleNamespace(
+        prompt_token_count=prompt_tokens,
+        candidates_token_count=output_tokens,
+        total_token_count=(prompt_tokens or 0) + (output_tokens or 0),
+    )
+
+
+class _ReplayStream:
+    """模擬 genai 的串流回應：可 iterate 出 chunk，也有完整的 text / usage_metadata"""
+
+    def __init__(self, text: str, usage, chunk_chars: int = LLM_REPLAY_CHUNK_CHARS):
+        self.text = text
+        self.usage_metadata = usage
+        self._chunk_chars = max(1, chunk_chars)
+
+    def __iter__(self):
+        for i in range(0, len(self.text), self._chunk_chars):
+            yield SimpleNamespace(text=self.text[i:i + self._chunk_chars])
+
+
+class _RecordingStream:
+    """Record 模式 + stream=True：邊轉發 chunk 邊累積，完整讀完才寫進 Cassette (中途放棄的不錄)"""
+
+    def __init__(self, response, on_complete):
+        self._response = response
+        self._on_complete = on_complete
+
+    def __getattr__(self, name):
+        if name == "_response":
+            raise AttributeError(name)
+        return getattr(self._response, name)
+
+    def __iter__(self):
+        parts = []
+        for chunk in self._response:
+            try:
+                parts.append(chunk.text or "")
+            except Exception:
+                pass
+            yield chunk
+        self._on_complete("".join(parts), getattr(self._response, "usage_metadata", None))
+
+
+class CassetteModel:
+    """
+    包住 genai.GenerativeModel，介面相容 (model_name / generate_content / count_tokens)。
+    """
+
+    def __init__(self, model, mode: str, store: CassetteStore,
+                 latency: str = LLM_REPLAY_LATENCY, error_rate: float = LLM_REPLAY_ERROR_RATE, seed=LLM_REPLAY_SEED):
+        self._model = model
+        self.mode = mode
+        self.store = store
+        self.model_name = getattr(model, "model_name", str(model))
+        self.latency = _parse_latency(latency)
+        self.error_rate = error_rate
+        self._rng = random.Random(seed)
+        self._rng_lock = threading.Lock()
+
+    def __getattr__(self, name):
+        # 其他屬性 (start_chat 等) 直接轉給原本的 Model
+        if name == "_model":
+            raise AttributeError(name)
+        return getattr(self._model, name)
+
+    def _key(self, contents, generation_config):
+        return ResponseCache.make_key(self.model_name, contents, None, generation_config)
+
+    def generate_content(self, contents, generation_config=None, **kwargs):
+        key = self._key(contents, generation_config)
+
+        if self.mode == "replay":
+            with self._rng_lock:
+                delay = self._rng.uniform(*self.latency)
+                fail = self._rng.random() < self.error_rate
+            if delay > 0:
+                time.sleep(delay)
+            if fail:
+                raise SyntheticBackendError("503 Service Unavailable (synthetic replay error)")
+            entry = self.store.next(key)
+            if entry is None:
+                raise CassetteMissError(f"No cassette entry for {self.model_name} (key={key[:12]})")
+            usage = _usage(entry.get("prompt_tokens"), entry.get("output_tokens"))
+            if kwargs.get("stream"):
+                return _ReplayStream(entry["text"], usage)
+            return SimpleNamespace(text=entry["text"], usage_metadata=usage)
+
+        # record
+        started = time.perf_counter()
+        response = self._model.generate_content(contents, generation_config=generation_config, **kwargs)
+
+        def save(text, usage):
+            self.store.append({
+                "key": key,
+                "model": self.model_name,
+                "request": contents,
+                "text": text,
+                "prompt_tokens": getattr(usage, "prompt_token_count", None),
+                "output_tokens": getattr(usage, "candidates_token_count", None),
+                "latency": round(time.perf_counter() - started, 3),
+            })
+
+        if kwargs.get("stream"):
+            return _RecordingStream(response, save)
+        try:
+            text = response.text
+        except Exception:
+            return response  # 被擋下的回應不錄
+        save(text, getattr(response, "usage_metadata", None))
+        return response
+
+    def count_tokens(self, contents, **kwargs):
+        if self.mode == "replay":
+            text = contents if isinstance(contents, str) else json.dumps(contents, ensure_ascii=False)
+            return SimpleNamespace(total_tokens=token_estimator.estimate(text))
+        return self._model.count_tokens(contents, **kwargs)
+
+
+_store = None
+_store_lock = threading.Lock()
+_announced = set()
+
+
+def get_cassette_store() -> CassetteStore:
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = CassetteStore(LLM_CASSETTE_PATH)
+        return _store
+
+
+def wrap_model(model):
+    """依 LLM_BACKEND 決定是否包一層 Cassette (live 模式原樣回傳)"""
+    if model is None or LLM_BACKEND not in ("record", "replay") or isinstance(model, CassetteModel):
+        return model
+    name = getattr(model, "model_name", str(model))
+    if name not in _announced:
+        _announced.add(name)
+        print(colored(f"  📼 LLM Backend: {LLM_BACKEND.upper()} ({name})", "cyan"))
+    return CassetteModel(model, LLM_BACKEND, get_cassette_store())
+
+
+def is_offline() -> bool:
+    """Replay 模式不需要 API Key"""
+    return LLM_BACKEND == "replay"
@@ -0,0 +1,150 @@
+import os
+import json
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from termcolor import cprint
+
+# ==============================================================================
+# Gateway Metrics (Counters + Histograms)
+# ==============================================================================
+# 用法：
+#   with gateway_metrics.labels(phase="P3"):
+#       with gateway_metrics.labels(expert="E2"):
+#           gateway.generate(...)          # 內部會 inc / observe，自動帶上 phase/expert
+#   gateway_metrics.dump_phase("P3")       # Phase 結束時輸出 JSON 或 Prometheus text
+
+METRICS_DIR = os.getenv("METRICS_DIR", "/app/data/metrics")
+METRICS_FORMAT = os.getenv("METRICS_FORMAT", "json").lower()  # json | prom
+
+DEFAULT_BUCKETS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+_context_labels = contextvars.ContextVar("gateway_metric_labels", default={})
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * len(self.buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        idx = bisect.bisect_left(self.buckets, value)
+        if idx < len(self.counts):
+            self.counts[idx] += 1
+        self.sum += value
+        self.count += 1
+
+    def to_dict(self):
+        return {
+            "buckets": dict(zip([str(b) for b in self.buckets], self.counts)),
+            "sum": round(self.sum, 4),
+            "count": self.count,
+        }
+
+
+def _label_key(labels: dict):
+    return tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _format_labels(key, extra=None):
+    pairs = list(key) + (list(extra.items()) if extra else [])
+    if not pairs:
+        return ""
+    body = ",".join(f'{k}="{v}"' for k, v in pairs)
+    return "{" + body + "}"
+
+
+class GatewayMetrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+
+    # --- Context Labels (phase / expert ...) ---
+    @contextmanager
+    def labels(self, **labels):
+        """在這個 context 裡產生的所有 metrics 都會帶上這些 labels (可巢狀)"""
+        token = _context_labels.set({**_context_labels.get(), **labels})
+        try:
+            yield
+        finally:
+            _context_labels.reset(token)
+
+    def _merge(self, labels):
+        return _label_key({**_context_labels.get(), **labels})
+
+    # --- Recording ---
+    def inc(self, name: str, value: float = 1, **labels):
+        key = (name, self._merge(labels))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, self._merge(labels))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = Histogram()
+            hist.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+
+    # --- Export ---
+    def snapshot(self) -> dict:
+        with self._lock:
+            counters = [
+                {"name": name, "labels": dict(key), "value": value}
+                for (name, key), value in sorted(self._counters.items())
+            ]
+            histograms = [
+                {"name": name, "labels": dict(key), **hist.to_dict()}
+                for (name, key), hist in sorted(self._histograms.items(), key=lambda x: x[0])
+            ]
+        return {"generated_at": time.strftime("%Y-%m-%dT%H:%M:%S"), "counters": counters, "histograms": histograms}
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for (name, key), value in sorted(self._counters.items()):
+                lines.append(f"{name}{_format_labels(key)} {value}")
+            for (name, key), hist in sorted(self._histograms.items(), key=lambda x: x[0]):
+                cumulative = 0
+                for bound, count in zip(hist.buckets, hist.counts):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{_format_labels(key, {'le': bound})} {cumulative}")
+                lines.append(f"{name}_bucket{_format_labels(key, {'le': '+Inf'})} {hist.count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {round(hist.sum, 4)}")
+                lines.append(f"{name}_count{_format_labels(key)} {hist.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        """副檔名 .prom / .txt → Prometheus text format；其他 → JSON"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith((".prom", ".txt")):
+                f.write(self.to_prometheus())
+            else:
+                json.dump(self.snapshot(), f, indent=2, ensure_ascii=False)
+        return path
+
+    def dump_phase(self, phase: str, fmt: str = METRICS_FORMAT):
+        """Phase 結束時呼叫：輸出到 METRICS_DIR/<phase>_<timestamp>.json|prom"""
+        ext = "prom" if fmt == "prom" else "json"
+        path = os.path.join(METRICS_DIR, f"{phase}_{time.strftime('%Y%m%d_%H%M%S')}.{ext}")
+        try:
+            self.dump(path)
+            cprint(f"📈 Metrics saved: {path}", "dark_grey")
+        except Exception as e:
+            cprint(f"⚠️ Metrics dump failed: {e}", "yellow")
+        return path
+
+
+# 全域共用實例
+gateway_metrics = GatewayMetrics()
@@ -2,32 +2,76 @@ import os
 import json
 import re
 import time
+import hashlib
 import typing
+import functools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 import google.generativeai as genai
 from tqdm import tqdm
 from termcolor import colored
 from dotenv import load_dotenv
 import pydantic
 
+from src.tools.rate_limiter import is_quota_error
+from src.tools.model_pool import ModelPool, MODEL_POOL_COOLDOWN, parse_api_keys, parse_model_names
+from src.tools.retry_policy import default_retry_policy, get_circuit_breaker, parse_retry_hint, CircuitOpenError
+from src.tools.token_estimator import token_estimator
+from src.tools.response_cache import response_cache
+from src.tools.llm_backend import is_offline
+from src.tools.debug_log import gateway_debug_log
+from src.tools.metrics import gateway_metrics
+from src.tools.token_budget import PROMPT_OUTPUT_RESERVE
+from src.tools.stream_parser import StreamingParser, StreamAbort, item_schema_for, chunk_text, close_stream
+from src.tools.schemas import REPORT_ROOT_KEYS, get_type_adapter, is_pydantic_model, schema_shape
+
 # ==============================================================================
 # Tagged Protocol Parser (The New Secret Sauce)
 # ==============================================================================
 load_dotenv()
 TPM_SAFE_LIMIT = os.getenv("TPM_SAFE_LIMIT", 13000)
+GATEWAY_MAX_CONCURRENCY = int(os.getenv("GATEWAY_MAX_CONCURRENCY", "4"))
+GATEWAY_STREAM = os.getenv("GATEWAY_STREAM", "False").lower() == "true"
+
+# 預先編譯：整段文字只掃一次切出 @@@ 區塊，每個區塊再掃一次切出行首的 KEY: 欄位
+_TAG_BLOCK_RE = re.compile(r'@@@(.*?)@@@', re.DOTALL)
+_TAG_FIELD_RE = re.compile(r'^[ \t]*([A-Za-z_]+):[ \t]*', re.MULTILINE)
+
+_GAP_MARKERS = ("EFFORT", "STRATEGY", "EVIDENCE")
+_ADVISOR_MARKERS = ("RATIONALE", "ACTIONABLE_STEP")
+
+
+@functools.lru_cache(maxsize=None)
+def _tag_aliases(spec: str) -> frozenset:
+    return frozenset(spec.upper().split("|"))
+
+
+def _tokenize_tag_block(block: str) -> list:
+    """一次掃描切出 [(KEY, value), ...]，value 到下一個行首 KEY: 為止 (保留出現順序)"""
+    fields = []
+    prev_key, prev_end = None, 0
+    for match in _TAG_FIELD_RE.finditer(block):
+        if prev_key is not None:
+            fields.append((prev_key, block[prev_end:match.start()].strip()))
+        prev_key, prev_end = match.group(1).upper(), match.end()
+    if prev_key is not None:
+        fields.append((prev_key, block[prev_end:].strip()))
+    return fields
 
-import re
 
 def parse_gemma_tags(raw_text: str) -> dict:
     """
-    [Universal Parser V4] 
-    自動識別 Phase 1 (Skill), Phase 2 (Gap), Phase 3 (Advisor) 的標籤內容，
+    [Universal Parser V5 - Single Pass]
+    自動識別 Phase 1 (Skill), Phase 2 (Gap), Phase 3 (Advisor), Phase 5 (Editor) 的標籤內容，
     並建構對應的巢狀結構 (Nested Objects) 以符合 Pydantic Schema。
+    每個區塊只 tokenize 一次，欄位用 alias 查表 (不再每個欄位各跑一次 regex)。
+    欄位只認「行首」的 KEY: (V4 在行中任何位置都會比對)；值裡面的 "Note: ..." 不會被切成新欄位。
     """
     if not raw_text or not isinstance(raw_text, str):
         return None
 
     # 1. 抓取所有 @@@ 區塊
-    blocks = re.findall(r'@@@(.*?)@@@', raw_text, re.DOTALL)
+    blocks = _TAG_BLOCK_RE.findall(raw_text)
     if not blocks:
         # Fallback: 嘗試直接抓 JSON 或其他格式 (視情況擴充)
         return None
@@ -36,19 +80,22 @@ def parse_gemma_tags(raw_text: str) -> dict:
     detected_type = "SKILL" # 預設類型
 
     for block in blocks:
+        fields = _tokenize_tag_block(block)
+        keys = {k for k, _ in fields}
+
         def extract(key_pattern):
-            # 支援多種 alias，例如 STRATEGY|PLAN
-            pattern = fr'(?:{key_pattern}):\s*(.*?)(?=\n[A-Z_]+:|$)'
-            match = re.search(pattern, block, re.IGNORECASE | re.DOTALL)
-            if match and match.group(1) is not None:
-                return match.group(1).strip()
+            # 支援多種 alias，例如 STRATEGY|PLAN；同一區塊內取最先出現的那個
+            aliases = _tag_aliases(key_pattern)
+            for key, value in fields:
+                if key in aliases:
+                    return value
             return ""
 
         # --- 2. 特徵偵測 (Feature Detection) ---
-        # 根據區塊內含有的標籤來決定這是一筆什麼資料
-        
-        # [Phase 2 Detection] 是否包含 EFFORT 或 STRATEGY?
-        if "EFFORT" in block or "STRATEGY" in block or "EVIDENCE" in block:
+        # 根據區塊內的「欄位名稱」決定這是一筆什麼資料 (內文出現這些字不會誤判)
+
+        # [Phase 2 Detection] 是否包含 EFFORT / STRATEGY / EVIDENCE 類欄位?
+        if any(marker in key for key in keys for marker in _GAP_MARKERS):
             detected_type = "GAP"
             
             # 建構 Phase 2 的巢狀結構 (GapAnalysisItem)
@@ -56,7 +103,7 @@ def parse_gemma_tags(raw_text: str) -> dict:
                 "topic": extract("TOPIC|SKILL"),
                 "evidence_in_personal_db": {
                     "status": extract("EVIDENCE_STATUS|STATUS") or "NOT_FOUND",
-                    "evidence_snippet": extract("EVIDENCE|PROOF") or "No evidence found."
+                    "evidence_snippet": extract("EVIDENCE_SNIPPET|EVIDENCE|PROOF") or "No evidence found."
                 },
                 "resume_reusability": {
                     "status": extract("REUSABILITY_STATUS|REUSABILITY") or "NO_MATCH",
@@ -70,8 +117,8 @@ def parse_gemma_tags(raw_text: str) -> dict:
             }
             results.append(item)
 
-        # [Phase 3 Detection] 是否包含 RATIONALE 或 ADVICE?
-        elif "RATIONALE" in block or "ACTIONABLE_STEP" in block:
+        # [Phase 3 Detection] 是否包含 RATIONALE 或 ACTIONABLE_STEP?
+        elif any(marker in key for key in keys for marker in _ADVISOR_MARKERS):
             detected_type = "ADVISOR"
             
             item = {
@@ -84,7 +131,7 @@ def parse_gemma_tags(raw_text: str) -> dict:
 
         # [Phase 5 Editor Detection] 
         # 偵測是否有 SOURCE (REUSE/NEW) 和 CONTENT
-        elif "SOURCE" in block and "CONTENT" in block:
+        elif "SOURCE" in keys and "CONTENT" in keys:
              detected_type = "EDITOR"
              
              # 提取 ID (有些 LLM 會寫 ID: 1, 有些是 #1)
@@ -112,6 +159,9 @@ def parse_gemma_tags(raw_text: str) -> dict:
                     "quote_from_jd": extract("QUOTE|SOURCE") or "Contextual."
                 }
             }
+            # Panel Mode：每個區塊標記是哪位專家 (EXPERT: E2 / [E2])
+            if "EXPERT" in keys or "EXPERT_ID" in keys:
+                item["expert"] = extract("EXPERT|EXPERT_ID").strip("[]() ").upper()
             results.append(item)
 
     # 3. 根據偵測到的類型回傳正確的 Root Key
@@ -161,6 +211,96 @@ def normalize_structure(data):
     # 這裡保留你之前的修復邏輯 (略，已整合進 parse_gemma_tags)
     return data
 
+def describe_schema(schema) -> str:
+    """把 schema 轉成可以放進 Repair Prompt 的精簡描述"""
+    if schema is None:
+        return ""
+    if isinstance(schema, type) and issubclass(schema, pydantic.BaseModel):
+        return json.dumps(schema.model_json_schema(), ensure_ascii=False, separators=(",", ":"))
+    return getattr(schema, "__doc__", None) or getattr(schema, "__name__", str(schema))
+
+def build_repair_prompt(raw_text: str, error_msg: str, schema=None) -> str:
+    """
+    [Repair Mode] 只送「上一次的輸出 + 錯誤 + Schema」，不再重送整包 JD / Resume DB。
+    """
+    protocol = (
+        "Keep the `@@@` tagged block format (one block per item, `KEY: value` lines)."
+        if "@@@" in (raw_text or "") else
+        "Return raw JSON only. Use double quotes."
+    )
+    schema_desc = describe_schema(schema)
+    parts = [
+        "You previously produced the OUTPUT below, but it was REJECTED by the validator.",
+        "Fix ONLY the problems described in ERROR. Keep all correct content unchanged.",
+        protocol,
+        f"\n### ERROR\n{error_msg}",
+    ]
+    if schema_desc:
+        parts.append(f"\n### TARGET SCHEMA\n{schema_desc}")
+    parts.append(f"\n### OUTPUT\n{raw_text}")
+    parts.append("\n### CORRECTED OUTPUT")
+    return "\n".join(parts)
+
+def _validate_with(schema, data):
+    """
+    適配器：Pydantic Model 走快取的 TypeAdapter；驗證函式直接整包傳入。
+    驗證函式可以丟例外，或回傳 (False, msg)。
+    """
+    try:
+        if is_pydantic_model(schema):
+            get_type_adapter(schema).validate_python(data)
+            return True, ""
+        outcome = schema(data)
+        if isinstance(outcome, tuple) and len(outcome) == 2 and outcome[0] is False:
+            return False, str(outcome[1])
+        return True, ""
+    except Exception as e:
+        return False, str(e)
+
+
+def _build_validator(schema):
+    if not schema:
+        return lambda data: (True, "")
+
+    shape, root_key, item_model = schema_shape(schema)
+
+    if shape == "ITEM":
+        # 傳入的是單一 Item Model (例如 SkillItem)：資料被包在 {"required_skills": [...]} 裡時逐項驗證
+        def validate_items(data):
+            is_root_ok, root_err = _validate_with(schema, data)
+            if is_root_ok:
+                return True, ""
+            if isinstance(data, dict):
+                for key in REPORT_ROOT_KEYS:
+                    if isinstance(data.get(key), list):
+                        for idx, item in enumerate(data[key]):
+                            is_item_ok, item_err = _validate_with(schema, item)
+                            if not is_item_ok:
+                                return False, f"Item {idx} in '{key}' failed: {item_err}"
+                        return True, ""
+            return False, f"Validation failed: {root_err}"
+        return validate_items
+
+    # ROOT (整包 Report) 或驗證函式：整包驗證一次就好，不再拿 Root Schema 去驗每個 Item
+    def validate_root(data):
+        is_ok, err = _validate_with(schema, data)
+        return (True, "") if is_ok else (False, f"Validation failed: {err}")
+    return validate_root
+
+
+_validator_cache = {}
+
+
+def build_validator(schema):
+    """[Smart Dispatcher] 依 schema 建立 (並快取) 驗證函式 data -> (is_valid, error_msg)"""
+    try:
+        validator = _validator_cache.get(schema)
+    except TypeError:
+        return _build_validator(schema)  # 不可 hash 的 schema 不快取
+    if validator is None:
+        validator = _validator_cache[schema] = _build_validator(schema)
+    return validator
+
 # ==============================================================================
 # Main Class: SmartModelGateway
 # ==============================================================================
@@ -178,22 +318,54 @@ class SmartModelGateway:
                 # 認可是 API Key (不印出來)
                 self.config = {"api_key": config}
 
-        if "api_key" not in self.config:
+        # 支援多把 Key：config['api_keys'] / GOOGLE_API_KEYS / config['api_key']
+        api_keys = parse_api_keys(self.config)
+        if not api_keys and not is_offline():
             raise ValueError("❌ Missing 'api_key' in SmartModelGateway config.")
 
-        genai.configure(api_key=self.config["api_key"])
+        if api_keys:
+            # 其他直接用 genai 的地方 (OCR 等) 仍走第一把 Key
+            genai.configure(api_key=api_keys[0])
         
-        lt_name = os.getenv("MODEL_LT_NAME", "gemini-1.5-flash")
-        main_name = os.getenv("MODEL_NAME", "gemma-3-27b-it")
-        tqdm.write(colored(f"  🤖 SmartModelGateway Init: LT={lt_name}, Main={main_name}", "cyan"))
+        # MODEL_NAME / MODEL_LT_NAME 可以用逗號列出多個可互換的 Model
+        lt_names = parse_model_names(os.getenv("MODEL_LT_NAME", "gemini-1.5-flash"))
+        main_names = parse_model_names(os.getenv("MODEL_NAME", "gemma-3-27b-it"))
+        tqdm.write(colored(f"  🤖 SmartModelGateway Init: LT={','.join(lt_names)}, Main={','.join(main_names)}, Keys={max(len(api_keys), 1)}", "cyan"))
         
-        self.flash_model = genai.GenerativeModel(lt_name)
-        self.gemma_model = genai.GenerativeModel(main_name)
+        # 每個 (Key × Model) 一組 RPM/TPM Token Bucket，Pool 依負載 / 剩餘額度分配
+        # LLM_BACKEND=record/replay 時成員會包一層 Cassette (離線 Benchmark 用)
+        self.flash_pool = ModelPool(
+            api_keys, lt_names,
+            rpm=int(os.getenv("MODEL_LT_RPM_LIMIT", "15")),
+            tpm=int(os.getenv("MODEL_LT_TPM_LIMIT", "1000000")),
+        )
+        self.gemma_pool = ModelPool(
+            api_keys, main_names,
+            rpm=int(os.getenv("MODEL_RPM_LIMIT", "30")),
+            tpm=int(os.getenv("TPM_SAFE_LIMIT", "14000")),
+        )
+
+        # 向下相容：單一 Model 的屬性指向各 Pool 的主要成員
+        self.flash_model = self.flash_pool.primary.model
+        self.gemma_model = self.gemma_pool.primary.model
+
+    def model_fingerprint(self) -> str:
+        """目前 Gemma / Flash 兩個 Tier 的 Model 名稱 (換 Model 時讓下游 Cache 失效)"""
+        return f"{self.gemma_pool.model_name}|{self.flash_pool.model_name}"
+
+    def prompt_budget(self, use_gemma: bool = True) -> int:
+        """目標 Model 可接受的 prompt token 預算 (已預留輸出空間)"""
+        if use_gemma:
+            return int(os.getenv("TPM_SAFE_LIMIT", "14000")) - PROMPT_OUTPUT_RESERVE
+        return self.flash_pool.tpm - PROMPT_OUTPUT_RESERVE
 
     def generate(self, prompt: str, *args, **kwargs) -> dict:
         """
         [Expert Council Edition] 
         整合: 14k TPM 哨兵、Pydantic/Function 雙模驗證、Gemma/Flash 自動導流。
+
+        stream=True (預設 GATEWAY_STREAM)：邊收邊解析，逐項驗證，輸出壞掉時提早中斷。
+        on_item(item, index)：串流模式下每個通過驗證的 item 一到就呼叫 (給進度顯示用)。
         """
         # 1. 彈性參數抓取
         # 支援 schema=..., schema_model=..., 或位置參數 args[0]
@@ -207,120 +379,241 @@ class SmartModelGateway:
             use_gemma_req = args[1]
 
         # 2. Token 診斷與 TPM 哨兵
-        try:
-            # 使用 Flash 進行精確計數 (不計入 Gemma 的 TPM 額度)
-            token_count = self.flash_model.count_tokens(prompt).total_tokens
-        except:
-            token_count = len(prompt) // 4 
-
         # 設定 TPM 安全水位為 14,000 (預留 1,000 給輸出)
         # TPM_SAFE_LIMIT = 13000 
         env_limit = os.getenv("TPM_SAFE_LIMIT", "14000")
         tpm_limit = int(env_limit)
         actual_use_gemma = use_gemma_req
+
+        # 本地估算 token 數；只有在校正期或接近門檻時才用 Flash count_tokens 精確計數
+        token_count = token_estimator.count(
+            prompt,
+            limit=tpm_limit - 1000,
+            remote_counter=lambda p: self.flash_model.count_tokens(p).total_tokens
+        )
         
         
-        # 自動分流邏輯
+        # 自動分流邏輯 (最後防線，不會暫停等待輸入)
+        # 正常情況下呼叫端應該先用 TokenBudgetPlanner 把 prompt 縮到 prompt_budget() 以內
         if use_gemma_req and token_count > (tpm_limit - 1000):
-            print("171", tpm_limit, use_gemma_req, token_count)
-            input()
             actual_use_gemma = False
+            gateway_metrics.inc("gateway_fallbacks_total", source=self.gemma_pool.model_name, target=self.flash_pool.model_name)
             tqdm.write(colored(f"  ⚠️ TPM Sentinel: Prompt size ({token_count}) approaching {tpm_limit//1000}k limit. Auto-switching to Flash.", "yellow"))
         elif token_count > 5000:
             # 即使沒破上限，若超過 5k 也給一個提示 (協助診斷是否有資料洩漏)
             tqdm.write(colored(f"  🔍 Diagnostic: Large prompt detected ({token_count} tokens).", "magenta"))
 
-        model = self.gemma_model if actual_use_gemma else self.flash_model
+        pool = self.gemma_pool if actual_use_gemma else self.flash_pool
         
-        # 3. 雙模式驗證核心：解決 'BaseModel.__init__() takes 1 positional argument but 2 were given'
-        def run_validation(validator, target_data):
-            """
-            適配器：自動判斷是 Pydantic Model 類別還是普通驗證函式。
-            """
-            # 檢查是否為 Pydantic Model 類別
-            is_pydantic = isinstance(validator, type) and issubclass(validator, pydantic.BaseModel)
-            
-            try:
-                if is_pydantic:
-                    # 模式 A: Pydantic 類別使用解包傳入 (或使用 model_validate)
-                    # 這能避免將整個 dict 當成第一個 positional argument 丟進 __init__
-                    validator(**target_data) 
-                    return True, ""
-                else:
-                    # 模式 B: 普通驗證函式 (如 validate_council_skill) 直接整包傳入
-                    validator(target_data)
-                    return True, ""
-            except Exception as e:
-                return False, str(e)
-
-        # --- 4. 智能派發器 (Smart Dispatcher) ---
-        def validate_dispatcher(data):
-            if not schema: return True, ""
-            
-            # [策略 A] 優先嘗試「整包驗證」 (Root Validation)
-            # 適用於：你傳入了 SkillExtractionReport, GapAnalysisReport 等完整結構
-            is_root_ok, root_err = run_validation(schema, data)
-            if is_root_ok:
-                return True, ""
-
-            # [策略 B] 如果整包失敗，檢查是否為「包裝結構」並嘗試「逐項驗證」 (Item Validation)
-            # 適用於：你傳入了 SkillItem，但資料被包在 {"required_skills": [...]} 裡面
-            if isinstance(data, dict):
-                target_keys = ["required_skills", "gap_analysis", "strategic_advice"]
-                
-                for key in target_keys:
-                    if key in data and isinstance(data[key], list):
-                        # 發現包裝層，進入拆包模式
-                        for idx, item in enumerate(data[key]):
-                            # 這裡是用原本的 schema 去驗證列表裡的每一個 item
-                            is_item_ok, item_err = run_validation(schema, item)
-                            if not is_item_ok:
-                                # 這裡回傳 Item 級別的錯誤，會比 Root 錯誤更精準
-                                return False, f"Item {idx} in '{key}' failed: {item_err}"
-                        
-                        # 如果所有 Items 都通過，代表這是 Item Schema 模式，驗證成功
-                        return True, ""
-
-            # 如果既不是整包通過，也不是包裝結構問題，那就回傳最原始的 Root 錯誤
-            return False, f"Validation failed: {root_err}"
-
-            # 2. 單一物件模式 (Fallback)
-            # 如果 data 不是包裝結構，或是找不到上述 keys，嘗試直接驗證
-            return run_validation(schema, data)
+        # 3~4. 驗證器 (依 schema 快取：TypeAdapter + 形狀判斷只做一次)
+        validate_dispatcher = build_validator(schema)
 
         # 5. 配置與執行
         gen_config = genai.types.GenerationConfig(
             temperature=0.2 if actual_use_gemma else 0.1
         )
 
-        return self._generate_with_retry_logic(
-            model=model,
+        # 6. Response Cache (Key = 實際產生回應的 Model + Prompt + Schema + GenerationConfig)
+        # Pool 裡的 Model 可以互換：依序查主要 Model 與其他成員的 Model，命中的就是那個 Model 當時的輸出
+        use_cache = kwargs.get('use_cache', True)
+        if use_cache:
+            for model_name in pool.model_names:
+                cached = response_cache.get(response_cache.make_key(model_name, prompt, schema, gen_config))
+                if cached is not None:
+                    gateway_metrics.inc("gateway_cache_hits_total", model=model_name)
+                    tqdm.write(colored(f"  🧠 Response Cache Hit ({model_name})", "blue"))
+                    return cached
+            gateway_metrics.inc("gateway_cache_misses_total", model=pool.model_name)
+
+        result, served_by = self._generate_with_retry_logic(
+            pool=pool,
             prompt=prompt,
             validator_func=validate_dispatcher,
             max_retries=3,
-            generation_config=gen_config
+            generation_config=gen_config,
+            token_count=token_count,
+            schema=schema,
+            stream=kwargs.get('stream', GATEWAY_STREAM),
+            on_item=kwargs.get('on_item'),
         )
 
+        if use_cache and served_by:
+            response_cache.save(response_cache.make_key(served_by, prompt, schema, gen_config), result)
+        return result
+
 
-    def _generate_with_retry_logic(self, model, prompt, validator_func, max_retries, generation_config=None):
-        current_prompt = prompt
+    def generate_many(self, requests: list, schema=None, use_gemma: bool = True, max_workers: int = None) -> list:
+        """
+        [Batch API] 以 Thread Pool 平行執行多個 generate()，結果依輸入順序回傳。
+        並行數受 max_workers (預設 GATEWAY_MAX_CONCURRENCY) 與各 Model 的 Token Bucket 共同限制。
+
+        requests 的每個元素可以是:
+            - str: 只有 prompt (使用共用的 schema / use_gemma)
+            - (prompt, schema) tuple
+            - dict: {"prompt": ..., "schema": ..., "use_gemma": ...}
+        單一項目失敗不影響其他項目，該位置回傳 {"error": ..., "failure_reason": ...}。
+        """
+        if not requests:
+            return []
+
+        def run_one(item):
+            if isinstance(item, dict):
+                kwargs = {"schema": item.get("schema", schema), "use_gemma": item.get("use_gemma", use_gemma)}
+                prompt = item["prompt"]
+            elif isinstance(item, (tuple, list)):
+                prompt = item[0]
+                kwargs = {"schema": item[1] if len(item) > 1 else schema, "use_gemma": use_gemma}
+            else:
+                prompt = item
+                kwargs = {"schema": schema, "use_gemma": use_gemma}
+
+            try:
+                return self.generate(prompt, **kwargs)
+            except Exception as e:
+                tqdm.write(colored(f"  ❌ Batch item failed: {e}", "red"))
+                return {"error": "Batch item failed", "failure_reason": str(e), "debug_dump": None}
+
+        workers = max(1, min(max_workers or GATEWAY_MAX_CONCURRENCY, len(requests)))
+        # 每個項目各自帶一份 context，讓 metrics labels (phase/expert) 跟著進 worker thread
+        contexts = [contextvars.copy_context() for _ in requests]
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            # executor.map 保證輸出順序與輸入相同
+            return list(pool.map(lambda ctx, item: ctx.run(run_one, item), contexts, requests))
+
+
+    @staticmethod
+    def _acquire_member(pool):
+        """
+        借一個 Circuit 沒有 OPEN 的成員：OPEN 的成員暫時移出輪替，改借 Pool 裡其他 Model。
+        回傳 (member, breaker, None)；所有成員的 Circuit 都 OPEN 時回傳 (None, None, CircuitOpenError)
+        """
+        while True:
+            member = pool.acquire()
+            breaker = get_circuit_breaker(member.model_name)
+            try:
+                breaker.before_call()
+                return member, breaker, None
+            except CircuitOpenError as e:
+                pool.release(member)
+                gateway_metrics.inc("gateway_circuit_open_total", model=member.model_name)
+                if all(get_circuit_breaker(name).is_open() for name in pool.model_names):
+                    return None, None, e
+                pool.mark_unavailable(member, max(1.0, breaker.retry_in()))
+                tqdm.write(colored(f"  🔴 {e}. Rotating to other models.", "yellow"))
+
+    def _generate_with_retry_logic(self, pool, prompt, validator_func, max_retries, generation_config=None, token_count=0, schema=None, stream=False, on_item=None):
+        """
+        每一輪都向 ModelPool 借一個 (Key × Model) 成員，429 的成員會被暫時移出輪替。
+
+        重試策略 (Repair Mode)：
+        - 第 1 次：送原始 prompt
+        - 驗證/解析失敗後第 1 次修復：只送「上次輸出 + 錯誤 + Schema」(不含 JD / Resume DB)
+        - 仍失敗：改用 Multi-turn (原始 prompt 當固定前綴 + 上次輸出 + 修正指示)
+        - API 錯誤 (沒有輸出可修)：重送原始 prompt，不會越疊越長
+        - 串流模式被 StreamAbort 中斷時，已收到的部分輸出會當成「上次輸出」進 Repair
+        - API 錯誤：指數退避 + Full Jitter (有 retry hint 就照 hint)；
+          同一個 Model 連續失敗會觸發 Circuit Breaker，OPEN 的成員移出輪替改用 Pool 裡其他 Model；
+          所有成員都 OPEN 時才直接回傳 DEAD，不再空等
+        回傳 (結果, 產生這個結果的 Model 名稱)；失敗時 Model 名稱為 None
+        """
         last_result, last_error_msg = None, "Unknown Error"
-        
-        log_dir = "data"
-        os.makedirs(log_dir, exist_ok=True)
-        log_path = os.path.join(log_dir, "debug_gemma.log")
+        last_raw, repair_stage = None, 0
+        prompt_hash = hashlib.sha1(prompt.encode("utf-8")).hexdigest()[:16]
+        item_schema = item_schema_for(schema) if stream else None
 
         for attempt in range(max_retries + 1):
+            # --- 決定這一輪要送什麼 ---
+            if last_raw is None:
+                request, request_tokens, mode = prompt, token_count, "FULL"
+            elif repair_stage == 1:
+                request = build_repair_prompt(last_raw, last_error_msg, schema)
+                request_tokens, mode = token_estimator.estimate(request), "REPAIR"
+            else:
+                correction = (
+                    f"[SYSTEM ERROR]: {last_error_msg}. "
+                    "Please fix this and output the complete corrected result following the protocol."
+                )
+                request = [
+                    {"role": "user", "parts": [prompt]},
+                    {"role": "model", "parts": [last_raw]},
+                    {"role": "user", "parts": [correction]},
+                ]
+                request_tokens = token_count + token_estimator.estimate(last_raw + correction)
+                mode = "CHAT"
+
+            raw_text, usage, latency = None, None, None
+            # Circuit OPEN 時連 Token Bucket 都不用等；全部成員都 OPEN 才 fail fast
+            member, breaker, circuit_error = self._acquire_member(pool)
+            if member is None:
+                last_error_msg = str(circuit_error)
+                tqdm.write(colored(f"  🔴 {circuit_error}. All models in pool are open, failing fast.", "red"))
+                break
+            model, limiter = member.model, member.limiter
+            log_fields = {"prompt_hash": prompt_hash, "model": member.model_name, "key": member.key_id, "attempt": attempt + 1, "mode": mode}
             try:
-                response = model.generate_content(current_prompt, generation_config=generation_config)
-                raw_text = response.text if response.text else "[EMPTY]"
+                # Token Bucket: 只等 Bucket 需要的時間，而不是固定睡 20/40/60 秒
+                if attempt > 0:
+                    gateway_metrics.inc("gateway_retries_total", model=model.model_name, retry_mode=mode)
+                waited = limiter.acquire(request_tokens)
+                gateway_metrics.observe("gateway_rate_limit_wait_seconds", waited, model=model.model_name, key=member.key_id)
+                if waited > 1:
+                    tqdm.write(colored(f"  ⏳ Rate limiter: waited {waited:.1f}s for {member.label}", "yellow"))
+
+                started = time.perf_counter()
+                if stream:
+                    parser = StreamingParser(item_schema, on_item=on_item)
+                    response = model.generate_content(request, generation_config=generation_config, stream=True)
+                    chunks, completed = iter(response), False
+                    try:
+                        for chunk in chunks:
+                            parser.feed(chunk_text(chunk))
+                        completed = True
+                    except StreamAbort:
+                        # 停止讀取剩下的 chunk；部分輸出交給 Repair Mode (Model 本身是活的)
+                        breaker.record_success()
+                        raw_text = parser.text or "[EMPTY]"
+                        log_fields.update({"latency_ms": round((time.perf_counter() - started) * 1000), "raw_response": raw_text})
+                        gateway_metrics.inc("gateway_stream_aborts_total", model=model.model_name)
+                        raise
+                    finally:
+                        if not completed:
+                            # 不再為注定要修的輸出付費：先取消底層串流，再進 Repair
+                            close_stream(response, chunks)
+                        if parser.first_item_latency is not None:
+                            gateway_metrics.observe("gateway_first_item_seconds", parser.first_item_latency, model=model.model_name)
+                            log_fields["first_item_ms"] = round(parser.first_item_latency * 1000)
+                else:
+                    response = model.generate_content(request, generation_config=generation_config)
+                latency = time.perf_counter() - started
+                breaker.record_success()
+                gateway_metrics.observe("gateway_latency_seconds", latency, model=model.model_name)
+
+                # 回報 Output Tokens (預約時只算了 Input)
+                usage = getattr(response, "usage_metadata", None)
+                if usage:
+                    limiter.record_usage(getattr(usage, "candidates_token_count", 0) or 0)
+                # 免費的校正樣本：原始 prompt 的真實 input token 數
+                if usage:
+                    gateway_metrics.inc("gateway_input_tokens_total", getattr(usage, "prompt_token_count", 0) or 0, model=model.model_name)
+                    gateway_metrics.inc("gateway_output_tokens_total", getattr(usage, "candidates_token_count", 0) or 0, model=model.model_name)
+                if usage and mode == "FULL":
+                    token_estimator.calibrate(prompt, getattr(usage, "prompt_token_count", 0) or 0)
+
+                if stream:
+                    raw_text = parser.text or "[EMPTY]"
+                else:
+                    raw_text = response.text if response.text else "[EMPTY]"
                 
-                tqdm.write(colored(f"\n👀 [DEBUG] Attempt {attempt+1}:", "cyan"))
+                tqdm.write(colored(f"\n👀 [DEBUG] Attempt {attempt+1} ({mode}):", "cyan"))
                 tqdm.write(colored(raw_text[:150].replace('\n', ' ') + "...", "white", attrs=['dark'])) 
 
-                with open(log_path, "a", encoding="utf-8") as f:
-                    f.write(f"\n\n{'='*20} ATTEMPT {attempt+1} ({time.strftime('%H:%M:%S')}) {'='*20}\n")
-                    f.write(f"--- RAW RESPONSE ---\n{raw_text}\n{'='*50}\n")
+                log_fields.update({
+                    "latency_ms": round(latency * 1000),
+                    "request_tokens": request_tokens,
+                    "prompt_tokens": getattr(usage, "prompt_token_count", None),
+                    "output_tokens": getattr(usage, "candidates_token_count", None),
+                    "raw_response": raw_text,
+                })
 
                 # --- 核心解析分支 ---
                 if "@@@" in raw_text:
@@ -339,22 +632,40 @@ class SmartModelGateway:
                 
                 is_valid, error_msg = validator_func(result_json)
                 if is_valid:
-                    if attempt > 0: tqdm.write(colored(f"  ✨ Repaired on attempt {attempt+1}", "yellow"))
-                    return result_json
+                    gateway_debug_log.record(status="ok", **log_fields)
+                    gateway_metrics.inc("gateway_requests_total", model=model.model_name, key=member.key_id, status="ok")
+                    if attempt > 0: tqdm.write(colored(f"  ✨ Repaired on attempt {attempt+1} ({mode})", "yellow"))
+                    return result_json, member.model_name
                 
+                gateway_debug_log.record(status="invalid", error=error_msg, **log_fields)
+                gateway_metrics.inc("gateway_requests_total", model=model.model_name, key=member.key_id, status="invalid")
+                gateway_metrics.inc("gateway_validation_failures_total", model=model.model_name)
                 last_error_msg = error_msg
                 tqdm.write(colored(f"  ⚠️ Validation failed: {error_msg}", "light_red"))
-                
-                if attempt < max_retries:
-                    wait_time = 20 * (attempt + 1)
-                    current_prompt += f"\n\n[SYSTEM ERROR]: {error_msg}. Please fix this and follow the protocol."
-                    tqdm.write(colored(f"  ⏳ Sleeping {wait_time}s...", "yellow"))
-                    time.sleep(wait_time)
+                last_raw, repair_stage = raw_text, repair_stage + 1
 
             except Exception as e:
                 last_error_msg = str(e)
+                gateway_debug_log.record(status="error", error=last_error_msg, **log_fields)
+                gateway_metrics.inc("gateway_requests_total", model=model.model_name, key=member.key_id, status="invalid" if raw_text is not None else "error")
+                if raw_text is not None:
+                    gateway_metrics.inc("gateway_validation_failures_total", model=model.model_name)
                 tqdm.write(colored(f"  ❌ Error (Attempt {attempt+1}): {e}", "red"))
-                if attempt < max_retries: time.sleep(20 * (attempt + 1))
-
+                if raw_text is not None:
+                    # 有拿到輸出但解析失敗 → 下一輪修這份輸出
+                    last_raw, repair_stage = raw_text, repair_stage + 1
+                elif is_quota_error(e):
+                    # 429：這把 Key 暫時移出輪替 (有 retry hint 就照 hint 的秒數)；Model 沒掛也沒成功 → Breaker 不動
+                    breaker.release()
+                    pool.mark_throttled(member, parse_retry_hint(e) or MODEL_POOL_COOLDOWN)
+                else:
+                    # 其他 API 錯誤 (5xx / timeout)：記入 Circuit Breaker，指數退避後再試
+                    breaker.record_failure()
+                    if attempt < max_retries:
+                        default_retry_policy.sleep(attempt, e, label=member.label)
+            finally:
+                pool.release(member)
+
+        gateway_metrics.inc("gateway_dead_total", model=pool.model_name)
         tqdm.write(colored(f"  💀 DEAD: {last_error_msg}", "red", attrs=['bold']))
-        return {"error": "Max retries reached", "failure_reason": last_error_msg, "debug_dump": last_result}
\ No newline at end of file
+        return {"error": "Max retries reached", "failure_reason": last_error_msg, "debug_dump": last_result}, None
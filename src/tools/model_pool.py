@@ -0,0 +1,139 @@
+import os
+import time
+import hashlib
+import threading
+import google.generativeai as genai
+import google.ai.generativelanguage as glm
+from tqdm import tqdm
+from termcolor import colored
+
+from src.tools.rate_limiter import get_rate_limiter
+from src.tools.llm_backend import wrap_model
+
+# ==============================================================================
+# Multi-Key / Multi-Project Model Pool
+# ==============================================================================
+# 一個 Tier (例如 Gemma 或 Flash) 底下可以有多個 (API Key × Model Name) 成員：
+# - 每個成員有自己的 client 與 RPM/TPM 限流器 (配額是跟著 Key 走的)
+# - 依 least_loaded (最少 in-flight) 或 quota (剩餘額度最多) 挑選成員
+# - 收到 429 的成員暫時移出輪替 (cooldown)，其他成員繼續跑
+
+MODEL_POOL_STRATEGY = os.getenv("MODEL_POOL_STRATEGY", "least_loaded").lower()  # least_loaded | quota
+MODEL_POOL_COOLDOWN = float(os.getenv("MODEL_POOL_COOLDOWN", "60"))
+
+
+def parse_api_keys(config: dict) -> list:
+    """收集所有 API Key：config['api_keys'] / GOOGLE_API_KEYS (逗號分隔) / config['api_key']"""
+    keys = list(config.get("api_keys") or [])
+    keys += [k.strip() for k in os.getenv("GOOGLE_API_KEYS", "").split(",") if k.strip()]
+    if config.get("api_key"):
+        keys.append(config["api_key"])
+    # 去重但保留順序
+    return list(dict.fromkeys(keys))
+
+
+def parse_model_names(value: str) -> list:
+    return [n.strip() for n in (value or "").split(",") if n.strip()]
+
+
+def _key_id(api_key: str) -> str:
+    """Log / Limiter 用的 Key 代號 (不會印出 Key 本身)"""
+    if not api_key:
+        return "default"
+    return "key_" + hashlib.sha1(api_key.encode("utf-8")).hexdigest()[:6]
+
+
+def _model_for_key(model_name: str, api_key: str):
+    """
+    建立綁定特定 API Key 的 GenerativeModel (不依賴全域 genai.configure)。
+    Client 用公開的 glm.GenerativeServiceClient 建；但 GenerativeModel 沒有公開的注入點，
+    只能設定 _client (第一次呼叫時才會填預設 client)。SDK 改了這個屬性就直接報錯，
+    不能默默退回全域 Key (所有成員共用同一把 Key 的額度)。版本固定在 requirements.txt。
+    """
+    model = genai.GenerativeModel(model_name)
+    if api_key:
+        if getattr(model, "_client", object()) is not None:
+            raise RuntimeError(
+                f"google-generativeai {genai.__version__}: GenerativeModel._client is missing or pre-set; "
+                "per-key model binding needs updating (see requirements.txt)"
+            )
+        model._client = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+    return model
+
+
+class PoolMember:
+    def __init__(self, api_key: str, model_name: str, rpm: int, tpm: int):
+        self.key_id = _key_id(api_key)
+        self.model_name = model_name
+        self.model = wrap_model(_model_for_key(model_name, api_key))
+        self.limiter = get_rate_limiter(f"{self.key_id}:{model_name}", rpm=rpm, tpm=tpm)
+        self.in_flight = 0
+        self.cooldown_until = 0.0
+
+    @property
+    def label(self) -> str:
+        return f"{self.key_id}:{self.model_name}"
+
+
+class ModelPool:
+    def __init__(self, api_keys: list, model_names: list, rpm: int, tpm: int, strategy: str = MODEL_POOL_STRATEGY):
+        if not model_names:
+            raise ValueError("❌ ModelPool needs at least one model name.")
+        keys = api_keys or [None]
+        self.members = [PoolMember(k, n, rpm, tpm) for k in keys for n in model_names]
+        self.model_name = model_names[0]  # 主要名稱 (Metrics / 指紋用)
+        self.strategy = strategy
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self) -> PoolMember:
+        return self.members[0]
+
+    @property
+    def model_names(self) -> list:
+        """Pool 裡所有 (可互換的) Model 名稱，主要的排第一個"""
+        return list(dict.fromkeys(m.model_name for m in self.members))
+
+    @property
+    def tpm(self) -> int:
+        return self.primary.limiter.tpm
+
+    def _score(self, member: PoolMember):
+        headroom = member.limiter.headroom()
+        if self.strategy == "quota":
+            return (-headroom, member.in_flight)
+        return (member.in_flight, -headroom)
+
+    def acquire(self) -> PoolMember:
+        """挑一個成員 (in_flight + 1)。全部都在 cooldown 時，等最早恢復的那個"""
+        with self._lock:
+            now = time.monotonic()
+            ready = [m for m in self.members if m.cooldown_until <= now]
+            if ready:
+                member = min(ready, key=self._score)
+                wait = 0.0
+            else:
+                member = min(self.members, key=lambda m: m.cooldown_until)
+                wait = member.cooldown_until - now
+            member.in_flight += 1
+        if wait > 0:
+            tqdm.write(colored(f"  ⏳ All keys throttled. Waiting {wait:.0f}s for {member.label}", "yellow"))
+            time.sleep(wait)
+        return member
+
+    def release(self, member: PoolMember):
+        with self._lock:
+            member.in_flight = max(0, member.in_flight - 1)
+
+    def mark_unavailable(self, member: PoolMember, seconds: float):
+        """非配額原因 (例如 Circuit OPEN) 暫時移出輪替；不動限流器"""
+        with self._lock:
+            member.cooldown_until = max(member.cooldown_until, time.monotonic() + seconds)
+
+    def mark_throttled(self, member: PoolMember, seconds: float = MODEL_POOL_COOLDOWN):
+        """429 時把這個成員移出輪替一段時間"""
+        with self._lock:
+            member.cooldown_until = max(member.cooldown_until, time.monotonic() + seconds)
+        member.limiter.throttle(quota_exceeded=True)
+        if len(self.members) > 1:
+            tqdm.write(colored(f"  🔁 {member.label} throttled for {seconds:.0f}s, rotating to other keys.", "yellow"))
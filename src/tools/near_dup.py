@@ -0,0 +1,132 @@
+import os
+import re
+import random
+import hashlib
+import threading
+
+from src.tools.sqlite_store import SQLiteLRUStore
+
+# ==============================================================================
+# Near-Duplicate JD Index (MinHash + LSH)
+# ==============================================================================
+# 同一份 JD 被重新張貼 (改日期、換地點那一行) 時 md5 會不同，但 shingle 幾乎一樣：
+# - 正規化 (小寫、數字 → 0、合併空白) 後取 word 5-gram shingles
+# - MinHash 簽章 (NEAR_DUP_NUM_PERM 個 hash) 估計 Jaccard 相似度
+# - LSH 分 band 找候選，只跟候選比簽章，不用全表掃
+# 簽章存在 Council Cache 同一個 SQLite 檔 (jd_minhash table)，Band Index 在第一次查詢時載入記憶體。
+
+NEAR_DUP_ENABLED = os.getenv("NEAR_DUP_ENABLED", "True").lower() == "true"
+NEAR_DUP_THRESHOLD = float(os.getenv("NEAR_DUP_THRESHOLD", "0.9"))
+NEAR_DUP_NUM_PERM = int(os.getenv("NEAR_DUP_NUM_PERM", "128"))
+NEAR_DUP_BANDS = int(os.getenv("NEAR_DUP_BANDS", "32"))
+NEAR_DUP_SHINGLE = int(os.getenv("NEAR_DUP_SHINGLE", "5"))
+
+_MERSENNE_PRIME = (1 << 61) - 1
+_MAX_HASH = (1 << 32) - 1
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_DIGIT_RE = re.compile(r"\d")
+
+
+def shingles(text: str, size: int = NEAR_DUP_SHINGLE) -> set:
+    words = _WORD_RE.findall(_DIGIT_RE.sub("0", (text or "").lower()))
+    if len(words) < size:
+        return {" ".join(words)} if words else set()
+    return {" ".join(words[i:i + size]) for i in range(len(words) - size + 1)}
+
+
+def _hash32(shingle: str) -> int:
+    return int.from_bytes(hashlib.blake2b(shingle.encode("utf-8"), digest_size=4).digest(), "little")
+
+
+class MinHasher:
+    """固定 seed 的 (a*x + b) mod p 排列，簽章跨 Process / 重啟都一致"""
+
+    def __init__(self, num_perm: int = NEAR_DUP_NUM_PERM, seed: int = 1):
+        rng = random.Random(seed)
+        self.num_perm = num_perm
+        self.perms = [(rng.randrange(1, _MERSENNE_PRIME), rng.randrange(0, _MERSENNE_PRIME)) for _ in range(num_perm)]
+
+    def signature(self, text: str) -> list:
+        hashes = [_hash32(s) for s in shingles(text)]
+        if not hashes:
+            return [_MAX_HASH] * self.num_perm
+        return [min(((a * h + b) % _MERSENNE_PRIME) & _MAX_HASH for h in hashes) for a, b in self.perms]
+
+    @staticmethod
+    def similarity(sig_a: list, sig_b: list) -> float:
+        if not sig_a or len(sig_a) != len(sig_b):
+            return 0.0
+        return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / len(sig_a)
+
+
+class NearDuplicateIndex:
+    def __init__(self, db_path: str, threshold: float = NEAR_DUP_THRESHOLD, num_perm: int = NEAR_DUP_NUM_PERM,
+                 bands: int = NEAR_DUP_BANDS, enabled: bool = NEAR_DUP_ENABLED, max_entries: int = 50000):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm)
+        self.bands = max(1, min(bands, num_perm))
+        self.rows = num_perm // self.bands
+        self.store = SQLiteLRUStore(db_path, table="jd_minhash", max_entries=max_entries)
+        self._lock = threading.Lock()
+        self._signatures = None   # doc_id -> signature
+        self._buckets = {}        # (band, hash) -> {doc_id}
+
+    @staticmethod
+    def doc_id(text: str) -> str:
+        """與 CouncilCache 相同的 JD 指紋 (md5)"""
+        return hashlib.md5(text.encode("utf-8")).hexdigest()
+
+    def _band_keys(self, signature: list):
+        for band in range(self.bands):
+            chunk = signature[band * self.rows:(band + 1) * self.rows]
+            yield (band, hash(tuple(chunk)))
+
+    def _index(self, doc_id: str, signature: list):
+        self._signatures[doc_id] = signature
+        for key in self._band_keys(signature):
+            self._buckets.setdefault(key, set()).add(doc_id)
+
+    def _load(self):
+        """第一次使用時把所有簽章載入記憶體並建 Band Index"""
+        if self._signatures is not None:
+            return
+        self._signatures = {}
+        for doc_id, signature in self.store.items():
+            if isinstance(signature, list) and len(signature) == self.hasher.num_perm:
+                self._index(doc_id, signature)
+
+    def add(self, text: str, doc_id: str = None):
+        if not self.enabled or not text:
+            return
+        doc_id = doc_id or self.doc_id(text)
+        with self._lock:
+            self._load()
+            if doc_id in self._signatures:
+                return
+            signature = self.hasher.signature(text)
+            self._index(doc_id, signature)
+        self.store.set(doc_id, signature)
+
+    def query(self, text: str, doc_id: str = None):
+        """
+        找最像的「另一份」JD。回傳 {"jd_hash", "similarity"}；低於門檻回傳 None。
+        """
+        if not self.enabled or not text:
+            return None
+        doc_id = doc_id or self.doc_id(text)
+        signature = self.hasher.signature(text)
+        with self._lock:
+            self._load()
+            candidates = set()
+            for key in self._band_keys(signature):
+                candidates |= self._buckets.get(key, set())
+            candidates.discard(doc_id)
+            best, best_score = None, 0.0
+            for candidate in candidates:
+                score = self.hasher.similarity(signature, self._signatures[candidate])
+                if score > best_score:
+                    best, best_score = candidate, score
+        if best is None or best_score < self.threshold:
+            return None
+        return {"jd_hash": best, "similarity": round(best_score, 3)}
@@ -0,0 +1,135 @@
+import os
+import threading
+import time
+
+# ==============================================================================
+# Token Bucket Rate Limiter (RPM + TPM)
+# ==============================================================================
+# 取代 Gateway 裡「失敗就睡 20/40/60 秒」的做法：
+# 每個 Model 共用一組 Bucket，呼叫前只等「Bucket 真的需要的時間」。
+
+DEFAULT_RPM_LIMIT = int(os.getenv("MODEL_RPM_LIMIT", "30"))
+DEFAULT_TPM_LIMIT = int(os.getenv("TPM_SAFE_LIMIT", "14000"))
+
+
+class TokenBucket:
+    """
+    經典 Token Bucket：容量 capacity，每秒補充 refill_rate。
+    reserve() 採「預約制」：先扣款 (可以扣成負數)，再回傳需要等待的秒數，
+    這樣多執行緒同時排隊時也能維持先來先服務，不需要 busy loop。
+    """
+
+    def __init__(self, capacity: float, refill_rate: float):
+        self.capacity = float(capacity)
+        self.refill_rate = float(refill_rate)
+        self.tokens = float(capacity)
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.refill_rate)
+            self.updated_at = now
+
+    def reserve(self, amount: float, now: float) -> float:
+        """扣除 amount，回傳需要等待幾秒才能讓餘額回到 >= 0"""
+        # 單次需求超過容量時，只扣到容量上限 (否則永遠等不到)
+        amount = min(float(amount), self.capacity)
+        self._refill(now)
+        self.tokens -= amount
+        if self.tokens >= 0:
+            return 0.0
+        return -self.tokens / self.refill_rate
+
+    def adjust(self, amount: float, now: float):
+        """事後補扣 (amount > 0) 或退款 (amount < 0)"""
+        self._refill(now)
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+    def drain(self, now: float):
+        """清空 Bucket (例如收到 429 時)"""
+        self._refill(now)
+        self.tokens = min(self.tokens, 0.0)
+
+
+class ModelRateLimiter:
+    """
+    單一 Model 的 RPM / TPM 雙桶限流器 (Thread-safe)。
+    """
+
+    def __init__(self, model_name: str, rpm: int = DEFAULT_RPM_LIMIT, tpm: int = DEFAULT_TPM_LIMIT):
+        self.model_name = model_name
+        self.rpm = int(rpm)
+        self.tpm = int(tpm)
+        self._lock = threading.Lock()
+        self._requests = TokenBucket(self.rpm, self.rpm / 60.0)
+        self._tokens = TokenBucket(self.tpm, self.tpm / 60.0)
+
+    def acquire(self, tokens: int = 0) -> float:
+        """
+        在送出 Request 前呼叫：預約 1 個 request + tokens 個 token，
+        並阻塞到兩個 Bucket 都允許為止。回傳實際等待秒數。
+        """
+        with self._lock:
+            now = time.monotonic()
+            wait = max(
+                self._requests.reserve(1, now),
+                self._tokens.reserve(max(int(tokens), 0), now),
+            )
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def record_usage(self, extra_tokens: int):
+        """回報預約之外實際用掉的 token (例如 output tokens)"""
+        if not extra_tokens:
+            return
+        with self._lock:
+            self._tokens.adjust(extra_tokens, time.monotonic())
+
+    def headroom(self) -> float:
+        """目前剩餘額度比例 (0~1)，取 RPM / TPM 兩者較小者；給 ModelPool 選 Key 用"""
+        with self._lock:
+            now = time.monotonic()
+            self._requests._refill(now)
+            self._tokens._refill(now)
+            return max(0.0, min(self._requests.tokens / self._requests.capacity,
+                                self._tokens.tokens / self._tokens.capacity))
+
+    def throttle(self, quota_exceeded: bool = False):
+        """
+        呼叫失敗時使用：清空 Request Bucket，讓下一次嘗試自然等待一個補充週期；
+        若是配額錯誤 (429)，連 Token Bucket 也一起清空。
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._requests.drain(now)
+            if quota_exceeded:
+                self._tokens.drain(now)
+
+
+# ------------------------------------------------------------------------------
+# 全域 Registry：同一個 Process 內，同一個 Model 共用同一組 Bucket
+# ------------------------------------------------------------------------------
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_rate_limiter(model_name: str, rpm: int = None, tpm: int = None) -> ModelRateLimiter:
+    """取得 (或建立) 指定 Model 的共用限流器"""
+    with _registry_lock:
+        limiter = _registry.get(model_name)
+        if limiter is None:
+            limiter = ModelRateLimiter(
+                model_name,
+                rpm=rpm if rpm is not None else DEFAULT_RPM_LIMIT,
+                tpm=tpm if tpm is not None else DEFAULT_TPM_LIMIT,
+            )
+            _registry[model_name] = limiter
+        return limiter
+
+
+def is_quota_error(error: Exception) -> bool:
+    """判斷是否為 429 / Quota 類錯誤"""
+    text = f"{type(error).__name__} {error}".lower()
+    return any(k in text for k in ["429", "resourceexhausted", "resource exhausted", "quota", "rate limit"])
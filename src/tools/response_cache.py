@@ -0,0 +1,84 @@
+import os
+import json
+import hashlib
+import dataclasses
+
+from src.tools.sqlite_store import SQLiteLRUStore
+
+# ==============================================================================
+# Content-Addressed LLM Response Cache
+# ==============================================================================
+# Key = Hash(Model + Prompt + Schema + GenerationConfig)
+# 任何 Phase 重跑時，同樣的 Prompt 不會再燒一次額度。
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "True").lower() == "true"
+LLM_CACHE_PATH = os.getenv("LLM_CACHE_PATH", "/app/data/cache/llm_responses.sqlite3")
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "20000"))
+LLM_CACHE_MAX_MB = int(os.getenv("LLM_CACHE_MAX_MB", "512"))
+
+
+def _config_fingerprint(generation_config):
+    """GenerationConfig 可能是 dataclass、dict 或 None，統一轉成可排序的 dict"""
+    if generation_config is None:
+        return None
+    if dataclasses.is_dataclass(generation_config):
+        data = dataclasses.asdict(generation_config)
+    elif isinstance(generation_config, dict):
+        data = dict(generation_config)
+    else:
+        data = {"repr": repr(generation_config)}
+    return {k: v for k, v in data.items() if v is not None}
+
+
+def _schema_name(schema):
+    if schema is None:
+        return None
+    if isinstance(schema, str):
+        return schema
+    return getattr(schema, "__name__", repr(schema))
+
+
+class ResponseCache:
+    def __init__(self, db_path=LLM_CACHE_PATH, enabled=LLM_CACHE_ENABLED,
+                 max_entries=LLM_CACHE_MAX_ENTRIES, max_mb=LLM_CACHE_MAX_MB):
+        self.enabled = enabled
+        self.store = SQLiteLRUStore(db_path, table="responses", max_entries=max_entries,
+                                    max_bytes=max_mb * 1024 * 1024)
+
+    @staticmethod
+    def make_key(model_name, prompt, schema=None, generation_config=None) -> str:
+        material = json.dumps(
+            [model_name, prompt, _schema_name(schema), _config_fingerprint(generation_config)],
+            ensure_ascii=False, sort_keys=True, default=str,
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def model_identity(model):
+        """
+        直接拿 Model 物件呼叫時 Key 用的 (Model 名稱, GenerationConfig)。
+        genai.GenerativeModel 沒有公開的 generation_config，只能讀 _generation_config；
+        名稱或設定認不出來時回傳 (None, None)，呼叫端就不用 Cache (不同 Model 不能共用同一組 Key)。
+        """
+        name = getattr(model, "model_name", None)
+        config = getattr(model, "_generation_config", None)
+        if not isinstance(name, str) or not name or config is None:
+            return None, None
+        return name, config
+
+    def get(self, key):
+        if not self.enabled:
+            return None
+        return self.store.get(key)
+
+    def save(self, key, response_data):
+        """只存成功的結果 (帶 error 的 dict 不存)"""
+        if not self.enabled or response_data is None:
+            return
+        if isinstance(response_data, dict) and response_data.get("error"):
+            return
+        self.store.set(key, response_data)
+
+
+# 全域共用實例
+response_cache = ResponseCache()
@@ -0,0 +1,159 @@
+import os
+import re
+import time
+import random
+import threading
+from tqdm import tqdm
+from termcolor import colored
+
+# ==============================================================================
+# Retry Policy (Exponential Backoff + Full Jitter) & Circuit Breaker
+# ==============================================================================
+# 所有 LLM / 外部 API 呼叫點共用：
+# - 第 n 次重試等待 uniform(0, min(max_delay, base * 2^n))，避免大家同一秒一起重打
+# - 伺服器有給 retry hint (retry in 12s / retry_delay { seconds: 31 } / Retry-After) 時至少等那麼久
+# - 每個 Model 一個 Circuit Breaker：連續失敗達門檻就 OPEN，冷卻期間直接 fail fast，
+#   冷卻結束放一個探測請求 (HALF_OPEN)，成功才恢復
+
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "2"))
+RETRY_MAX_DELAY = float(os.getenv("RETRY_MAX_DELAY", "60"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RESET_TIMEOUT = float(os.getenv("CIRCUIT_RESET_TIMEOUT", "60"))
+
+_HINT_PATTERNS = [
+    re.compile(r"retry[_ ]delay\s*\{\s*seconds:\s*(\d+(?:\.\d+)?)", re.IGNORECASE),
+    re.compile(r"retry[- ]after:?\s*(\d+(?:\.\d+)?)", re.IGNORECASE),
+    re.compile(r"retry in\s*(\d+(?:\.\d+)?)\s*(ms|s)?", re.IGNORECASE),
+]
+
+
+class CircuitOpenError(RuntimeError):
+    """Circuit Breaker 為 OPEN：這個 Model 目前被判定掛掉，直接 fail fast"""
+
+
+def parse_retry_hint(error) -> float:
+    """從例外中找伺服器建議的等待秒數；找不到回傳 None"""
+    if error is None:
+        return None
+    delay = getattr(error, "retry_delay", None) or getattr(error, "retry_after", None)
+    if delay is not None:
+        seconds = getattr(delay, "total_seconds", None)
+        try:
+            return float(seconds() if callable(seconds) else delay)
+        except (TypeError, ValueError):
+            pass
+    text = str(error)
+    for pattern in _HINT_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            value = float(match.group(1))
+            if match.lastindex and match.lastindex > 1 and (match.group(2) or "").lower() == "ms":
+                value /= 1000.0
+            return value
+    return None
+
+
+class RetryPolicy:
+    def __init__(self, base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY, rng=None):
+        self.base_delay = float(base_delay)
+        self.max_delay = float(max_delay)
+        self._rng = rng or random.Random()
+
+    def backoff(self, attempt: int, error=None) -> float:
+        """第 attempt 次 (從 0 開始) 失敗後要等幾秒"""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** attempt))
+        delay = self._rng.uniform(0, ceiling)
+        hint = parse_retry_hint(error)
+        if hint is not None:
+            delay = max(delay, hint)
+        return delay
+
+    def sleep(self, attempt: int, error=None, label: str = "") -> float:
+        delay = self.backoff(attempt, error)
+        if delay >= 1:
+            tqdm.write(colored(f"  ⏳ Backoff {delay:.1f}s{f' ({label})' if label else ''}", "yellow"))
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+
+class CircuitBreaker:
+    CLOSED, OPEN, HALF_OPEN = "CLOSED", "OPEN", "HALF_OPEN"
+
+    def __init__(self, name: str, failure_threshold: int = CIRCUIT_FAILURE_THRESHOLD, reset_timeout: float = CIRCUIT_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True  # 只放一個探測請求
+                return True
+            return False
+
+    def before_call(self):
+        """呼叫前檢查；OPEN 時丟 CircuitOpenError"""
+        if not self.allow():
+            remaining = max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+            raise CircuitOpenError(f"Circuit open for {self.name} (retry in {remaining:.0f}s)")
+
+    def is_open(self) -> bool:
+        """現在呼叫會不會被擋下 (不改變狀態)：OPEN 冷卻中，或 HALF_OPEN 的探測名額已被借走"""
+        with self._lock:
+            if self.state == self.OPEN:
+                return time.monotonic() - self.opened_at < self.reset_timeout
+            return self.state == self.HALF_OPEN and self._probe_in_flight
+
+    def retry_in(self) -> float:
+        """OPEN 時還要冷卻幾秒"""
+        with self._lock:
+            if self.state != self.OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self.opened_at))
+
+    def release(self):
+        """呼叫沒有結論 (例如 429：額度用完，Model 沒掛)：不改狀態，只把 HALF_OPEN 的探測名額還回去"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                tqdm.write(colored(f"  🟢 Circuit closed: {self.name}", "green"))
+            self.state, self.failures, self._probe_in_flight = self.CLOSED, 0, False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    tqdm.write(colored(f"  🔴 Circuit OPEN: {self.name} ({self.failures} consecutive failures, cooling {self.reset_timeout:.0f}s)", "red"))
+                self.state, self.opened_at, self._probe_in_flight = self.OPEN, time.monotonic(), False
+
+
+# ------------------------------------------------------------------------------
+# 全域 Registry：同一個 Process 內，同一個 Model 共用同一個 Breaker
+# ------------------------------------------------------------------------------
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+default_retry_policy = RetryPolicy()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    with _breakers_lock:
+        breaker = _breakers.get(name)
+        if breaker is None:
+            breaker = _breakers[name] = CircuitBreaker(name)
+        return breaker
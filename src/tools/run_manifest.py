@@ -0,0 +1,155 @@
+import os
+import time
+import sqlite3
+import threading
+from termcolor import colored
+
+# ==============================================================================
+# Run Manifest (Phase 3 工作單位狀態)
+# ==============================================================================
+# 每個 (Dossier, Expert, Mode) 一列：PENDING → RUNNING → DONE / FAILED，記錄嘗試次數與錯誤。
+# - 重跑時 DONE 的單位直接跳過 (不用再查 Council Cache 才知道做過了)
+# - 整份 Dossier 完成時記下檔案的 mtime；檔案沒變就連讀都不用讀
+# - --retry-failed：只處理有 FAILED / 中斷 (RUNNING) 單位的 Dossier，而且只重跑那些單位
+# input_hash (JD + Persona / 模板 / Schema / Model / 履歷 Context 的指紋) 變了的話，舊的 DONE 不算數；
+# 整份 Dossier 的完成紀錄也帶同一組 Council 指紋，改了 Prompt 或換 Model 就不會被整份跳過。
+# Manifest 開不起來 (唯讀 / 壞掉) 時停用：什麼都不跳過、什麼都不記，Pipeline 照跑。
+
+P3_MANIFEST_PATH = os.getenv("P3_MANIFEST_PATH", "/app/data/cache/p3_manifest.sqlite3")
+
+
+class RunManifest:
+    PENDING, RUNNING, DONE, FAILED = "PENDING", "RUNNING", "DONE", "FAILED"
+
+    def __init__(self, db_path: str = P3_MANIFEST_PATH):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disabled = False
+
+    def _connect(self):
+        if self._conn is not None or self._disabled:
+            return self._conn
+        try:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS units ("
+                " dossier_id TEXT NOT NULL, expert TEXT NOT NULL, mode TEXT NOT NULL,"
+                " state TEXT NOT NULL, attempts INTEGER NOT NULL DEFAULT 0, error TEXT,"
+                " input_hash TEXT, updated_at REAL NOT NULL,"
+                " PRIMARY KEY (dossier_id, expert, mode))"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS dossiers ("
+                " dossier_id TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, fingerprint TEXT, updated_at REAL NOT NULL)"
+            )
+            if "fingerprint" not in {row[1] for row in conn.execute("PRAGMA table_info(dossiers)")}:
+                conn.execute("ALTER TABLE dossiers ADD COLUMN fingerprint TEXT")  # 舊版 Manifest：整份重跑一次
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_units_state ON units(state)")
+            conn.commit()
+            self._conn = conn
+        except Exception as e:
+            # Manifest 只是加速用，掛掉不應該讓整個 Pipeline 掛掉，直接停用
+            print(colored(f"  ⚠️ Run manifest disabled ({self.db_path}): {e}", "yellow"))
+            self._disabled = True
+        return self._conn
+
+    # --- Unit 狀態 ---
+    def units(self, dossier_id: str) -> dict:
+        """{(expert, mode): {"state", "attempts", "error", "input_hash"}}"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return {}
+            rows = conn.execute(
+                "SELECT expert, mode, state, attempts, error, input_hash FROM units WHERE dossier_id = ?", (dossier_id,)
+            ).fetchall()
+        return {(e, m): {"state": s, "attempts": a, "error": err, "input_hash": h} for e, m, s, a, err, h in rows}
+
+    def mark(self, dossier_id: str, expert: str, mode: str, state: str, error: str = None, input_hash: str = None):
+        """RUNNING 時 attempts + 1；DONE 會清掉 error"""
+        bump = 1 if state == self.RUNNING else 0
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            conn.execute(
+                "INSERT INTO units (dossier_id, expert, mode, state, attempts, error, input_hash, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT(dossier_id, expert, mode) DO UPDATE SET"
+                " state = excluded.state, attempts = attempts + ?, error = excluded.error,"
+                " input_hash = COALESCE(excluded.input_hash, input_hash), updated_at = excluded.updated_at",
+                (dossier_id, expert, mode, state, bump, error, input_hash, time.time(), bump),
+            )
+            conn.commit()
+
+    def is_done(self, units: dict, expert: str, mode: str, input_hash: str = None) -> bool:
+        unit = units.get((expert, mode))
+        return bool(unit) and unit["state"] == self.DONE and (input_hash is None or unit["input_hash"] == input_hash)
+
+    # --- Dossier 狀態 ---
+    def dossier_done(self, dossier_id: str, filepath: str, fingerprint: str = None) -> bool:
+        """整份 Dossier 上次已完成，檔案之後沒被改過，而且當時的 Council 指紋跟現在一樣"""
+        try:
+            mtime_ns = os.stat(filepath).st_mtime_ns
+        except OSError:
+            return False
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return False
+            row = conn.execute("SELECT mtime_ns, fingerprint FROM dossiers WHERE dossier_id = ?", (dossier_id,)).fetchone()
+        return bool(row) and row[0] == mtime_ns and row[1] == fingerprint
+
+    def mark_dossier_done(self, dossier_id: str, filepath: str, fingerprint: str = None):
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO dossiers (dossier_id, mtime_ns, fingerprint, updated_at) VALUES (?, ?, ?, ?)",
+                (dossier_id, os.stat(filepath).st_mtime_ns, fingerprint, time.time()),
+            )
+            conn.commit()
+
+    def clear_dossier_done(self, dossier_id: str):
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            conn.execute("DELETE FROM dossiers WHERE dossier_id = ?", (dossier_id,))
+            conn.commit()
+
+    # --- Retry / Report ---
+    def failed_dossiers(self) -> set:
+        """有 FAILED 或中斷 (還停在 RUNNING) 單位的 Dossier"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return set()
+            rows = conn.execute(
+                "SELECT DISTINCT dossier_id FROM units WHERE state IN (?, ?)", (self.FAILED, self.RUNNING)
+            ).fetchall()
+        return {r[0] for r in rows}
+
+    def summary(self) -> dict:
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return {}
+            rows = conn.execute("SELECT state, COUNT(*) FROM units GROUP BY state").fetchall()
+        return {state: count for state, count in rows}
+
+    def print_failures(self, limit: int = 10):
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            rows = conn.execute(
+                "SELECT dossier_id, expert, mode, attempts, error FROM units WHERE state = ? ORDER BY updated_at DESC LIMIT ?",
+                (self.FAILED, limit),
+            ).fetchall()
+        for dossier_id, expert, mode, attempts, error in rows:
+            print(colored(f"   ✗ {dossier_id} {expert}/{mode} (attempts {attempts}): {(error or '')[:120]}", "red"))
@@ -1,15 +1,18 @@
 from duckduckgo_search import DDGS
-import time
+
+from src.tools.retry_policy import RetryPolicy, RETRY_BASE_DELAY, get_circuit_breaker, CircuitOpenError
 
 class SalaryTool:
     def __init__(self, max_retries=3, retry_delay=20):
         """
         初始化 SalaryTool
         max_retries: 最大重試次數（遇到速率限制時）
-        retry_delay: 重試前的等待時間（秒）
+        retry_delay: 重試退避的上限秒數（指數退避 + Jitter，有 retry hint 時照 hint）
         """
         self.max_retries = max_retries
         self.retry_delay = retry_delay
+        self.retry_policy = RetryPolicy(base_delay=min(RETRY_BASE_DELAY, retry_delay), max_delay=retry_delay)
+        self.breaker = get_circuit_breaker("duckduckgo")
     
     def check_salary(self, role: str, company: str, location: str) -> str:
         keywords = f'"{company}" "{role}" salary "{location}" site:levels.fyi OR site:glassdoor.com'
@@ -18,6 +21,7 @@ class SalaryTool:
         # 重試機制
         for attempt in range(self.max_retries):
             try:
+                self.breaker.before_call()
                 results = []
                 with DDGS() as ddgs:
                     # v4.1.1 的 text 方法參數比較少，把 backend 拿掉
@@ -35,27 +39,33 @@ class SalaryTool:
                         if len(results) >= 3:
                             break
 
+                self.breaker.record_success()
                 if not results:
                     return f"No direct salary data found for {role} at {company}."
                 
                 return "\n".join(results)
 
+            except CircuitOpenError as e:
+                print(f"🔴 {e}. Skipping salary search.")
+                return f"Salary search failed: {e}"
+
             except Exception as e:
                 error_str = str(e).lower()
                 # 檢查是否是速率限制錯誤
                 if "ratelimit" in error_str or "rate limit" in error_str:
+                    self.breaker.release()  # 被限速不代表服務掛了 (Breaker 狀態不動)
                     if attempt < self.max_retries - 1:
-                        # 還有重試機會，等待後重試
-                        wait_time = self.retry_delay * (attempt + 1)  # 遞增等待時間：5s, 10s, 15s...
-                        print(f"⚠️ Rate limit hit. Waiting {wait_time} seconds before retry ({attempt + 1}/{self.max_retries})...")
-                        time.sleep(wait_time)
+                        # 還有重試機會，退避後重試 (指數退避 + Jitter)
+                        print(f"⚠️ Rate limit hit. Backing off before retry ({attempt + 1}/{self.max_retries})...")
+                        self.retry_policy.sleep(attempt, e, label="duckduckgo")
                         continue
                     else:
                         # 最後一次嘗試也失敗了，放棄
                         print(f"❌ Rate limit error after {self.max_retries} attempts. Giving up.")
                         return f"Salary search failed: Rate limit exceeded after {self.max_retries} attempts. Please try again later."
                 else:
-                    # 其他類型的錯誤（非速率限制），不重試，直接返回
+                    # 其他類型的錯誤（非速率限制），不重試，直接返回；連續發生會讓 Breaker OPEN
+                    self.breaker.record_failure()
                     print(f"❌ Salary Tool Error: {e}")
                     return f"Salary search failed: {str(e)}"
         
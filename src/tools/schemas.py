@@ -1,6 +1,10 @@
 import enum
+import json
+import typing
+import hashlib
+import functools
 from typing import List, Optional
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, TypeAdapter
 
 # ==========================================
 # Common Enums
@@ -36,6 +40,15 @@ class SkillExtractionReport(BaseModel):
     """
     required_skills: List[SkillItem] = Field(description="List of extracted skills from JD")
 
+class PanelSkillItem(SkillItem):
+    expert: str = Field(description="Expert ID (E1~E8) of the panel member who extracted this skill.")
+
+class PanelSkillExtractionReport(BaseModel):
+    """
+    Phase 1 Panel Mode Output Root (一次呼叫、多位專家；依 expert 拆回各自的 SkillExtractionReport)
+    """
+    required_skills: List[PanelSkillItem] = Field(description="List of extracted skills, each tagged with its expert")
+
 
 # ==========================================
 # Phase 2: Gap Analysis (你的能力 vs JD)
@@ -81,4 +94,58 @@ class AdvisorReport(BaseModel):
     """
     Phase 3 Output Root
     """
-    strategic_advice: List[AdviceItem] = Field(description="List of strategic advice for resume tailoring")
\ No newline at end of file
+    strategic_advice: List[AdviceItem] = Field(description="List of strategic advice for resume tailoring")
+
+# ==========================================
+# Validation Cache (TypeAdapter + Schema Shape)
+# ==========================================
+# Gateway 每次呼叫都要驗證；Adapter 與 Schema 形狀只算一次就快取起來。
+
+REPORT_ROOT_KEYS = {
+    "required_skills": SkillExtractionReport,
+    "gap_analysis": GapAnalysisReport,
+    "strategic_advice": AdvisorReport,
+}
+
+
+@functools.lru_cache(maxsize=None)
+def get_type_adapter(schema) -> TypeAdapter:
+    """取得 (快取的) TypeAdapter；schema 可以是 BaseModel 或 List[Item] 之類的型別"""
+    return TypeAdapter(schema)
+
+
+# 三個 Report Root 在 import 時就先建好
+REPORT_ADAPTERS = {model: get_type_adapter(model) for model in REPORT_ROOT_KEYS.values()}
+
+
+@functools.lru_cache(maxsize=None)
+def schema_fingerprint(schema) -> str:
+    """Schema 結構的短指紋 (欄位 / 型別 / 描述改了就會變)，給 Cache Key 用"""
+    if is_pydantic_model(schema):
+        material = json.dumps(schema.model_json_schema(), sort_keys=True, ensure_ascii=False)
+    else:
+        material = getattr(schema, "__qualname__", repr(schema))
+    return hashlib.sha1(material.encode("utf-8")).hexdigest()[:12]
+
+
+def is_pydantic_model(schema) -> bool:
+    return isinstance(schema, type) and issubclass(schema, BaseModel)
+
+
+@functools.lru_cache(maxsize=None)
+def schema_shape(schema) -> tuple:
+    """
+    回傳 (shape, root_key, item_model)：
+    - ("ROOT", "required_skills", SkillItem)  : SkillExtractionReport 這類 List 包裝的 Report
+    - ("ITEM", None, SkillItem)               : 單一 item 的 Model (資料可能被包在 root key 裡)
+    - ("FUNC", None, None)                    : 一般驗證函式 (validate_council_skill ...)
+    """
+    if not is_pydantic_model(schema):
+        return ("FUNC", None, None)
+    for name, field in schema.model_fields.items():
+        if name not in REPORT_ROOT_KEYS:
+            continue
+        args = typing.get_args(field.annotation)
+        if args and is_pydantic_model(args[0]):
+            return ("ROOT", name, args[0])
+    return ("ITEM", None, schema)
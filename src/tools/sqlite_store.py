@@ -0,0 +1,169 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+from termcolor import colored
+
+
+class SQLiteLRUStore:
+    """
+    單檔 SQLite Key-Value Store (JSON value)，附 LRU 容量上限。
+    - 以 accessed_at 排序淘汰最久沒用的 entry
+    - max_entries / max_bytes 任一超標就淘汰
+    - ttl (秒)：超過 created_at + ttl 的 entry 視為不存在，淘汰時一併清掉
+    - Thread-safe (單一連線 + Lock)，連線在第一次使用時才建立
+    """
+
+    def __init__(self, db_path: str, table: str = "entries", max_entries: int = 20000, max_bytes: int = None, ttl: float = None):
+        self.db_path = db_path
+        self.table = table
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._conn = None
+        self._disabled = False
+        self._writes_since_evict = 0
+
+    def _connect(self):
+        if self._conn is not None or self._disabled:
+            return self._conn
+        try:
+            os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.db_path, check_same_thread=False, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                f"CREATE TABLE IF NOT EXISTS {self.table} ("
+                " key TEXT PRIMARY KEY,"
+                " value TEXT NOT NULL,"
+                " size INTEGER NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " accessed_at REAL NOT NULL)"
+            )
+            conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{self.table}_accessed ON {self.table}(accessed_at)")
+            conn.commit()
+            self._conn = conn
+        except Exception as e:
+            # Cache 掛掉不應該讓整個 Pipeline 掛掉，直接停用
+            print(colored(f"  ⚠️ Cache disabled ({self.db_path}): {e}", "yellow"))
+            self._disabled = True
+        return self._conn
+
+    def _expired(self, created_at: float, now: float) -> bool:
+        return bool(self.ttl) and created_at + self.ttl < now
+
+    def get_entry(self, key: str):
+        """回傳 (value, created_at)；不存在 / 過期 / 壞掉都回傳 None"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return None
+            row = conn.execute(f"SELECT value, created_at FROM {self.table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self._expired(row[1], now):
+                conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+                conn.commit()
+                return None
+            conn.execute(f"UPDATE {self.table} SET accessed_at = ? WHERE key = ?", (now, key))
+            conn.commit()
+        try:
+            return json.loads(row[0]), row[1]
+        except Exception:
+            return None  # 壞掉就當沒看到
+
+    def get(self, key: str):
+        entry = self.get_entry(key)
+        return entry[0] if entry is not None else None
+
+    def set(self, key: str, value, created_at: float = None):
+        self.set_many([(key, value)], created_at=created_at)
+
+    def set_many(self, items, created_at: float = None):
+        """一次寫入多筆 [(key, value), ...] 或 [(key, value, created_at), ...] (同一個 transaction)"""
+        now = time.time()
+        rows = []
+        for item in items:
+            key, value = item[0], item[1]
+            item_created = item[2] if len(item) > 2 else created_at
+            payload = json.dumps(value, ensure_ascii=False)
+            rows.append((key, payload, len(payload), now if item_created is None else item_created, now))
+        if not rows:
+            return
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            conn.executemany(
+                f"INSERT OR REPLACE INTO {self.table} (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                rows,
+            )
+            self._writes_since_evict += len(rows)
+            # 不需要每次寫入都掃一次總量
+            if self._writes_since_evict >= 20:
+                self._evict(conn)
+            conn.commit()
+
+    def delete(self, key: str):
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            conn.execute(f"DELETE FROM {self.table} WHERE key = ?", (key,))
+            conn.commit()
+
+    def _evict(self, conn):
+        self._writes_since_evict = 0
+        if self.ttl:
+            conn.execute(f"DELETE FROM {self.table} WHERE created_at < ?", (time.time() - self.ttl,))
+        count, total = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+        excess = max(0, count - self.max_entries) if self.max_entries else 0
+        if self.max_bytes and total > self.max_bytes:
+            # 依平均大小估算要砍多少筆才會回到上限以下
+            avg = max(1, total // max(count, 1))
+            excess = max(excess, (total - self.max_bytes) // avg + 1)
+        if excess > 0:
+            conn.execute(
+                f"DELETE FROM {self.table} WHERE key IN "
+                f"(SELECT key FROM {self.table} ORDER BY accessed_at ASC LIMIT ?)",
+                (int(excess),),
+            )
+
+    def evict(self):
+        """手動觸發容量檢查"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return
+            self._evict(conn)
+            conn.commit()
+
+    def stats(self) -> dict:
+        """目前的筆數與總大小 (bytes)"""
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return {"entries": 0, "bytes": 0}
+            count, total = conn.execute(f"SELECT COUNT(*), COALESCE(SUM(size), 0) FROM {self.table}").fetchone()
+        return {"entries": count, "bytes": total}
+
+    def items(self):
+        """所有未過期的 (key, value) (壞掉的略過)；給需要整批載入記憶體的 Index 用"""
+        now = time.time()
+        with self._lock:
+            conn = self._connect()
+            if conn is None:
+                return []
+            rows = conn.execute(f"SELECT key, value, created_at FROM {self.table}").fetchall()
+        out = []
+        for key, payload, created_at in rows:
+            if self._expired(created_at, now):
+                continue
+            try:
+                out.append((key, json.loads(payload)))
+            except Exception:
+                continue
+        return out
@@ -0,0 +1,211 @@
+import os
+import json
+import time
+from tqdm import tqdm
+from termcolor import colored
+
+from src.tools.schemas import get_type_adapter, schema_shape
+
+# ==============================================================================
+# Streaming Parser (Incremental @@@ Tags / JSON Array Items + Early Abort)
+# ==============================================================================
+# 搭配 generate_content(stream=True)：每收到一個 chunk 就 feed()，
+# - 每完成一個 @@@ 區塊 / 一個 JSON array item 就立刻驗證 (SkillItem, GapAnalysisItem...)
+# - 輸出明顯壞掉時丟出 StreamAbort，呼叫端停止讀取 (不再為垃圾 token 付費 / 等待)
+# 完整輸出的解析仍走 Gateway 原本的 parse_gemma_tags / json 分支，結果一致。
+
+STREAM_ABORT_PREFIX_CHARS = int(os.getenv("STREAM_ABORT_PREFIX_CHARS", "600"))   # 這麼多字還沒看到 @@@ 或 { [ → 放棄
+STREAM_MAX_BLOCK_CHARS = int(os.getenv("STREAM_MAX_BLOCK_CHARS", "6000"))        # 單一 @@@ 區塊 / JSON item 的上限
+STREAM_MAX_BAD_ITEMS = int(os.getenv("STREAM_MAX_BAD_ITEMS", "2"))               # 連續幾個 item 驗證失敗就放棄
+
+class StreamAbort(ValueError):
+    """串流途中判定輸出已經壞掉；raw_text 是截至目前收到的內容 (給 Repair Mode 用)"""
+
+    def __init__(self, reason: str, raw_text: str = ""):
+        super().__init__(f"Stream aborted: {reason}")
+        self.reason = reason
+        self.raw_text = raw_text
+
+
+def item_schema_for(schema):
+    """
+    從 Gateway 收到的 schema 推出「單一 item」的 Pydantic Model：
+    - SkillExtractionReport → SkillItem (取 List[...] 欄位的元素型別)
+    - SkillItem 本身 → SkillItem
+    - 驗證函式 / 其他 → None (串流時不做逐項驗證)
+    """
+    if not schema:
+        return None
+    return schema_shape(schema)[2]
+
+
+def chunk_text(chunk) -> str:
+    """genai 的最後一個 chunk 可能沒有 parts，.text 會丟錯"""
+    try:
+        return chunk.text or ""
+    except Exception:
+        return ""
+
+
+def close_stream(response, chunks=None):
+    """
+    提早中斷串流時呼叫：關掉我們正在讀的 iterator，並取消底層的 gRPC / HTTP 串流。
+    genai 的 response 本身沒有 close()；只停止讀取的話，伺服器仍會把整段輸出生完 (照樣計費)。
+    """
+    for target in (chunks, getattr(response, "_iterator", None), response):
+        if target is None:
+            continue
+        for method in ("cancel", "close"):
+            func = getattr(target, method, None)
+            if callable(func):
+                try:
+                    func()
+                except Exception:
+                    pass
+                break
+
+
+class _TagScanner:
+    """逐步切出完整的 @@@...@@@ 區塊 (與 re.findall(r'@@@(.*?)@@@') 相同的配對方式)"""
+
+    def __init__(self):
+        self.pos = 0
+
+    def scan(self, buffer: str):
+        blocks = []
+        while True:
+            start = buffer.find("@@@", self.pos)
+            if start == -1:
+                return blocks
+            end = buffer.find("@@@", start + 3)
+            if end == -1:
+                if len(buffer) - start > STREAM_MAX_BLOCK_CHARS:
+                    raise StreamAbort(f"@@@ block exceeded {STREAM_MAX_BLOCK_CHARS} chars without closing", buffer)
+                self.pos = start
+                return blocks
+            blocks.append(buffer[start:end + 3])
+            self.pos = end + 3
+
+
+class _JsonItemScanner:
+    """
+    追蹤括號深度 (忽略字串內容)，切出第一層 array 裡的每個 object：
+    [ {...}, {...} ] 或 {"required_skills": [ {...}, {...} ]}
+    """
+
+    def __init__(self):
+        self.pos = 0
+        self.stack = []
+        self.in_string = False
+        self.escape = False
+        self.item_start = None
+        self.item_depth = None
+
+    def scan(self, buffer: str):
+        items = []
+        for i in range(self.pos, len(buffer)):
+            ch = buffer[i]
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+                continue
+            if ch == '"':
+                if self.stack:
+                    self.in_string = True
+            elif ch in "{[":
+                if ch == "{" and self.item_start is None and self.stack and self.stack[-1] == "[" and len(self.stack) <= 2:
+                    self.item_start, self.item_depth = i, len(self.stack)
+                self.stack.append(ch)
+            elif ch in "}]":
+                if not self.stack or (ch == "}") != (self.stack[-1] == "{"):
+                    raise StreamAbort(f"Unbalanced JSON: unexpected '{ch}'", buffer[:i + 1])
+                self.stack.pop()
+                if ch == "}" and self.item_start is not None and len(self.stack) == self.item_depth:
+                    items.append(buffer[self.item_start:i + 1])
+                    self.item_start = None
+        self.pos = len(buffer)
+        if self.item_start is not None and len(buffer) - self.item_start > STREAM_MAX_BLOCK_CHARS:
+            raise StreamAbort(f"JSON item exceeded {STREAM_MAX_BLOCK_CHARS} chars without closing", buffer)
+        return items
+
+
+class StreamingParser:
+    """
+    用法：
+        parser = StreamingParser(item_schema_for(schema), on_item=callback)
+        for chunk in model.generate_content(..., stream=True):
+            parser.feed(chunk_text(chunk))      # 可能丟出 StreamAbort
+        raw_text = parser.text
+
+    on_item(item: dict, index: int) 在每個通過驗證的 item 到達時呼叫 (重試時可能再收到一次)。
+    """
+
+    def __init__(self, item_schema=None, on_item=None):
+        self.item_schema = item_schema
+        self.on_item = on_item
+        self.text = ""
+        self.items = []
+        self.protocol = None  # "TAG" | "JSON"
+        self.started = time.perf_counter()
+        self.first_item_latency = None
+        self._scanner = None
+        self._bad_streak = 0
+        self._seen = 0
+
+    def _detect_protocol(self):
+        if "@@@" in self.text:
+            self.protocol, self._scanner = "TAG", _TagScanner()
+        elif "{" in self.text or "[" in self.text:
+            self.protocol, self._scanner = "JSON", _JsonItemScanner()
+            self._scanner.pos = min(i for i in (self.text.find("{"), self.text.find("[")) if i != -1)
+        elif len(self.text.strip()) > STREAM_ABORT_PREFIX_CHARS:
+            raise StreamAbort(f"No @@@ block or JSON found in first {STREAM_ABORT_PREFIX_CHARS} chars", self.text)
+
+    def _parse_item(self, fragment: str):
+        if self.protocol == "TAG":
+            # 延遲 import，避免與 model_gateway 互相 import
+            from src.tools.model_gateway import parse_gemma_tags
+            parsed = parse_gemma_tags(fragment) or {}
+            values = next(iter(parsed.values()), [])
+            if not values:
+                raise ValueError("Tag block has no fields")
+            return values[0]
+        return json.loads(fragment)
+
+    def _accept(self, fragment: str):
+        index = self._seen
+        self._seen += 1
+        try:
+            item = self._parse_item(fragment)
+            if self.item_schema is not None:
+                get_type_adapter(self.item_schema).validate_python(item)
+        except Exception as e:
+            self._bad_streak += 1
+            if self._bad_streak >= STREAM_MAX_BAD_ITEMS:
+                raise StreamAbort(f"Item {index} failed: {e}", self.text)
+            return
+
+        self._bad_streak = 0
+        self.items.append(item)
+        if self.first_item_latency is None:
+            self.first_item_latency = time.perf_counter() - self.started
+        if self.on_item:
+            try:
+                self.on_item(item, len(self.items) - 1)
+            except Exception as e:
+                tqdm.write(colored(f"  ⚠️ on_item callback failed: {e}", "yellow"))
+
+    def feed(self, chunk: str):
+        if not chunk:
+            return
+        self.text += chunk
+        if self.protocol is None:
+            self._detect_protocol()
+            if self.protocol is None:
+                return
+        for fragment in self._scanner.scan(self.text):
+            self._accept(fragment)
@@ -0,0 +1,63 @@
+import heapq
+import itertools
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+# ==============================================================================
+# Priority Task Scheduler (Bounded Worker Pool)
+# ==============================================================================
+# 呼叫 run() 的執行緒是唯一的 Coordinator：
+# - 持有 Priority Queue (heapq，priority 越小越先跑，同 priority 依 submit 順序)
+# - 同時最多 max_workers 個任務在 Worker Pool 裡跑 (全域並行上限)
+# - 任務完成後在 Coordinator 執行緒呼叫 on_done()，可以在裡面 submit() 後續任務
+#   → 共享狀態 (Dossier 等) 只有 Coordinator 會寫，不需要額外加鎖
+# 真正打 API 的速度仍由 Gateway 的 Token Bucket / Model Pool 控制。
+
+
+class PriorityTaskScheduler:
+    def __init__(self, max_workers: int, name: str = "tasks"):
+        self.max_workers = max(1, int(max_workers))
+        self.name = name
+        self._heap = []
+        self._seq = itertools.count()
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0}
+
+    def submit(self, priority, func, *args, tag=None, **kwargs):
+        """
+        排入一個任務。priority 可以是數字或 tuple；tag 會原樣傳回 on_done。
+        submit 當下的 contextvars (metrics labels 等) 會帶進 Worker Thread。
+        """
+        entry = (contextvars.copy_context(), func, args, kwargs, tag)
+        heapq.heappush(self._heap, (priority, next(self._seq), entry))
+        self.stats["submitted"] += 1
+
+    @property
+    def pending(self) -> int:
+        return len(self._heap)
+
+    def run(self, on_done, refill=None):
+        """
+        執行到 Queue 清空且沒有任務在跑為止。
+        on_done(tag, result, error)：每個任務完成時呼叫 (error 為 None 表示成功)
+        refill()：Queue 快空時呼叫，讓呼叫端補新工作 (例如載入下一份 Dossier)
+        """
+        in_flight = {}
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=self.name) as pool:
+            while True:
+                if refill and len(self._heap) < self.max_workers:
+                    refill()
+                while self._heap and len(in_flight) < self.max_workers:
+                    _, _, (ctx, func, args, kwargs, tag) = heapq.heappop(self._heap)
+                    in_flight[pool.submit(ctx.run, func, *args, **kwargs)] = tag
+                if not in_flight:
+                    return self.stats
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    tag = in_flight.pop(future)
+                    try:
+                        result, error = future.result(), None
+                    except Exception as e:
+                        result, error = None, e
+                    self.stats["failed" if error else "completed"] += 1
+                    on_done(tag, result, error)
@@ -0,0 +1,119 @@
+import os
+import re
+from tqdm import tqdm
+from termcolor import colored
+
+from src.tools.token_estimator import token_estimator
+
+# ==============================================================================
+# Token Budget Planner
+# ==============================================================================
+# 取代 TPM 哨兵的「暫停 + 切 Flash」：在 render 前就把 context 縮到目標 Model 的預算內。
+# 縮減順序 (由便宜到昂貴)：
+#   1. 丟掉相關度最低的履歷版本 (resume_db_text 的 "=== RESUME VERSION" 區塊)
+#   2. JD 依 token 數截斷 (raw_jd_text)
+#   3. 剩下的 resume_db_text 依 token 數截斷
+
+PROMPT_OUTPUT_RESERVE = int(os.getenv("PROMPT_OUTPUT_RESERVE", "1000"))
+
+RESUME_SECTION_MARK = "=== RESUME VERSION:"
+TRUNCATION_NOTE = "\n...[TRUNCATED TO FIT TOKEN BUDGET]"
+
+_WORD_RE = re.compile(r"[a-z0-9+#.]+")
+
+
+def _terms(text: str) -> set:
+    return set(_WORD_RE.findall((text or "").lower()))
+
+
+class TokenBudgetPlanner:
+    def __init__(self, estimator=token_estimator):
+        self.estimator = estimator
+
+    def tokens(self, text: str) -> int:
+        return self.estimator.estimate(text)
+
+    def truncate_to_tokens(self, text: str, max_tokens: int) -> str:
+        """依 token 數 (而不是字元數) 截斷，盡量切在換行上"""
+        if not text or self.tokens(text) <= max_tokens:
+            return text
+        max_tokens -= self.tokens(TRUNCATION_NOTE)
+        if max_tokens <= 0:
+            return ""
+        # 先用比例估一個切點，再往回縮到預算內
+        cut = int(len(text) * max_tokens / max(self.tokens(text), 1))
+        while cut > 0 and self.tokens(text[:cut]) > max_tokens:
+            cut = int(cut * 0.9)
+        newline = text.rfind("\n", 0, cut)
+        if newline > cut * 0.8:
+            cut = newline
+        return text[:cut] + TRUNCATION_NOTE
+
+    @staticmethod
+    def split_resume_versions(resume_db_text: str) -> list:
+        if not resume_db_text or RESUME_SECTION_MARK not in resume_db_text:
+            return [resume_db_text] if resume_db_text else []
+        parts = resume_db_text.split(RESUME_SECTION_MARK)
+        head = [parts[0]] if parts[0].strip() else []
+        return head + [RESUME_SECTION_MARK + p for p in parts[1:]]
+
+    @staticmethod
+    def rank_sections(sections: list, relevance_terms) -> list:
+        """回傳依相關度由低到高排序的 index (相關度 = 與 relevance_terms 的字詞重疊數)"""
+        query = set()
+        for term in relevance_terms or []:
+            query |= _terms(term)
+        scores = [len(query & _terms(sec)) for sec in sections]
+        return sorted(range(len(sections)), key=lambda i: (scores[i], -i))
+
+    def fit(self, render, context: dict, budget: int, relevance_terms=None) -> str:
+        """
+        render(context) -> prompt。回傳落在 budget 以內 (盡力而為) 的 prompt。
+        context 不會被修改。
+        """
+        ctx = dict(context)
+        prompt = render(ctx)
+        over = self.tokens(prompt) - budget
+        if over <= 0:
+            return prompt
+
+        notes = []
+
+        # 1. 丟掉相關度最低的履歷版本 (至少保留一份)
+        resume = ctx.get("resume_db_text")
+        if isinstance(resume, str):
+            sections = self.split_resume_versions(resume)
+            kept = list(range(len(sections)))
+            for idx in self.rank_sections(sections, relevance_terms):
+                if over <= 0 or len(kept) <= 1:
+                    break
+                kept.remove(idx)
+                over -= self.tokens(sections[idx])
+            if len(kept) < len(sections):
+                ctx["resume_db_text"] = "".join(sections[i] for i in kept)
+                notes.append(f"dropped {len(sections) - len(kept)} resume versions")
+                prompt = render(ctx)
+                over = self.tokens(prompt) - budget
+
+        # 2. JD 依 token 截斷
+        jd = ctx.get("raw_jd_text")
+        if over > 0 and isinstance(jd, str) and jd:
+            ctx["raw_jd_text"] = self.truncate_to_tokens(jd, max(self.tokens(jd) - over, 0))
+            notes.append("truncated JD")
+            prompt = render(ctx)
+            over = self.tokens(prompt) - budget
+
+        # 3. 剩下的履歷依 token 截斷
+        resume = ctx.get("resume_db_text")
+        if over > 0 and isinstance(resume, str) and resume:
+            ctx["resume_db_text"] = self.truncate_to_tokens(resume, max(self.tokens(resume) - over, 0))
+            notes.append("truncated resume")
+            prompt = render(ctx)
+
+        if notes:
+            tqdm.write(colored(f"  ✂️ Token Budget ({budget}): {', '.join(notes)} → {self.tokens(prompt)} tokens", "yellow"))
+        return prompt
+
+
+# 全域共用實例
+token_budget_planner = TokenBudgetPlanner()
@@ -0,0 +1,109 @@
+import os
+import hashlib
+import threading
+import statistics
+from collections import OrderedDict, deque
+
+# ==============================================================================
+# Offline Token Estimator
+# ==============================================================================
+# 目的：拿掉每次 generate() 前的 count_tokens() 網路來回。
+# - 平常用本地估算 (字元數 / 校正後的 chars-per-token)
+# - 前幾次呼叫 & 估算值落在 TPM 門檻附近時，才退回 remote count_tokens()
+# - 真實數字 (remote 或 usage_metadata) 會拿來校正比例，並以 prompt hash 記住
+# - 比例取最近 N 個樣本的中位數，每個樣本先夾在合理範圍內 (一筆怪異的 usage_metadata 不會把估算帶飛)
+
+TOKEN_ESTIMATE_MARGIN = float(os.getenv("TOKEN_ESTIMATE_MARGIN", "0.15"))
+TOKEN_CALIBRATION_SAMPLES = int(os.getenv("TOKEN_CALIBRATION_SAMPLES", "5"))
+TOKEN_CALIBRATION_WINDOW = int(os.getenv("TOKEN_CALIBRATION_WINDOW", "50"))
+# 英文 (ASCII) 的 chars-per-token 合理範圍；超出的樣本先夾回範圍內
+TOKEN_RATIO_MIN = float(os.getenv("TOKEN_RATIO_MIN", "1.5"))
+TOKEN_RATIO_MAX = float(os.getenv("TOKEN_RATIO_MAX", "8.0"))
+
+
+def _split_chars(text: str):
+    """回傳 (ascii 字元數, 非 ascii 字元數)；中日文字元大約 1 字 1 token"""
+    non_ascii = sum(1 for ch in text if ord(ch) > 127)
+    return len(text) - non_ascii, non_ascii
+
+
+class TokenEstimator:
+    def __init__(self, chars_per_token: float = 4.0, margin: float = TOKEN_ESTIMATE_MARGIN,
+                 calibration_samples: int = TOKEN_CALIBRATION_SAMPLES, cache_size: int = 4096,
+                 window: int = TOKEN_CALIBRATION_WINDOW, ratio_bounds: tuple = (TOKEN_RATIO_MIN, TOKEN_RATIO_MAX)):
+        self.default_ratio = chars_per_token
+        self.margin = margin
+        self.calibration_samples = calibration_samples
+        self.cache_size = cache_size
+        self.ratio_min, self.ratio_max = ratio_bounds
+
+        self._lock = threading.Lock()
+        self._exact = OrderedDict()             # prompt hash -> 真實 token 數
+        self._ratios = deque(maxlen=max(1, window))  # 最近的 chars-per-token 樣本 (已夾在範圍內)
+        self._ratio = chars_per_token
+        self.samples = 0
+
+    @staticmethod
+    def _hash(text: str) -> str:
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    @property
+    def chars_per_token(self) -> float:
+        return self._ratio
+
+    def estimate(self, text: str) -> int:
+        """本地估算 (若這個 prompt 以前量過，直接回傳真實值)"""
+        if not text:
+            return 0
+        with self._lock:
+            exact = self._exact.get(self._hash(text))
+            if exact is not None:
+                return exact
+        ascii_chars, non_ascii = _split_chars(text)
+        return int(ascii_chars / self.chars_per_token + non_ascii) + 1
+
+    def calibrate(self, text: str, actual_tokens: int):
+        """用真實的 token 數校正比例，並記住這個 prompt 的結果"""
+        if not text or not actual_tokens:
+            return
+        ascii_chars, non_ascii = _split_chars(text)
+        with self._lock:
+            self._exact[self._hash(text)] = int(actual_tokens)
+            if len(self._exact) > self.cache_size:
+                self._exact.popitem(last=False)
+
+            ascii_tokens = int(actual_tokens) - non_ascii
+            if ascii_chars > 0 and ascii_tokens > 0:
+                ratio = min(self.ratio_max, max(self.ratio_min, ascii_chars / ascii_tokens))
+                self._ratios.append(ratio)
+                self._ratio = statistics.median(self._ratios)
+                self.samples += 1
+
+    def count(self, text: str, limit: int = None, remote_counter=None) -> int:
+        """
+        給 TPM 哨兵用的 token 數：
+        - 校正樣本不足，或估算值落在 limit ± margin 之內 → 呼叫 remote_counter 拿精確值
+        - 其他情況直接回傳本地估算
+        """
+        estimate = self.estimate(text)
+        if remote_counter is None:
+            return estimate
+
+        with self._lock:
+            known = self._hash(text) in self._exact
+        if known:
+            return estimate
+
+        near_limit = limit is not None and abs(estimate - limit) <= self.margin * limit
+        if self.samples < self.calibration_samples or near_limit:
+            try:
+                actual = int(remote_counter(text))
+                self.calibrate(text, actual)
+                return actual
+            except Exception:
+                return estimate
+        return estimate
+
+
+# 全域共用實例 (校正結果跨 Gateway 共用)
+token_estimator = TokenEstimator()
@@ -1,5 +1,6 @@
 # src/utils.py
 import os
+import sys
 import glob
 import re
 import time
@@ -12,6 +13,13 @@ from pypdf import PdfReader
 import chromadb
 from termcolor import cprint
 
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '../')))
+from src.tools.response_cache import response_cache
+from src.tools.llm_backend import wrap_model
+from src.tools.metrics import gateway_metrics
+from src.tools.retry_policy import RetryPolicy, RETRY_BASE_DELAY, get_circuit_breaker, CircuitOpenError
+from src.tools.rate_limiter import is_quota_error
+
 CHROMA_PATH = os.getenv("CHROMA_DB_PATH", "/app/data/chroma_db")
 
 
@@ -143,7 +151,7 @@ def clean_json_text(text):
 
 # === src/utils.py ===
 
-def safe_generate_json(model, prompt, retries=3, delay=20, default_output=None, gateway=None):
+def safe_generate_json(model, prompt, retries=3, delay=20, default_output=None, gateway=None, use_cache=True):
     """
     [IMPROVED] 防呆 JSON 生成器 + 智慧模型選擇
     
@@ -151,14 +159,41 @@ def safe_generate_json(model, prompt, retries=3, delay=20, default_output=None,
         model: (已廢棄，保留向下兼容) Gemini model 物件
         prompt: 提示詞
         retries: 重試次數 (預設 3 次)
-        delay: 每次重試中間休息幾秒 (預設 20 秒)
+        delay: 重試退避的上限秒數 (預設 20 秒；實際等待 = 指數退避 + Full Jitter，有 retry hint 時照 hint)
         default_output: 如果全失敗，要回傳什麼預設值
         gateway: [NEW] SmartModelGateway 實例（如果提供，會自動選模型）
+        use_cache: 是否使用 Response Cache (同樣的 model + prompt 直接回傳上次結果)
     
     Returns:
         dict: 解析好的 JSON 資料
     """
     
+    # LLM_BACKEND=record/replay 時包一層 Cassette
+    model = wrap_model(model)
+    policy = RetryPolicy(base_delay=min(RETRY_BASE_DELAY, delay), max_delay=delay)
+
+    # === Response Cache ===
+    # Key = 實際的 Model 名稱 + GenerationConfig (Gateway 模式用 Gateway 的 Model 指紋)；認不出 Model 就不用 Cache
+    model_name = getattr(model, "model_name", None) or "gateway"  # Metrics / Circuit Breaker 的 label
+    if gateway is not None:
+        fingerprint = getattr(gateway, "model_fingerprint", None)
+        cache_model, cache_config = (f"gateway:{fingerprint()}", None) if callable(fingerprint) else (None, None)
+    else:
+        cache_model, cache_config = response_cache.model_identity(model)
+    use_cache = use_cache and cache_model is not None
+    cache_key = response_cache.make_key(cache_model, prompt, "safe_generate_json", cache_config)
+    if use_cache:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            gateway_metrics.inc("gateway_cache_hits_total", model=model_name)
+            return cached
+        gateway_metrics.inc("gateway_cache_misses_total", model=model_name)
+
+    def _remember(data):
+        if use_cache:
+            response_cache.save(cache_key, data)
+        return data
+
     # === [NEW] 智慧模型選擇 ===
     if gateway is not None:
         # 使用 gateway 自動選模型（會根據 prompt 長度選 Gemma 或 Flash）
@@ -170,16 +205,16 @@ def safe_generate_json(model, prompt, retries=3, delay=20, default_output=None,
                 # 清洗 & 解析
                 cleaned_text = clean_json_text(response_text)
                 data = json.loads(cleaned_text)
-                return data
+                return _remember(data)
                 
             except json.JSONDecodeError as e:
                 cprint(f"⚠️ [Attempt {attempt+1}/{retries}] JSON 解析失敗: {e}", "yellow")
-                time.sleep(delay*(attempt+1))
-                continue
+                continue  # Model 有回應，只是格式壞掉 → 直接重試
             
             except Exception as e:
                 cprint(f"⚠️ [Attempt {attempt+1}/{retries}] Gateway Error: {e}", "yellow")
-                time.sleep(delay*(attempt+1))
+                if attempt < retries - 1:
+                    policy.sleep(attempt, e)
                 continue
         
         # Gateway 模式失敗後 fallback
@@ -187,26 +222,50 @@ def safe_generate_json(model, prompt, retries=3, delay=20, default_output=None,
         return default_output if default_output is not None else {}
     
     # === [LEGACY] 傳統模式（向下兼容，如果沒提供 gateway）===
+    breaker = get_circuit_breaker(model_name)
     for attempt in range(retries):
+        error = None
         try:
-            # 1. 發送請求（使用傳入的 model）
+            # 1. 發送請求（使用傳入的 model）；Circuit OPEN 時直接 fail fast
+            breaker.before_call()
+            started = time.perf_counter()
             response = model.generate_content(prompt)
+            breaker.record_success()
+            gateway_metrics.observe("gateway_latency_seconds", time.perf_counter() - started, model=model_name)
+            if attempt > 0:
+                gateway_metrics.inc("gateway_retries_total", model=model_name, retry_mode="FULL")
             
             # 2. 清洗文字
             cleaned_text = clean_json_text(response.text)
             
             # 3. 嘗試解析 JSON
             data = json.loads(cleaned_text)
-            return data
+            gateway_metrics.inc("gateway_requests_total", model=model_name, status="ok")
+            return _remember(data)
             
         except json.JSONDecodeError as e:
+            gateway_metrics.inc("gateway_requests_total", model=model_name, status="invalid")
+            gateway_metrics.inc("gateway_validation_failures_total", model=model_name)
             cprint(f"⚠️ [Attempt {attempt+1}/{retries}] JSON 解析失敗: {e}", "yellow")
+            continue  # Model 有回應，只是格式壞掉 → 直接重試
+
+        except CircuitOpenError as e:
+            gateway_metrics.inc("gateway_circuit_open_total", model=model_name)
+            cprint(f"🔴 {e}. Failing fast.", "red")
+            break
         
         except Exception as e:
+            gateway_metrics.inc("gateway_requests_total", model=model_name, status="error")
             cprint(f"⚠️ [Attempt {attempt+1}/{retries}] API Error: {e}", "yellow")
+            if is_quota_error(e):
+                breaker.release()  # 429 只是額度用完，Model 沒掛 (Breaker 狀態不動)
+            else:
+                breaker.record_failure()
+            error = e
         
-        # 失敗後休息一下再試
-        time.sleep(delay*(attempt+1))
+        # 失敗後退避再試 (指數退避 + Jitter，有 retry hint 就照 hint)
+        if attempt < retries - 1:
+            policy.sleep(attempt, error)
     
     # 如果重試次數用完還是失敗
     cprint(f"❌ API Call Failed after {retries} attempts.", "red")